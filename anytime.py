@@ -0,0 +1,83 @@
+import math
+import time
+
+# 時刻を確認する間隔(check()の呼び出し回数)
+CHECK_INTERVAL = 256
+
+
+class Budget:
+    """
+    探索に使える時間と反復回数の上限
+
+    探索の内側のループで毎回check()を呼び、Falseが返ったら打ち切って
+    それまでに見つかった最も良い経路を返す. 時刻はcheck_interval回に1回だけ確認するので、
+    check()のコストは反復回数を数えるだけになる.
+    """
+
+    def __init__(
+        self,
+        time_limit: float = None,
+        max_iterations: int = None,
+        callback=None,
+        check_interval: int = CHECK_INTERVAL,
+    ):
+        """
+        Args:
+            time_limit (float): 秒数. Noneなら時間で打ち切らない
+            max_iterations (int): 反復回数. Noneなら回数で打ち切らない
+            callback (Callable): 最も短い長さが更新された時に
+                callback(長さ, 反復回数, 経過秒数)として呼ぶ関数
+            check_interval (int): 時刻を確認する間隔
+        """
+        self.start_time = time.perf_counter()
+        self.time_limit = time_limit
+        self.deadline = None if time_limit is None else self.start_time + time_limit
+        self.max_iterations = max_iterations
+        self.callback = callback
+        self.check_interval = check_interval
+        self.iterations = 0
+        self.best_length = math.inf
+        self.is_exhausted = False
+
+    def is_bounded(self) -> bool:
+        return self.deadline is not None or self.max_iterations is not None
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start_time
+
+    def remaining(self) -> float:
+        """残りの秒数. 時間の上限がなければNone"""
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.perf_counter(), 0.0)
+
+    def check(self) -> bool:
+        """反復を1回数え、予算が残っていればTrueを返す"""
+        self.iterations += 1
+        if self.is_exhausted:
+            return False
+        if self.max_iterations is not None and self.iterations > self.max_iterations:
+            self.is_exhausted = True
+        elif (
+            self.deadline is not None
+            and self.iterations % self.check_interval == 0
+            and time.perf_counter() >= self.deadline
+        ):
+            self.is_exhausted = True
+        return not self.is_exhausted
+
+    def progress(self) -> float:
+        """時間と反復回数のうち、使った割合が大きい方(0~1)"""
+        progress = 0.0
+        if self.deadline is not None:
+            progress = self.elapsed() / max(self.time_limit, 1e-9)
+        if self.max_iterations is not None:
+            progress = max(progress, self.iterations / max(self.max_iterations, 1))
+        return min(progress, 1.0)
+
+    def report(self, length: float) -> None:
+        """見つかった経路の長さを知らせる. 最も短い長さが更新されたらcallbackを呼ぶ"""
+        if length < self.best_length:
+            self.best_length = length
+            if self.callback is not None:
+                self.callback(length, self.iterations, self.elapsed())
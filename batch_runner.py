@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import glob
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import instrumentation
+from common import write_tour
+from distance_oracle import tour_length
+from instance_cache import load_coords, load_neighbors
+from local_search import NUM_OF_NEIGHBORS
+from solver_anytime import DEFAULT_SOLVER, NEIGHBOR_SOLVERS, SOLVERS, solve
+
+# 出力ファイル名の形式. {index}は入力ファイル名のinput_の後ろ、{name}は拡張子を除いた入力ファイル名
+OUTPUT_PATTERN = "output_{index}.csv"
+# --profileを指定した場合に、出力ファイル名の後ろに付けて段階ごとの時間などを書くファイル名
+PROFILE_SUFFIX = ".profile.json"
+# 出力ファイル名の後ろに付けて、出力を作った解法とその引数を書くファイル名
+STAMP_SUFFIX = ".stamp.json"
+
+
+def output_path(input_file: str, solver: str, pattern: str = OUTPUT_PATTERN) -> str:
+    """入力ファイルに対応する出力ファイルのパス(入力ファイルと同じディレクトリに置く)"""
+    name = os.path.splitext(os.path.basename(input_file))[0]
+    index = name[len("input_") :] if name.startswith("input_") else name
+    return os.path.join(
+        os.path.dirname(input_file),
+        pattern.format(index=index, name=name, solver=solver),
+    )
+
+
+def make_stamp(output_file: str, solver: str, time_limit=None) -> dict:
+    """出力ファイルを作った解法と引数、書いた時の出力ファイルの更新時刻と大きさ"""
+    stat = os.stat(output_file)
+    return {
+        "solver": solver,
+        "time_limit": time_limit,
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+    }
+
+
+def is_up_to_date(
+    input_file: str, output_file: str, solver: str, time_limit=None
+) -> bool:
+    """
+    出力ファイルが入力ファイルより新しく、同じ解法と引数でrun_batchが書いたものならTrue
+
+    他の解法や他のスクリプト(my_output_generator.pyなど)が同じ出力ファイルに書いた場合は、
+    スタンプの解法と引数か、記録した出力ファイルの更新時刻と大きさが合わないので古いとみなす.
+    """
+    stamp_file = output_file + STAMP_SUFFIX
+    if not (os.path.exists(output_file) and os.path.exists(stamp_file)):
+        return False
+    if os.path.getmtime(output_file) < os.path.getmtime(input_file):
+        return False
+    try:
+        with open(stamp_file) as f:
+            stamp = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return stamp == make_stamp(output_file, solver, time_limit)
+
+
+def replace_file(filename: str, write) -> None:
+    """
+    一時ファイルにwrite(f)で書いてから置き換えるので、書いている途中のファイルは残らない
+    """
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    tmp_file = f"{filename}.{os.getpid()}.tmp"
+    with open(tmp_file, "w") as f:
+        write(f)
+    os.replace(tmp_file, filename)
+
+
+def write_output(output_file: str, tour, solver: str, time_limit=None) -> None:
+    """出力ファイルを書き、解法と引数をスタンプ(出力ファイル名 + STAMP_SUFFIX)に残す"""
+    replace_file(output_file, lambda f: write_tour(tour, f))
+    stamp = make_stamp(output_file, solver, time_limit)
+    replace_file(output_file + STAMP_SUFFIX, lambda f: json.dump(stamp, f))
+
+
+def run_instance(
+    input_file: str,
+    output_file: str,
+    solver: str,
+    time_limit=None,
+    profile=False,
+    num_of_workers=None,
+):
+    """
+    1つの入力を解いて出力ファイルに書く. ワーカープロセスで実行する
+
+    num_of_workersは、プロセスプールを使う解法(segmented, multi_start, ga)のワーカーの数.
+    座標はメモリマップした配列のまま解法に渡す. 近傍リストを使う解法には、
+    instance_cache.load_neighborsでキャッシュした近傍リストも渡すので、同じ入力を
+    解き直す時は近傍リストを作り直さない.
+
+    profileがTrueなら、段階ごとの時間、移動の回数、長さの推移を
+    出力ファイル名 + PROFILE_SUFFIXにJSONで書く.
+    """
+    coords = load_coords(input_file)
+    neighbors = None
+    if solver in NEIGHBOR_SOLVERS:
+        neighbors = load_neighbors(input_file, NUM_OF_NEIGHBORS)
+    with contextlib.ExitStack() as stack:
+        recorder = stack.enter_context(instrumentation.recording()) if profile else None
+        start_time = time.perf_counter()
+        tour = solve(
+            coords,
+            solver,
+            time_limit,
+            num_of_workers=num_of_workers,
+            neighbors=neighbors,
+        )
+        seconds = time.perf_counter() - start_time
+    write_output(output_file, tour, solver, time_limit)
+    result = {
+        "input": input_file,
+        "output": output_file,
+        "cities": len(coords),
+        "seconds": seconds,
+        "length": tour_length(coords, tour),
+        "status": "done",
+    }
+    if recorder is not None:
+        result["profile"] = output_file + PROFILE_SUFFIX
+        recorder.write(result["profile"])
+    return result
+
+
+def print_result(result: dict) -> None:
+    if result["status"] == "done":
+        print(
+            f"{result['input']:>20} {result['cities']:>9} "
+            f"{result['seconds']:>9.2f}s {result['length']:>15.2f}  "
+            f"-> {result['output']}",
+            flush=True,
+        )
+    else:
+        print(f"{result['input']:>20} {result['status']}", flush=True)
+
+
+def run_batch(
+    input_files,
+    solver=DEFAULT_SOLVER,
+    output_pattern=OUTPUT_PATTERN,
+    time_limit=None,
+    num_of_workers=None,
+    force=False,
+    profile=False,
+) -> list[dict]:
+    """
+    複数の入力をプロセスプールで並列に解き、終わったものから出力ファイルに書く
+
+    大きい入力ほど時間がかかるので、ファイルの大きい順に始める.
+    出力ファイルが入力ファイルより新しく、同じ解法と引数で書いたもの(is_up_to_dateを参照)は、
+    forceがFalseなら解き直さない.
+    入力ごとの解法もプロセスプールを使うので、コアをワーカーの数で分けて解法に渡す.
+    1つの入力で例外が起きても、他の入力はそのまま続ける.
+
+    Args:
+        input_files (list[str]): 入力ファイル
+        solver (str): solver_anytime.SOLVERSに登録した解法の名前
+        output_pattern (str): 出力ファイル名の形式(OUTPUT_PATTERNを参照)
+        time_limit (float): 1つの入力に使う秒数. Noneなら打ち切らない
+        num_of_workers (int): ワーカーの数. Noneならコア数
+        force (bool): Trueなら出力ファイルが新しくても解き直す
+        profile (bool): Trueなら入力ごとに段階ごとの時間などを記録する(run_instanceを参照)
+
+    Returns:
+        list[dict]: 入力ごとの結果(入力ファイル名の順)
+    """
+    if solver not in SOLVERS:
+        raise ValueError(f"unknown solver: {solver} (choose from {list(SOLVERS)})")
+    results = []
+    tasks = []
+    for input_file in sorted(set(input_files), key=os.path.getsize, reverse=True):
+        output_file = output_path(input_file, solver, output_pattern)
+        if not force and is_up_to_date(input_file, output_file, solver, time_limit):
+            results.append(
+                {"input": input_file, "output": output_file, "status": "up to date"}
+            )
+            print_result(results[-1])
+        else:
+            tasks.append((input_file, output_file))
+
+    if tasks:
+        num_of_cores = os.cpu_count() or 1
+        if num_of_workers is None:
+            num_of_workers = num_of_cores
+        num_of_workers = min(num_of_workers, len(tasks))
+        # 各ワーカーの解法がさらにコア数のプロセスを作らないように、コアを分ける
+        num_of_solver_workers = max(num_of_cores // num_of_workers, 1)
+        with ProcessPoolExecutor(num_of_workers) as executor:
+            futures = {
+                executor.submit(
+                    run_instance,
+                    input_file,
+                    output_file,
+                    solver,
+                    time_limit,
+                    profile,
+                    num_of_solver_workers,
+                ): (input_file, output_file)
+                for input_file, output_file in tasks
+            }
+            for future in as_completed(futures):
+                input_file, output_file = futures[future]
+                try:
+                    result = future.result()
+                except Exception:
+                    traceback.print_exc()
+                    result = {
+                        "input": input_file,
+                        "output": output_file,
+                        "status": "failed",
+                    }
+                results.append(result)
+                print_result(result)
+
+    results.sort(key=lambda result: result["input"])
+    done = [result for result in results if result["status"] == "done"]
+    print(
+        f"{len(done)} solved, "
+        f"{sum(result['status'] == 'up to date' for result in results)} up to date, "
+        f"{sum(result['status'] == 'failed' for result in results)} failed, "
+        f"{sum(result['seconds'] for result in done):.2f}s in total"
+    )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="入力ファイルをまとめて解く")
+    parser.add_argument(
+        "inputs", nargs="*", help="入力ファイル(省略するとinput_*.csvの全て)"
+    )
+    parser.add_argument("--solver", default=DEFAULT_SOLVER, choices=list(SOLVERS))
+    parser.add_argument("--output-pattern", default=OUTPUT_PATTERN)
+    parser.add_argument("--time-limit", type=float, default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--force", action="store_true", help="新しい出力も解き直す")
+    parser.add_argument(
+        "--profile", action="store_true", help="入力ごとに段階ごとの時間などを記録する"
+    )
+    args = parser.parse_args()
+    run_batch(
+        args.inputs or glob.glob("input_*.csv"),
+        args.solver,
+        args.output_pattern,
+        args.time_limit,
+        args.workers,
+        args.force,
+        args.profile,
+    )
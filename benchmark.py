@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from distance_oracle import tour_length
+from input_generator import DISTRIBUTIONS, generate_chunks, generate_cities
+
+# 既定で計測する都市数
+SIZES = (5, 8, 16, 64, 128, 512, 2048, 8192, 32768, 131072)
+# 既定の乱数のシード
+SEEDS = (1,)
+# 既定の都市の分布(input_generator.DISTRIBUTIONSの名前)
+DISTRIBUTIONS_TO_RUN = ("uniform",)
+# 1つの計測にかける最大の秒数. これを超えたら打ち切ってtimeoutとして記録する
+TIMEOUT = 600.0
+# update_solver_greedy_with_2optで試す始点の数(全ての都市を試すと計測が終わらないため)
+MULTI_START_STARTS = 8
+
+
+def run_greedy(cities):
+    import solver_greedy
+
+    return solver_greedy.solve(cities)
+
+
+def run_greedy_with_2opt(cities):
+    import solver_greedy_with_2opt
+
+    return solver_greedy_with_2opt.solve(cities)
+
+
+def run_update_greedy_with_2opt(cities):
+    import update_solver_greedy_with_2opt
+
+    tour, _ = update_solver_greedy_with_2opt.multi_start(
+        cities, max_starts=MULTI_START_STARTS
+    )
+    return tour
+
+
+def run_ga(cities):
+    import solver_ga
+
+    return solver_ga.solve(cities)
+
+
+def run_segmented_area(cities):
+    import solver_segmented_area
+
+    return solver_segmented_area.solve(cities)
+
+
+# 解法の名前から、(解く関数, 計測する最大の都市数)を引く
+# 計算量がO(N^2)以上の解法は大きい入力を計測しない
+BENCHMARKS = {
+    "greedy": (run_greedy, None),
+    "greedy_with_2opt": (run_greedy_with_2opt, None),
+    "update_greedy_with_2opt": (run_update_greedy_with_2opt, 8192),
+    "segmented_area": (run_segmented_area, None),
+    "ga": (run_ga, 8192),
+}
+
+
+def peak_rss_mb() -> float:
+    """このプロセスと、終了した子プロセスの最大の常駐メモリ(MB)"""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # LinuxではKB単位, macOSではバイト単位
+    scale = 1 << 20 if sys.platform == "darwin" else 1 << 10
+    return max(own, children) / scale
+
+
+def make_instance(size: int, seed: int, distribution: str = "uniform"):
+    """計測に使う入力を作る. 一様分布はinput_*.csvと同じgenerate_citiesで作る"""
+    if distribution == "uniform":
+        return list(generate_cities(size, seed=seed))
+    chunks = list(generate_chunks(size, distribution, seed=seed))
+    return np.concatenate(chunks).tolist() if chunks else []
+
+
+def measure(name: str, size: int, seed: int, distribution: str, queue) -> None:
+    """1つの解法で1つの入力を解き、結果をqueueに入れる. 計測ごとに新しいプロセスで実行する"""
+    cities = make_instance(size, seed, distribution)
+    run, _ = BENCHMARKS[name]
+    rss_before = peak_rss_mb()
+    start_time = time.perf_counter()
+    # 解法が標準出力に書くものが結果のJSONに混ざらないようにする
+    with contextlib.redirect_stdout(sys.stderr):
+        tour = run(cities)
+    seconds = time.perf_counter() - start_time
+    assert sorted(tour) == list(range(size)), "invalid tour"
+    queue.put(
+        {
+            "seconds": seconds,
+            "peak_rss_mb": peak_rss_mb(),
+            "rss_before_mb": rss_before,
+            "length": tour_length(cities, tour),
+        }
+    )
+
+
+def run_case(
+    name: str, size: int, seed: int, timeout: float, distribution: str = "uniform"
+) -> dict:
+    """計測を新しいプロセスで実行する. 前の計測のメモリの使用量が混ざらないようにするため"""
+    result = {
+        "solver": name,
+        "size": size,
+        "seed": seed,
+        "distribution": distribution,
+    }
+    _, max_size = BENCHMARKS[name]
+    if max_size is not None and size > max_size:
+        return {**result, "status": "skipped"}
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(
+        target=measure, args=(name, size, seed, distribution, queue)
+    )
+    process.start()
+    process.join(timeout)
+    if process.is_alive():
+        process.terminate()
+        process.join()
+        return {**result, "status": "timeout"}
+    if process.exitcode != 0 or queue.empty():
+        return {**result, "status": "failed"}
+    return {**result, **queue.get(), "status": "done"}
+
+
+def instance_key(result: dict) -> tuple:
+    # distributionがない古い結果は一様分布とみなす
+    return (
+        result["size"],
+        result["seed"],
+        result.get("distribution", "uniform"),
+    )
+
+
+def add_gaps(results: list[dict], baseline: list[dict] = ()) -> None:
+    """
+    各入力で最も短い長さ(今回の結果とbaselineの中で)に対する比をgapとして加える
+
+    gap = 長さ / 最も短い長さ - 1
+    """
+    best = {}
+    for result in list(results) + list(baseline):
+        if result.get("status") == "done":
+            best[instance_key(result)] = min(
+                best.get(instance_key(result), float("inf")), result["length"]
+            )
+    for result in results:
+        if result.get("status") == "done":
+            result["best_known"] = best[instance_key(result)]
+            result["gap"] = result["length"] / result["best_known"] - 1
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(
+    solvers=tuple(BENCHMARKS),
+    sizes=SIZES,
+    seeds=SEEDS,
+    timeout=TIMEOUT,
+    baseline: list[dict] = (),
+    distributions=DISTRIBUTIONS_TO_RUN,
+) -> dict:
+    """
+    解法ごとに、生成した入力で時間、最大メモリ、長さ、最も短い長さとの差を計測する
+
+    Args:
+        solvers (list[str]): BENCHMARKSに登録した解法の名前
+        sizes (list[int]): 都市数
+        seeds (list[int]): 入力を作る乱数のシード
+        timeout (float): 1つの計測にかける最大の秒数
+        baseline (list[dict]): 以前の計測結果. gapの基準となる最も短い長さに含める
+        distributions (list[str]): 都市の分布(input_generator.DISTRIBUTIONSの名前)
+
+    Returns:
+        dict: JSONとして保存できる計測結果
+    """
+    results = []
+    cases = [
+        (name, size, seed, distribution)
+        for name in solvers
+        for distribution in distributions
+        for size in sizes
+        for seed in seeds
+    ]
+    for name, size, seed, distribution in cases:
+        result = run_case(name, size, seed, timeout, distribution)
+        results.append(result)
+        label = f"{name:>24} {distribution:>10} {size:>8}"
+        if result["status"] == "done":
+            print(
+                f"{label} {result['seconds']:>9.2f}s "
+                f"{result['peak_rss_mb']:>8.1f}MB {result['length']:>14.2f}",
+                file=sys.stderr,
+            )
+        else:
+            print(f"{label} {result['status']}", file=sys.stderr)
+    add_gaps(results, baseline)
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="解法ごとの計算時間とメモリを計測する")
+    parser.add_argument(
+        "--solvers", nargs="+", default=list(BENCHMARKS), choices=list(BENCHMARKS)
+    )
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(SIZES))
+    parser.add_argument("--seeds", nargs="+", type=int, default=list(SEEDS))
+    parser.add_argument("--timeout", type=float, default=TIMEOUT)
+    parser.add_argument(
+        "--distributions",
+        nargs="+",
+        default=list(DISTRIBUTIONS_TO_RUN),
+        choices=list(DISTRIBUTIONS),
+    )
+    parser.add_argument(
+        "--baseline", help="以前の計測結果のJSON. gapの基準に最も短い長さを使う"
+    )
+    parser.add_argument(
+        "--output", default="-", help="結果を書くファイル(-なら標準出力)"
+    )
+    args = parser.parse_args()
+
+    baseline = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    report = run_benchmark(
+        args.solvers,
+        args.sizes,
+        args.seeds,
+        args.timeout,
+        baseline,
+        args.distributions,
+    )
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
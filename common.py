@@ -1,15 +1,75 @@
+import io
+import sys
+import warnings
+
+import numpy as np
+
+# Number of tour entries formatted and written at a time by write_tour().
+WRITE_CHUNK_SIZE = 1 << 16
+# Number of bytes parsed at a time by read_tour_chunks().
+READ_BLOCK_SIZE = 1 << 22
+
+
+def read_coords(filename):
+    # Parse the whole file in one pass with NumPy's C parser and return the
+    # cities as a contiguous N x 2 float64 array.
+    with warnings.catch_warnings():
+        # An input with no cities is not an error.
+        warnings.simplefilter('ignore', UserWarning)
+        coords = np.loadtxt(filename, delimiter=',', skiprows=1, ndmin=2)
+    return coords.reshape(-1, 2)
+
+
 def read_input(filename):
-    with open(filename) as f:
-        cities = []
-        for line in f.readlines()[1:]:  # Ignore the first line.
-            xy = line.split(',')
-            cities.append((float(xy[0]), float(xy[1])))
-        return cities
+    # Compatibility wrapper: a list of (x, y) tuples, as before.
+    return list(map(tuple, read_coords(filename).tolist()))
+
+
+def _parse_indices(block):
+    return np.loadtxt(io.StringIO(block.decode()), dtype=np.int64, ndmin=1)
+
+
+def read_tour_chunks(filename, block_size=READ_BLOCK_SIZE):
+    # Yield the tour in an output file as int64 arrays, block_size bytes at a
+    # time, so that a large output never has to be held in memory at once.
+    # Raises ValueError if the header or an index is malformed.
+    with open(filename, 'rb') as f:
+        if f.readline().strip() != b'index':
+            raise ValueError(f'{filename}: the first line must be "index"')
+        rest = b''
+        while block := f.read(block_size):
+            block = rest + block
+            cut = block.rfind(b'\n') + 1
+            block, rest = block[:cut], block[cut:]
+            if block.strip():
+                yield _parse_indices(block)
+        if rest.strip():
+            yield _parse_indices(rest)
+
+
+def read_tour(filename):
+    chunks = list(read_tour_chunks(filename))
+    return np.concatenate(chunks) if chunks else np.empty(0, dtype=np.int64)
 
 
 def format_tour(tour):
     return 'index\n' + '\n'.join(map(str, tour))
 
 
+def write_tour(tour, file=None, chunk_size=WRITE_CHUNK_SIZE):
+    # Write the tour in the output format chunk by chunk, so that the whole
+    # output never has to be held in memory as one string.
+    if file is None:
+        file = sys.stdout
+    file.write('index')
+    for start in range(0, len(tour), chunk_size):
+        chunk = tour[start:start + chunk_size]
+        if isinstance(chunk, np.ndarray):
+            chunk = chunk.tolist()
+        file.write('\n')
+        file.write('\n'.join(map(str, chunk)))
+    file.write('\n')
+
+
 def print_tour(tour):
-    print(format_tour(tour))
+    write_tour(tour)
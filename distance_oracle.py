@@ -0,0 +1,184 @@
+import math
+from functools import lru_cache
+
+import numpy as np
+
+import instrumentation
+from spatial_index import build_neighbor_lists
+
+# 都市数がこれ以下なら距離行列を作る. これを超える場合は必要な時に計算する
+DENSE_LIMIT = 4096
+# 遅延計算する場合にキャッシュしておく距離の数
+LAZY_CACHE_SIZE = 1 << 18
+# 距離行列を作る時に一度に計算する行数(一時配列のメモリを抑えるため)
+ROW_BLOCK_SIZE = 256
+
+
+def as_coords(cities) -> np.ndarray:
+    """都市の座標をN×2のfloat64の配列に変換する"""
+    return np.asarray(cities, dtype=np.float64).reshape(-1, 2)
+
+
+def tour_length(cities, tour) -> float:
+    """
+    巡回路の長さをまとめて計算する(最後の都市から最初の都市へ戻る辺も含む)
+
+    Args:
+        cities: 都市のxy座標(リストまたはN×2の配列)
+        tour (list[int]): 都市を訪れる順番
+
+    Returns:
+        float: 巡回路の長さ
+    """
+    if len(tour) < 2:
+        return 0.0
+    points = as_coords(cities)[np.asarray(tour)]
+    diff = points - np.roll(points, -1, axis=0)
+    return float(np.hypot(diff[:, 0], diff[:, 1]).sum())
+
+
+def path_length(cities, path) -> float:
+    """始点と終点を結ぶ辺を含まない、経路の長さを計算する"""
+    if len(path) < 2:
+        return 0.0
+    points = as_coords(cities)[np.asarray(path)]
+    diff = points[1:] - points[:-1]
+    return float(np.hypot(diff[:, 0], diff[:, 1]).sum())
+
+
+class DistanceOracle:
+    """
+    都市間の距離を返すオブジェクトの共通部分
+
+    dist(i, j) と dist[i][j] のどちらでも距離を取り出せる.
+    巡回路の長さや2optの差分など、まとめて計算できるものはNumPyで計算する.
+    """
+
+    def __init__(self, cities):
+        self.coords = as_coords(cities)
+        self._neighbor_lists = {}
+
+    def __len__(self) -> int:
+        return len(self.coords)
+
+    def pair_distances(self, u, v) -> np.ndarray:
+        """都市の配列u, vについて、u[k]とv[k]の距離をまとめて計算する"""
+        diff = self.coords[np.asarray(u)] - self.coords[np.asarray(v)]
+        return np.hypot(diff[..., 0], diff[..., 1])
+
+    def row(self, i: int) -> np.ndarray:
+        """都市iから全ての都市への距離の配列"""
+        diff = self.coords - self.coords[i]
+        return np.hypot(diff[:, 0], diff[:, 1])
+
+    def tour_length(self, tour) -> float:
+        return tour_length(self.coords, tour)
+
+    def two_opt_delta(self, a: int, b: int, c: int, d: int) -> float:
+        """辺(a, b), (c, d)を辺(a, c), (b, d)につなぎ替えた時の長さの変化"""
+        return self(a, c) + self(b, d) - self(a, b) - self(c, d)
+
+    def neighbor_lists(self, k: int) -> list[list[int]]:
+        """近い順に並べた近傍k都市のリスト. 一度求めたものは使い回す"""
+        if k not in self._neighbor_lists:
+            with instrumentation.phase("neighbor_lists"):
+                self._neighbor_lists[k] = build_neighbor_lists(self.coords.tolist(), k)
+        return self._neighbor_lists[k]
+
+    def set_neighbor_lists(self, neighbors, k: int = None) -> None:
+        """
+        外で求めた近傍リストを登録し、neighbor_listsで使い回す
+
+        kを指定するとneighbor_lists(k)でこのリストを返す(alpha-nearnessの候補のように、
+        近傍の数より少ない候補を代わりに使う場合). 省略すると1都市あたりの数をkとする.
+        """
+        neighbors = [list(row) for row in np.asarray(neighbors).tolist()]
+        if k is None:
+            k = len(neighbors[0]) if neighbors else 0
+        self._neighbor_lists[k] = neighbors
+
+
+class DenseDistance(DistanceOracle):
+    """
+    N×Nの距離行列をNumPyで計算して保持する. 都市数が少ない場合に使う
+
+    matrixを渡した場合は計算せずにそれを使う(共有メモリ上の行列を使い回す時など).
+    """
+
+    def __init__(self, cities, dtype=np.float64, matrix=None):
+        super().__init__(cities)
+        if matrix is not None:
+            self.matrix = matrix
+            return
+        N = len(self.coords)
+        xs, ys = self.coords[:, 0], self.coords[:, 1]
+        self.matrix = np.empty((N, N), dtype=dtype)
+        for start in range(0, N, ROW_BLOCK_SIZE):
+            end = min(start + ROW_BLOCK_SIZE, N)
+            self.matrix[start:end] = np.hypot(
+                xs[start:end, None] - xs[None, :], ys[start:end, None] - ys[None, :]
+            )
+
+    def __call__(self, i: int, j: int) -> float:
+        return float(self.matrix[i, j])
+
+    def __getitem__(self, i: int) -> np.ndarray:
+        return self.matrix[i]
+
+    def pair_distances(self, u, v) -> np.ndarray:
+        return self.matrix[np.asarray(u), np.asarray(v)]
+
+    def row(self, i: int) -> np.ndarray:
+        return self.matrix[i]
+
+
+class _LazyRow:
+    __slots__ = ("oracle", "i")
+
+    def __init__(self, oracle, i):
+        self.oracle = oracle
+        self.i = i
+
+    def __getitem__(self, j: int) -> float:
+        return self.oracle(self.i, j)
+
+
+class LazyDistance(DistanceOracle):
+    """距離を必要な時に計算し、最近使ったものだけをLRUキャッシュに残す. 都市数が多い場合に使う"""
+
+    def __init__(self, cities, cache_size: int = LAZY_CACHE_SIZE):
+        super().__init__(cities)
+        xs, ys = self.coords[:, 0].tolist(), self.coords[:, 1].tolist()
+
+        @lru_cache(maxsize=cache_size)
+        def cached_distance(i, j):
+            return math.hypot(xs[i] - xs[j], ys[i] - ys[j])
+
+        self._cached_distance = cached_distance
+
+    def __call__(self, i: int, j: int) -> float:
+        # dist(i, j) = dist(j, i) なので、キーを揃えてキャッシュを共有する
+        if i > j:
+            i, j = j, i
+        return self._cached_distance(i, j)
+
+    def __getitem__(self, i: int) -> _LazyRow:
+        return _LazyRow(self, i)
+
+
+@instrumentation.timed("distance")
+def make_distance(cities, dense_limit: int = DENSE_LIMIT, dtype=np.float64):
+    """
+    都市数に応じて距離の計算方法を選ぶ
+
+    Args:
+        cities: 都市のxy座標
+        dense_limit (int): 都市数がこれ以下なら距離行列を作る
+        dtype: 距離行列の型(np.float32にするとメモリが半分になる)
+
+    Returns:
+        DistanceOracle: DenseDistanceまたはLazyDistance
+    """
+    if len(cities) <= dense_limit:
+        return DenseDistance(cities, dtype)
+    return LazyDistance(cities)
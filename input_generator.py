@@ -1,9 +1,21 @@
 #!/usr/bin/env python3
 
+import argparse
 import random
 
+import numpy as np
+
 CHALLENGE_SIZES = (5, 8, 16, 64, 128, 512, 2048)
 
+# Number of cities generated and written at a time by the streaming writers.
+CHUNK_SIZE = 1 << 18
+# Parameters of the 'clustered' distribution.
+NUM_OF_CLUSTERS = 32
+CLUSTER_STD_RATIO = 0.03
+# Parameters of the 'grid' (road-network-like) distribution.
+NUM_OF_STREETS = 40
+STREET_JITTER_RATIO = 0.002
+
 
 def generate_cities(n, max_x=1600.0, max_y=900.0, seed=1):
     random.seed(seed)
@@ -11,6 +23,82 @@ def generate_cities(n, max_x=1600.0, max_y=900.0, seed=1):
         yield random.uniform(0, max_x), random.uniform(0, max_y)
 
 
+def uniform_chunk(rng, size, max_x, max_y, params):
+    return rng.uniform((0, 0), (max_x, max_y), (size, 2))
+
+
+def clustered_chunk(rng, size, max_x, max_y, params):
+    # Gaussian blobs around fixed cluster centers.
+    centers = params['centers']
+    scale = CLUSTER_STD_RATIO * min(max_x, max_y)
+    points = centers[rng.integers(len(centers), size=size)]
+    points += rng.normal(0, scale, (size, 2))
+    return np.clip(points, (0, 0), (max_x, max_y))
+
+
+def grid_chunk(rng, size, max_x, max_y, params):
+    # Cities along horizontal and vertical streets, like a city road map.
+    points = rng.uniform((0, 0), (max_x, max_y), (size, 2))
+    is_vertical = rng.random(size) < 0.5
+    axis_size = np.where(is_vertical, max_x, max_y)
+    street = rng.integers(NUM_OF_STREETS + 1, size=size) * axis_size / NUM_OF_STREETS
+    jitter = rng.normal(0, STREET_JITTER_RATIO * min(max_x, max_y), size)
+    points[is_vertical, 0] = street[is_vertical] + jitter[is_vertical]
+    points[~is_vertical, 1] = street[~is_vertical] + jitter[~is_vertical]
+    return np.clip(points, (0, 0), (max_x, max_y))
+
+
+DISTRIBUTIONS = {
+    'uniform': uniform_chunk,
+    'clustered': clustered_chunk,
+    'grid': grid_chunk,
+}
+
+
+def generate_chunks(n, distribution='uniform', max_x=1600.0, max_y=900.0, seed=1,
+                    chunk_size=CHUNK_SIZE):
+    # Yield the cities as (chunk_size x 2) float64 arrays, so that memory use
+    # does not depend on n. The same arguments always give the same cities.
+    rng = np.random.default_rng(seed)
+    params = {}
+    if distribution == 'clustered':
+        params['centers'] = rng.uniform((0, 0), (max_x, max_y), (NUM_OF_CLUSTERS, 2))
+    make_chunk = DISTRIBUTIONS[distribution]
+    for start in range(0, n, chunk_size):
+        yield make_chunk(rng, min(chunk_size, n - start), max_x, max_y, params)
+
+
+def write_csv(filename, chunks):
+    with open(filename, 'w') as f:
+        f.write('x,y\n')
+        for chunk in chunks:
+            xs = map(repr, chunk[:, 0].tolist())
+            ys = map(repr, chunk[:, 1].tolist())
+            f.write('\n'.join(map(','.join, zip(xs, ys))))
+            f.write('\n')
+
+
+def write_npy(filename, chunks, n):
+    # A standard .npy file (n x 2 float64), written chunk by chunk. It can be
+    # loaded with np.load(filename, mmap_mode='r').
+    with open(filename, 'wb') as f:
+        header = {'descr': '<f8', 'fortran_order': False, 'shape': (n, 2)}
+        np.lib.format.write_array_header_1_0(f, header)
+        for chunk in chunks:
+            f.write(np.ascontiguousarray(chunk, dtype='<f8').tobytes())
+
+
+def generate_file(filename, n, distribution='uniform', max_x=1600.0, max_y=900.0,
+                  seed=1, file_format=None):
+    chunks = generate_chunks(n, distribution, max_x, max_y, seed)
+    if file_format is None:
+        file_format = 'npy' if filename.endswith('.npy') else 'csv'
+    if file_format == 'npy':
+        write_npy(filename, chunks, n)
+    else:
+        write_csv(filename, chunks)
+
+
 def main():
     for i, n in enumerate(CHALLENGE_SIZES):
         with open(f'input_{i}.csv', 'w') as f:
@@ -20,4 +108,20 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(
+        description='Without arguments, regenerate the challenge inputs.')
+    parser.add_argument('--size', type=int)
+    parser.add_argument('--distribution', default='uniform', choices=list(DISTRIBUTIONS))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--max-x', type=float, default=1600.0)
+    parser.add_argument('--max-y', type=float, default=900.0)
+    parser.add_argument('--format', choices=('csv', 'npy'),
+                        help='Output format. By default, chosen from the file extension.')
+    parser.add_argument('--output', help='Output file.')
+    args = parser.parse_args()
+    if args.size is None:
+        main()
+    else:
+        assert args.output, '--output is required with --size'
+        generate_file(args.output, args.size, args.distribution, args.max_x, args.max_y,
+                      args.seed, args.format)
@@ -0,0 +1,103 @@
+import hashlib
+import os
+
+import numpy as np
+
+from common import read_coords
+from spatial_index import build_neighbor_lists
+
+# キャッシュを置くディレクトリ. 環境変数TSP_CACHE_DIRで変えられる
+CACHE_DIR = os.environ.get("TSP_CACHE_DIR", ".tsp_cache")
+# ファイルのハッシュを計算する時に一度に読む大きさ
+HASH_BLOCK_SIZE = 1 << 20
+
+
+# (ファイル名, 更新時刻, 大きさ)から求めたハッシュ. 同じプロセスで何度も読まないようにする
+_hashes = {}
+
+
+def file_hash(filename: str) -> str:
+    """ファイルの中身のハッシュ. 中身が同じならファイル名が違っても同じキャッシュを使う"""
+    stat = os.stat(filename)
+    key = (os.path.abspath(filename), stat.st_mtime_ns, stat.st_size)
+    if key not in _hashes:
+        digest = hashlib.blake2b(digest_size=16)
+        with open(filename, "rb") as f:
+            while block := f.read(HASH_BLOCK_SIZE):
+                digest.update(block)
+        _hashes[key] = digest.hexdigest()
+    return _hashes[key]
+
+
+def cache_path(filename: str, name: str, cache_dir: str = None) -> str:
+    """入力ファイルfilenameに対応する、nameという名前のキャッシュのパス"""
+    return os.path.join(cache_dir or CACHE_DIR, file_hash(filename), f"{name}.npy")
+
+
+def save_array(path: str, array: np.ndarray) -> None:
+    """
+    配列を.npy形式で保存する
+
+    一時ファイルに書いてから置き換えるので、途中で止まっても壊れたキャッシュは残らず、
+    同時に同じファイルを作るプロセスがあっても読む側は完全なファイルだけを見る.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def load_array(path: str, mmap: bool = True):
+    """キャッシュを読む. mmapがTrueなら読み取り専用でメモリマップする. なければNone"""
+    if not os.path.exists(path):
+        return None
+    return np.load(path, mmap_mode="r" if mmap else None)
+
+
+def load_coords(filename: str, mmap: bool = True, cache_dir: str = None) -> np.ndarray:
+    """
+    都市の座標をN×2のfloat64の配列として読む
+
+    初回はCSVを読んでキャッシュに保存し、2回目以降はキャッシュをメモリマップする.
+    メモリマップした配列は同じファイルを開いた他のプロセスとページを共有する.
+
+    Args:
+        filename (str): 入力ファイル(x,y形式のCSVか、N×2の.npy)
+        mmap (bool): Trueならメモリマップした読み取り専用の配列を返す
+        cache_dir (str): キャッシュを置くディレクトリ. NoneならCACHE_DIR
+
+    Returns:
+        np.ndarray: 都市の座標
+    """
+    # input_generator.pyで作った.npy形式の入力はそのまま読む
+    if filename.endswith(".npy"):
+        return load_array(filename, mmap)
+    path = cache_path(filename, "coords", cache_dir)
+    coords = load_array(path, mmap)
+    if coords is None:
+        save_array(path, read_coords(filename))
+        coords = load_array(path, mmap)
+    return coords
+
+
+def load_neighbors(
+    filename: str, k: int = 10, mmap: bool = True, cache_dir: str = None
+) -> np.ndarray:
+    """
+    近い順に並べた近傍k都市の配列(N×k)を読む. なければ求めてキャッシュに保存する
+
+    座標と同じく入力ファイルの中身のハッシュごとに保存するので、同じ入力を何度解いても
+    近傍リストを作るのは1回だけになる.
+
+    Returns:
+        np.ndarray: neighbors[i]は都市iに近い順に並べた都市のid
+    """
+    path = cache_path(filename, f"neighbors_{k}", cache_dir)
+    neighbors = load_array(path, mmap)
+    if neighbors is None:
+        lists = build_neighbor_lists(load_coords(filename, cache_dir=cache_dir), k)
+        width = len(lists[0]) if lists else 0
+        save_array(path, np.array(lists, dtype=np.int32).reshape(-1, width))
+        neighbors = load_array(path, mmap)
+    return neighbors
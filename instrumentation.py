@@ -0,0 +1,251 @@
+import atexit
+import contextlib
+import functools
+import json
+import marshal
+import math
+import multiprocessing
+import os
+import time
+
+# 収束の記録を追加する最小の間隔(秒). 改善のたびに記録すると大きい入力で記録が膨らむため
+SAMPLE_INTERVAL = 0.01
+# この環境変数にファイル名を指定すると、プロセスの開始から記録し、終了時に書き出す
+# 拡張子が.jsonならJSON、それ以外はpstats(cProfile)の形式で書く
+PROFILE_ENV = "TSP_PROFILE"
+
+# 記録中のRecorder. 記録していない時はNoneで、各関数はこれを1回確認するだけで戻る
+_recorder = None
+# 記録していない時にphase()が返す何もしないコンテキストマネージャ(使い回せる)
+_NULL_PHASE = contextlib.nullcontext()
+
+
+class Recorder:
+    """
+    解法の段階ごとの時間、移動の回数、経路の長さの推移を記録する
+
+    段階は入れ子にでき、"segmented/merge/two_opt"のように親の名前とつなげて記録する.
+    """
+
+    def __init__(self, sample_interval: float = SAMPLE_INTERVAL):
+        self.start_time = time.perf_counter()
+        self.sample_interval = sample_interval
+        # 段階の名前の列 -> [呼び出し回数, 秒数]
+        self.phases = {}
+        self.stack = []
+        self.counters = {}
+        # (経過秒数, 長さ, 段階)の列
+        self.curve = []
+        self.length = None
+        self.last_sample_time = -math.inf
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start_time
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        self.stack.append(name)
+        path = tuple(self.stack)
+        start_time = time.perf_counter()
+        try:
+            yield self
+        finally:
+            stats = self.phases.setdefault(path, [0, 0.0])
+            stats[0] += 1
+            stats[1] += time.perf_counter() - start_time
+            self.stack.pop()
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def sample(self, length: float) -> None:
+        """今の経路の長さを記録する. 以後のimproveはこの長さからの差分として扱う"""
+        self.length = length
+        self.last_sample_time = self.elapsed()
+        self.curve.append((self.last_sample_time, length, "/".join(self.stack)))
+
+    def improve(self, delta: float) -> None:
+        """
+        経路の長さがdeltaだけ変わったことを記録する
+
+        長さを計算し直さずに済むように、探索の中で移動を適用するたびに呼ぶ.
+        記録はsample_intervalごとに1回だけ追加する.
+        """
+        if self.length is None:
+            return
+        self.length += delta
+        if self.elapsed() - self.last_sample_time >= self.sample_interval:
+            self.sample(self.length)
+
+    def worker_state(self) -> dict:
+        """ワーカープロセスから親のプロセスへ送る記録(段階と回数). 長さの推移は送らない"""
+        return {"phases": self.phases, "counters": self.counters}
+
+    def merge(self, state: dict) -> None:
+        """
+        ワーカープロセスの記録(worker_state)を、今の段階の下に加える
+
+        並列に動いたワーカーの秒数は足し合わせるので、子の段階の秒数の合計が
+        親の段階の秒数を超えることがある.
+        """
+        prefix = tuple(self.stack)
+        for path, (calls, seconds) in state["phases"].items():
+            stats = self.phases.setdefault(prefix + tuple(path), [0, 0.0])
+            stats[0] += calls
+            stats[1] += seconds
+        for name, n in state["counters"].items():
+            self.count(name, n)
+
+    def to_dict(self) -> dict:
+        """
+        JSONとして保存できる形にする. self_secondsは子の段階を除いた秒数
+
+        (並列に動いたワーカーの段階を子に持つ場合は、負にならないように0にする)
+        """
+        children_seconds = {}
+        for path, (_, seconds) in self.phases.items():
+            parent = path[:-1]
+            children_seconds[parent] = children_seconds.get(parent, 0.0) + seconds
+        return {
+            "seconds": self.elapsed(),
+            "phases": [
+                {
+                    "phase": "/".join(path),
+                    "calls": calls,
+                    "seconds": seconds,
+                    "self_seconds": max(seconds - children_seconds.get(path, 0.0), 0.0),
+                }
+                for path, (calls, seconds) in self.phases.items()
+            ],
+            "counters": dict(self.counters),
+            "curve": [list(point) for point in self.curve],
+        }
+
+    def to_pstats(self) -> dict:
+        """
+        pstats.Stats(ファイル名)で読める、cProfileと同じ形の統計にする
+
+        段階を関数とみなし、親の段階を呼び出し元とする. snakevizなどでもそのまま開ける.
+        """
+        phases = {
+            path: entry for path, entry in zip(self.phases, self.to_dict()["phases"])
+        }
+
+        def key(path):
+            return ("phase", 0, "/".join(path))
+
+        stats = {}
+        for path, entry in phases.items():
+            calls, seconds = entry["calls"], entry["seconds"]
+            callers = {}
+            if path[:-1]:
+                callers[key(path[:-1])] = (calls, calls, entry["self_seconds"], seconds)
+            stats[key(path)] = (calls, calls, entry["self_seconds"], seconds, callers)
+        return stats
+
+    def write(self, filename: str) -> None:
+        """拡張子が.jsonならJSON、それ以外はpstatsの形式で書く"""
+        if filename.endswith(".json"):
+            with open(filename, "w") as f:
+                json.dump(self.to_dict(), f, indent=2)
+        else:
+            with open(filename, "wb") as f:
+                marshal.dump(self.to_pstats(), f)
+
+
+def current() -> Recorder:
+    """記録中のRecorder. 記録していなければNone"""
+    return _recorder
+
+
+def enable(sample_interval: float = SAMPLE_INTERVAL) -> Recorder:
+    global _recorder
+    _recorder = Recorder(sample_interval)
+    return _recorder
+
+
+def disable() -> Recorder:
+    """記録をやめ、それまで記録していたRecorderを返す"""
+    global _recorder
+    recorder, _recorder = _recorder, None
+    return recorder
+
+
+@contextlib.contextmanager
+def recording(sample_interval: float = SAMPLE_INTERVAL):
+    """withの中だけ記録する. 終わると前の状態に戻す"""
+    global _recorder
+    previous = _recorder
+    recorder = enable(sample_interval)
+    try:
+        yield recorder
+    finally:
+        _recorder = previous
+
+
+def phase(name: str):
+    """段階の時間を測るコンテキストマネージャ. 記録していなければ何もしない"""
+    if _recorder is None:
+        return _NULL_PHASE
+    return _recorder.phase(name)
+
+
+def timed(name: str):
+    """関数全体を1つの段階として時間を測るデコレータ"""
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _recorder is None:
+                return function(*args, **kwargs)
+            with _recorder.phase(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name: str, n: int = 1) -> None:
+    if _recorder is not None:
+        _recorder.count(name, n)
+
+
+def sample(length: float) -> None:
+    if _recorder is not None:
+        _recorder.sample(length)
+
+
+def call_recorded(is_recording: bool, function, *args):
+    """
+    ワーカープロセスでfunction(*args)を呼び、(戻り値, 記録)を返す
+
+    forkしたワーカーは親のRecorderの複製を持っているが、そこに記録しても親には届かない.
+    is_recordingがTrueなら、ワーカーの中で新しく記録し、親のプロセスでcollectに渡して
+    加えられるようにする. Falseなら記録はNoneにする.
+    """
+    if not is_recording:
+        return function(*args), None
+    with recording() as recorder:
+        result = function(*args)
+    return result, recorder.worker_state()
+
+
+def collect(recorded):
+    """call_recordedの戻り値の記録を今の段階の下に加え、関数の戻り値を返す"""
+    result, state = recorded
+    if _recorder is not None and state is not None:
+        _recorder.merge(state)
+    return result
+
+
+def _write_at_exit(filename: str) -> None:
+    if _recorder is not None:
+        _recorder.write(filename)
+
+
+# 環境変数で指定された場合は、メインのプロセスだけで記録する
+# (spawnで起動したワーカーもこのモジュールを読み込むが、同じファイルに書かないようにする)
+if os.environ.get(PROFILE_ENV) and multiprocessing.parent_process() is None:
+    enable()
+    atexit.register(_write_at_exit, os.environ[PROFILE_ENV])
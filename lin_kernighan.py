@@ -0,0 +1,157 @@
+from collections import deque
+
+import instrumentation
+from local_search import EPS, NUM_OF_NEIGHBORS, rotate_path
+from tour import make_tour, two_opt_move
+
+# 1回の改善で続けてつなぎ替える最大の回数
+MAX_DEPTH = 50
+# 最初のつなぎ替えで試す候補の数(2回目以降は最も良い候補だけを試す)
+BREADTH = 5
+
+
+def edge(city_1: int, city_2: int) -> tuple[int, int]:
+    return (city_1, city_2) if city_1 < city_2 else (city_2, city_1)
+
+
+@instrumentation.timed("lin_kernighan")
+def lin_kernighan(
+    tour,
+    dist,
+    num_of_neighbors=NUM_OF_NEIGHBORS,
+    max_depth=MAX_DEPTH,
+    breadth=BREADTH,
+    fixed_ends=False,
+    active=None,
+    budget=None,
+):
+    """
+    Lin-Kernighan法による可変深さのk-opt
+
+    辺(t1, t2)を外した状態から、t2と近傍のt3をつなぎ、t3の隣のt4との辺を外し、
+    t4を新しいt2として続けていく. 各段階は2optのつなぎ替えとして実際に適用し、
+    t4とt1をつないで閉じた時の改善量が最大になった段階まで残す.
+    途中までの改善量(gain)が正である間だけ深く探索する.
+
+    Args:
+        tour (list[int]): 初期経路
+        dist (DistanceOracle): 都市間の距離
+        num_of_neighbors (int): 1都市あたりに調べる近傍の数
+        max_depth (int): 続けてつなぎ替える最大の回数
+        breadth (int): 最初のつなぎ替えで試す候補の数
+        fixed_ends (bool): Trueなら始点と終点を固定した経路として最適化する
+        active (list[int]): 最初に調べる都市. Noneなら全ての都市.
+            改善があればつなぎ替えた都市を調べ直すので、改善はその周りへ広がっていく
+        budget (Budget): 探索の予算. 使い切ったらその時点の経路を返す
+
+    Returns:
+        list[int]: 初期経路より長くならない経路
+    """
+    if len(tour) < 5:
+        return list(tour)
+    neighbors = dist.neighbor_lists(num_of_neighbors)
+    current = make_tour(tour, len(dist))
+    fixed_edge = edge(tour[-1], tour[0]) if fixed_ends else None
+    recorder = instrumentation.current()
+    if recorder is not None:
+        recorder.sample(dist.tour_length(tour))
+
+    def move(t1, t2, t4, t3):
+        # t1-t2 ... t4-t3 を t1-t4 ... t2-t3 につなぎ替える
+        two_opt_move(current, t1, t2, t4, t3)
+
+    def candidates(t1, t2, gain, added, removed):
+        # t2とつなぐt3と、外すt4の候補を、閉じる前の改善量が大きい順に並べる
+        # t2がt1のnextなら、t4はt3のprev
+        other_side = current.prev if current.next(t1) == t2 else current.next
+        result = []
+        for t3 in neighbors[t2]:
+            if t3 not in current:
+                continue
+            g1 = gain - dist(t2, t3)
+            # 近傍リストは近い順なので、これ以降は改善量が正にならない
+            if g1 <= EPS:
+                break
+            t4 = other_side(t3)
+            if t3 == t1 or t4 == t2 or edge(t2, t3) in removed:
+                continue
+            if edge(t3, t4) in added or edge(t3, t4) == fixed_edge:
+                continue
+            result.append((g1 + dist(t3, t4), t3, t4))
+        result.sort(reverse=True)
+        return result
+
+    def improve_from(t1, t2):
+        # t1を起点とする改善を探す. 改善すればTrueを返し、変化した都市をqueueに追加する
+        first_gain = dist(t1, t2)
+        for _, t3, t4 in candidates(t1, t2, first_gain, set(), {edge(t1, t2)})[
+            :breadth
+        ]:
+            moves = []
+            added, removed = set(), {edge(t1, t2)}
+            gain = first_gain
+            best_improvement, best_depth = EPS, 0
+            cur_t2, cur_t3, cur_t4 = t2, t3, t4
+            while True:
+                gain = gain - dist(cur_t2, cur_t3) + dist(cur_t3, cur_t4)
+                move(t1, cur_t2, cur_t4, cur_t3)
+                moves.append((cur_t2, cur_t3, cur_t4))
+                added.add(edge(cur_t2, cur_t3))
+                removed.add(edge(cur_t3, cur_t4))
+                # t4とt1をつないで閉じた場合の改善量
+                improvement = gain - dist(cur_t4, t1)
+                if improvement > best_improvement:
+                    best_improvement, best_depth = improvement, len(moves)
+                if len(moves) >= max_depth:
+                    break
+                next_candidates = candidates(t1, cur_t4, gain, added, removed)
+                if not next_candidates:
+                    break
+                _, next_t3, next_t4 = next_candidates[0]
+                cur_t2, cur_t3, cur_t4 = cur_t4, next_t3, next_t4
+
+            # 最も改善した段階より後のつなぎ替えを元に戻す
+            while len(moves) > best_depth:
+                undo_t2, undo_t3, undo_t4 = moves.pop()
+                move(t1, undo_t4, undo_t2, undo_t3)
+            if moves:
+                if recorder is not None:
+                    recorder.improve(-best_improvement)
+                for moved in moves:
+                    for city in moved:
+                        push(city)
+                push(t1)
+                return True
+        return False
+
+    queue = deque(tour if active is None else dict.fromkeys(active))
+    in_queue = {city: False for city in tour}
+    for city in queue:
+        in_queue[city] = True
+
+    def push(city):
+        if not in_queue[city]:
+            in_queue[city] = True
+            queue.append(city)
+
+    examined = applied = 0
+    while queue:
+        if budget is not None and not budget.check():
+            break
+        t1 = queue.popleft()
+        in_queue[t1] = False
+        examined += 1
+        for side in (current.next, current.prev):
+            t2 = side(t1)
+            if edge(t1, t2) == fixed_edge:
+                continue
+            if improve_from(t1, t2):
+                applied += 1
+                break
+
+    if recorder is not None:
+        recorder.count("lin_kernighan.examined", examined)
+        recorder.count("lin_kernighan.applied", applied)
+    if fixed_ends:
+        return rotate_path(current.to_list(), tour[0], tour[-1])
+    return current.to_list()
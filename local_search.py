@@ -0,0 +1,276 @@
+from collections import deque
+
+import instrumentation
+from tour import make_tour, two_opt_move
+
+# 近傍リストに含める都市の数
+NUM_OF_NEIGHBORS = 10
+# 浮動小数点の誤差で改善と判定しないための閾値
+EPS = 1e-9
+
+
+def rotate_path(order: list[int], start_city: int, end_city: int) -> list[int]:
+    """巡回路をstart_cityから始まりend_cityで終わる経路に直す"""
+    start = order.index(start_city)
+    path = order[start:] + order[:start]
+    if path[-1] != end_city:
+        path = path[:1] + path[1:][::-1]
+    return path
+
+
+@instrumentation.timed("two_opt")
+def two_opt(
+    tour,
+    dist,
+    num_of_neighbors=NUM_OF_NEIGHBORS,
+    fixed_ends=False,
+    active=None,
+    budget=None,
+):
+    """
+    近傍リストとdon't-look bitを使った2opt
+
+    各都市について近傍リストの都市とつなぎ替える場合だけを調べる.
+    改善がなかった都市は、その周りの辺が変わるまで調べ直さない.
+    つなぎ替えでは巡回路の短い方の区間をその場で反転する.
+
+    Args:
+        tour (list[int]): 初期経路
+        dist (DistanceOracle): 都市間の距離
+        num_of_neighbors (int): 1都市あたりに調べる近傍の数
+        fixed_ends (bool): Trueなら始点と終点を固定した経路として最適化する
+        active (list[int]): 最初に調べる都市. Noneなら全ての都市.
+            改善があればつなぎ替えた都市を調べ直すので、改善はその周りへ広がっていく
+        budget (Budget): 探索の予算. 使い切ったらその時点の経路を返す
+
+    Returns:
+        list[int]: 改善した経路
+    """
+    if len(tour) < 5:
+        return list(tour)
+    neighbors = dist.neighbor_lists(num_of_neighbors)
+    current = make_tour(tour, len(dist))
+    # 始点と終点を固定する場合は、終点から始点に戻る辺を消さないようにする
+    fixed_edges = {(tour[-1], tour[0]), (tour[0], tour[-1])} if fixed_ends else ()
+
+    recorder = instrumentation.current()
+    if recorder is not None:
+        recorder.sample(dist.tour_length(tour))
+    evaluated = applied = 0
+
+    queue = deque(tour if active is None else dict.fromkeys(active))
+    in_queue = {city: False for city in tour}
+    for city in queue:
+        in_queue[city] = True
+    while queue:
+        if budget is not None and not budget.check():
+            break
+        city1 = queue.popleft()
+        in_queue[city1] = False
+        # 次の都市とつなぐ辺、前の都市とつなぐ辺の順に外すことを考える
+        for side in (current.next, current.prev):
+            city2 = side(city1)
+            if (city1, city2) in fixed_edges:
+                continue
+            dist_12 = dist(city1, city2)
+            is_improved = False
+            for city3 in neighbors[city1]:
+                if city3 not in current:
+                    continue
+                dist_13 = dist(city1, city3)
+                # 近傍リストは近い順なので、これ以降は改善しない
+                if dist_13 >= dist_12:
+                    break
+                city4 = side(city3)
+                if city3 == city2 or city4 == city1 or (city3, city4) in fixed_edges:
+                    continue
+                # city1とcity3を,city2とcity4をつなぐ
+                diff = dist_13 + dist(city2, city4) - dist_12 - dist(city3, city4)
+                evaluated += 1
+                if diff < -EPS:
+                    two_opt_move(current, city1, city2, city3, city4)
+                    applied += 1
+                    if recorder is not None:
+                        recorder.improve(diff)
+                    for city in (city1, city2, city3, city4):
+                        if not in_queue[city]:
+                            in_queue[city] = True
+                            queue.append(city)
+                    is_improved = True
+                    break
+            if is_improved:
+                break
+
+    if recorder is not None:
+        recorder.count("two_opt.evaluated", evaluated)
+        recorder.count("two_opt.applied", applied)
+    if fixed_ends:
+        return rotate_path(current.to_list(), tour[0], tour[-1])
+    return current.to_list()
+
+
+def or_move(tour, first, last, city_c, city_d, is_reversed) -> None:
+    """
+    firstからnextをたどってlastまでの区間を、辺(city_c, city_d)の間に移す
+
+    city_dはcity_cのnextとする. is_reversedがFalseならcity_c, first...last, city_dの順に、
+    Trueならcity_c, last...first, city_dの順に並ぶ. 2optのつなぎ替え2~3回で実現する.
+    """
+    prev_city, next_city = tour.prev(first), tour.next(last)
+    # prev_city-city_c, first-city_dをつなぐ
+    if city_d != prev_city:
+        two_opt_move(tour, prev_city, first, city_c, city_d)
+    # prev_city-next_city, city_c-lastをつなぐ
+    if city_c != next_city:
+        two_opt_move(tour, prev_city, city_c, next_city, last)
+    # city_c-first, last-city_dをつなぐ
+    if not is_reversed:
+        two_opt_move(tour, city_c, last, first, city_d)
+
+
+@instrumentation.timed("or_opt")
+def or_opt(
+    tour,
+    dist,
+    num_of_neighbors=NUM_OF_NEIGHBORS,
+    fixed_ends=False,
+    max_segment_length=3,
+    active=None,
+    budget=None,
+):
+    """
+    近傍リストとdon't-look bitを使ったOr-opt
+
+    1~max_segment_length都市の区間を取り出し、区間の端の都市の近傍の隣に
+    (必要なら向きを反転して)挿入する. 変化する辺は3本だけなので差分はO(1)で計算できる.
+
+    Args:
+        tour (list[int]): 初期経路
+        dist (DistanceOracle): 都市間の距離
+        num_of_neighbors (int): 1都市あたりに調べる近傍の数
+        fixed_ends (bool): Trueなら始点と終点を固定した経路として最適化する
+        max_segment_length (int): 移動する区間の最大の長さ
+        active (list[int]): 最初に調べる都市. Noneなら全ての都市.
+            改善があればつなぎ替えた都市を調べ直すので、改善はその周りへ広がっていく
+        budget (Budget): 探索の予算. 使い切ったらその時点の経路を返す
+
+    Returns:
+        list[int]: 改善した経路
+    """
+    if len(tour) < max_segment_length + 3:
+        return list(tour)
+    neighbors = dist.neighbor_lists(num_of_neighbors)
+    current = make_tour(tour, len(dist))
+    fixed_edges = {(tour[-1], tour[0]), (tour[0], tour[-1])} if fixed_ends else ()
+    recorder = instrumentation.current()
+    if recorder is not None:
+        recorder.sample(dist.tour_length(tour))
+    # Or-optでは移動を探す都市の数を数える(1都市あたり複数の移動を調べる)
+    examined = applied = 0
+
+    queue = deque(tour if active is None else dict.fromkeys(active))
+    in_queue = {city: False for city in tour}
+    for city in queue:
+        in_queue[city] = True
+    while queue:
+        if budget is not None and not budget.check():
+            break
+        city = queue.popleft()
+        in_queue[city] = False
+        examined += 1
+        move = find_or_move(
+            current, dist, neighbors, city, max_segment_length, fixed_edges
+        )
+        if move is None:
+            continue
+        *args, touched, delta = move
+        or_move(current, *args)
+        applied += 1
+        if recorder is not None:
+            recorder.improve(delta)
+        for other in touched:
+            if not in_queue[other]:
+                in_queue[other] = True
+                queue.append(other)
+
+    if recorder is not None:
+        recorder.count("or_opt.examined", examined)
+        recorder.count("or_opt.applied", applied)
+    if fixed_ends:
+        return rotate_path(current.to_list(), tour[0], tour[-1])
+    return current.to_list()
+
+
+def find_or_move(tour, dist, neighbors, city, max_segment_length, fixed_edges):
+    """
+    cityを端に含む区間を動かして改善するOr-optの移動を探す
+
+    Returns:
+        tuple | None: (区間の先頭, 区間の末尾, city_c, city_d, 反転するか, 変化した都市,
+        長さの変化). 改善する移動がなければNone
+    """
+    for length in range(1, max_segment_length + 1):
+        # cityから始まる区間と、cityで終わる区間
+        segment_end = city
+        for _ in range(length - 1):
+            segment_end = tour.next(segment_end)
+        segment_start = city
+        for _ in range(length - 1):
+            segment_start = tour.prev(segment_start)
+        for first, last in {(city, segment_end), (segment_start, city)}:
+            segment = tour.sequence(first, last)
+            prev_city, next_city = tour.prev(first), tour.next(last)
+            if (prev_city, first) in fixed_edges or (last, next_city) in fixed_edges:
+                continue
+            # 区間を取り除いた時に短くなる長さ
+            removed_gain = (
+                dist(prev_city, first)
+                + dist(last, next_city)
+                - dist(prev_city, next_city)
+            )
+            if removed_gain <= EPS:
+                continue
+            for end_city in (first, last):
+                other_end = last if end_city == first else first
+                for city_c in neighbors[end_city]:
+                    if city_c not in tour or city_c in segment:
+                        continue
+                    dist_c = dist(end_city, city_c)
+                    # 近傍リストは近い順なので、これ以降は改善しない
+                    if dist_c >= removed_gain:
+                        break
+                    # city_cの次またはcity_cの前に挿入する
+                    for city_d in (tour.next(city_c), tour.prev(city_c)):
+                        if city_d in segment or (city_c, city_d) in fixed_edges:
+                            continue
+                        added = dist_c + dist(other_end, city_d) - dist(city_c, city_d)
+                        if added - removed_gain < -EPS:
+                            touched = (
+                                prev_city,
+                                next_city,
+                                first,
+                                last,
+                                city_c,
+                                city_d,
+                            )
+                            # end_cityがcity_cの隣に来るように並べる
+                            if city_d == tour.next(city_c):
+                                return (
+                                    first,
+                                    last,
+                                    city_c,
+                                    city_d,
+                                    end_city != first,
+                                    touched,
+                                    added - removed_gain,
+                                )
+                            return (
+                                first,
+                                last,
+                                city_d,
+                                city_c,
+                                end_city == first,
+                                touched,
+                                added - removed_gain,
+                            )
+    return None
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+
+import math
+import sys
+
+import numpy as np
+
+import instrumentation
+from anytime import Budget
+from distance_oracle import make_distance
+from instance_cache import cache_path, load_array, load_coords, save_array
+from local_search import NUM_OF_NEIGHBORS
+from solver_greedy_edge import solve as greedy_edge_tour
+
+# 劣勾配法の最大の反復回数
+MAX_ITERATIONS = 1000
+# 劣勾配法に使う秒数
+TIME_LIMIT = 60.0
+# 最初のステップ幅の係数. 下界がPERIOD回続けて更新されなければ半分にする
+INITIAL_STEP = 2.0
+PERIOD = 20
+# ステップ幅の係数がこれより小さくなったら打ち切る
+MIN_STEP = 1e-3
+# 都市数がこれを超える入力では下界を求めない(1回の1-treeにO(N^2)の計算がかかるため)
+MAX_CITIES = 20000
+# alpha-nearnessで選ぶ候補の数と、その候補を選ぶ元にする近い都市の数
+NUM_OF_CANDIDATES = 5
+NUM_OF_PRE_CANDIDATES = 30
+
+
+class OneTree:
+    """
+    都市0を除いた最小全域木に、都市0から最も近い2都市への辺を加えた1-tree
+
+    辺(i, j)の重みはdist(i, j) + pi[i] + pi[j]とする. 全ての巡回路は1-treeの一種なので、
+    重みの合計から2 * sum(pi)を引いたもの(bound)は巡回路の長さの下界になる.
+    """
+
+    def __init__(self, dist, pi: np.ndarray):
+        N = len(dist)
+        self.pi = pi
+        self.parent = np.full(N, -1, dtype=np.int64)
+        # 最小全域木に都市を加えた順. 親は必ず子より前にある
+        self.order = np.empty(N - 1, dtype=np.int64)
+        weight = 0.0
+
+        # 都市1から始めるPrim法. 各都市について、木までの最短の重みと木の側の都市を持つ
+        key = np.full(N, math.inf)
+        in_tree = np.zeros(N, dtype=bool)
+        in_tree[0] = True
+        city = 1
+        for i in range(N - 1):
+            in_tree[city] = True
+            self.order[i] = city
+            if i == N - 2:
+                break
+            row = dist.row(city) + pi[city] + pi
+            update = (row < key) & ~in_tree
+            key[update] = row[update]
+            self.parent[update] = city
+            city = int(np.argmin(np.where(in_tree, math.inf, key)))
+            weight += key[city]
+
+        # 都市0は最も近い2都市とつなぐ
+        row = dist.row(0) + pi[0] + pi
+        row[0] = math.inf
+        nearest = np.argpartition(row, 1)[:2]
+        self.special = tuple(int(city) for city in nearest[np.argsort(row[nearest])])
+        weight += float(row[nearest].sum())
+
+        self.degree = np.bincount(self.parent[self.parent >= 0], minlength=N)
+        self.degree[self.parent >= 0] += 1
+        self.degree[list(self.special)] += 1
+        self.degree[0] = 2
+        self.bound = weight - 2 * float(pi.sum())
+
+    def is_tour(self) -> bool:
+        return bool((self.degree == 2).all())
+
+
+def held_karp_bound(
+    cities,
+    upper_bound: float = None,
+    max_iterations: int = MAX_ITERATIONS,
+    time_limit: float = TIME_LIMIT,
+    dist=None,
+):
+    """
+    劣勾配法で1-treeの下界(Held-Karpの下界)を求める
+
+    次数が2より大きい都市のpiを増やし、1の都市のpiを減らすことを繰り返して、
+    1-treeを巡回路に近づけながら下界を大きくする. ステップ幅は
+    INITIAL_STEP * (upper_bound - 下界) / |次数 - 2|^2 から始め、下界が更新されなければ縮める.
+
+    Args:
+        cities: 都市のxy座標
+        upper_bound (float): 巡回路の長さ(ステップ幅に使う). Noneなら辺の貪欲法で求める
+        max_iterations (int): 最大の反復回数
+        time_limit (float): 秒数
+        dist (DistanceOracle): 都市間の距離. Noneならcitiesから作る
+
+    Returns:
+        tuple[float, np.ndarray]: 下界と、下界を与えたpi
+    """
+    if dist is None:
+        dist = make_distance(cities)
+    N = len(dist)
+    if N < 3:
+        return (dist.tour_length(list(range(N))), np.zeros(N))
+    if upper_bound is None:
+        upper_bound = dist.tour_length(greedy_edge_tour(dist.coords.tolist()))
+
+    budget = Budget(time_limit, max_iterations)
+    pi = np.zeros(N)
+    best_bound, best_pi = -math.inf, pi
+    step, num_of_not_improved = INITIAL_STEP, 0
+    with instrumentation.phase("held_karp_bound"):
+        while budget.check() and budget.remaining() != 0 and step >= MIN_STEP:
+            tree = OneTree(dist, pi)
+            if tree.bound > best_bound:
+                best_bound, best_pi = tree.bound, pi
+                num_of_not_improved = 0
+            else:
+                num_of_not_improved += 1
+            if tree.is_tour():
+                # 1-treeが巡回路なら、それが最適な巡回路
+                break
+            if num_of_not_improved >= PERIOD:
+                step /= 2
+                num_of_not_improved = 0
+            subgradient = tree.degree - 2
+            gap = max(upper_bound - tree.bound, 0.0)
+            pi = pi + step * gap / float((subgradient**2).sum()) * subgradient
+            instrumentation.sample(tree.bound)
+    return best_bound, best_pi
+
+
+def binary_lifting(tree: OneTree, dist):
+    """
+    1-treeの木の部分について、2^j個上の祖先と、そこまでの辺の重みの最大値の表を作る
+
+    Returns:
+        tuple[np.ndarray, list[np.ndarray], list[np.ndarray]]: 根(都市1)からの深さ、
+        up[j][v](vの2^j個上の祖先)、max_weight[j][v](vからup[j][v]までの辺の重みの最大値)
+    """
+    N = len(tree.parent)
+    parent = tree.parent.copy()
+    root = tree.order[0]
+    parent[root] = root
+    parent[0] = 0
+    edge_weight = dist.pair_distances(np.arange(N), parent) + tree.pi + tree.pi[parent]
+    edge_weight[[0, root]] = -math.inf
+
+    depth = np.zeros(N, dtype=np.int64)
+    for city in tree.order[1:].tolist():
+        depth[city] = depth[parent[city]] + 1
+
+    up, max_weight = [parent], [edge_weight]
+    for _ in range(max(int(depth.max()).bit_length(), 1)):
+        up.append(up[-1][up[-1]])
+        max_weight.append(np.maximum(max_weight[-1], max_weight[-1][up[-2]]))
+    return depth, up, max_weight
+
+
+def path_max_weights(depth, up, max_weight, a, b) -> np.ndarray:
+    """木の上でaからbへの経路にある辺の重みの最大値を、組ごとにまとめて求める"""
+    a, b = np.array(a), np.array(b)
+    swap = depth[a] < depth[b]
+    a[swap], b[swap] = b[swap], a[swap]
+    result = np.full(len(a), -math.inf)
+    # aをbと同じ深さまで上げる
+    diff = depth[a] - depth[b]
+    for j in range(len(up)):
+        mask = (diff >> j) & 1 == 1
+        result[mask] = np.maximum(result[mask], max_weight[j][a[mask]])
+        a[mask] = up[j][a[mask]]
+    # 共通の祖先の直前まで同時に上げる
+    for j in reversed(range(len(up))):
+        mask = up[j][a] != up[j][b]
+        result[mask] = np.maximum(
+            result[mask],
+            np.maximum(max_weight[j][a[mask]], max_weight[j][b[mask]]),
+        )
+        a[mask], b[mask] = up[j][a[mask]], up[j][b[mask]]
+    mask = a != b
+    result[mask] = np.maximum(
+        result[mask], np.maximum(max_weight[0][a[mask]], max_weight[0][b[mask]])
+    )
+    return result
+
+
+def alpha_nearness(tree: OneTree, dist, a, b) -> np.ndarray:
+    """
+    辺(a[k], b[k])のalpha値をまとめて求める
+
+    alpha(i, j)は、辺(i, j)を必ず含む1-treeの重みが最小の1-treeより増える量.
+    1-treeに含まれる辺は0で、小さいほど最適な巡回路に含まれやすい.
+    木の部分では、辺の重みからi, jを結ぶ木の経路で最も重い辺の重みを引いたものになる.
+    """
+    a, b = np.asarray(a), np.asarray(b)
+    weight = dist.pair_distances(a, b) + tree.pi[a] + tree.pi[b]
+    depth, up, max_weight = binary_lifting(tree, dist)
+    alpha = weight - path_max_weights(depth, up, max_weight, a, b)
+    # 都市0との辺は、都市0の2本目の辺と入れ替わる
+    second = tree.special[1]
+    special_weight = dist(0, second) + tree.pi[0] + tree.pi[second]
+    has_zero = (a == 0) | (b == 0)
+    alpha[has_zero] = weight[has_zero] - special_weight
+    return np.maximum(alpha, 0.0)
+
+
+def alpha_candidates(
+    dist,
+    pi: np.ndarray,
+    num_of_candidates: int = NUM_OF_CANDIDATES,
+    num_of_pre_candidates: int = NUM_OF_PRE_CANDIDATES,
+) -> list[list[int]]:
+    """
+    各都市の近いnum_of_pre_candidates都市のうち、alpha値が小さいnum_of_candidates都市を選ぶ
+
+    局所探索では近傍リストが近い順に並んでいることを使って探索を打ち切るので、
+    選んだ候補は近い順に並べ直して返す.
+
+    Returns:
+        list[list[int]]: 各都市の候補(近い順)
+    """
+    N = len(dist)
+    tree = OneTree(dist, pi)
+    neighbors = np.array(dist.neighbor_lists(num_of_pre_candidates))
+    cities = np.repeat(np.arange(N), neighbors.shape[1])
+    alpha = alpha_nearness(tree, dist, cities, neighbors.ravel()).reshape(
+        neighbors.shape
+    )
+    # alpha値が小さい順(同じなら近い順)に選び、近い順に並べ直す
+    rank = np.argsort(alpha, axis=1, kind="stable")
+    chosen = np.sort(rank[:, :num_of_candidates], axis=1)
+    return np.take_along_axis(neighbors, chosen, axis=1).tolist()
+
+
+def set_alpha_candidates(
+    dist,
+    pi: np.ndarray = None,
+    num_of_neighbors: int = NUM_OF_NEIGHBORS,
+    num_of_candidates: int = NUM_OF_CANDIDATES,
+) -> None:
+    """
+    alpha-nearnessの候補をdist.neighbor_lists(num_of_neighbors)として登録する
+
+    以後、2opt、Or-opt、Lin-Kernighan法などの局所探索はこの候補だけを調べる.
+    piを省略した場合はheld_karp_boundで求める.
+    """
+    if pi is None:
+        _, pi = held_karp_bound(None, dist=dist)
+    dist.set_neighbor_lists(
+        alpha_candidates(dist, pi, num_of_candidates), num_of_neighbors
+    )
+
+
+def load_bound(filename: str, time_limit: float = TIME_LIMIT, cache_dir: str = None):
+    """
+    入力ファイルの下界を読む. なければ求めてキャッシュに保存する
+
+    Returns:
+        float | None: 下界. 都市数がMAX_CITIESを超える場合はNone
+    """
+    path = cache_path(filename, "held_karp", cache_dir)
+    cached = load_array(path, mmap=False)
+    if cached is None:
+        coords = load_coords(filename, cache_dir=cache_dir)
+        if len(coords) > MAX_CITIES:
+            return None
+        bound, pi = held_karp_bound(coords, time_limit=time_limit)
+        save_array(path, np.concatenate(([bound], pi)))
+        return bound
+    return float(cached[0])
+
+
+if __name__ == "__main__":
+    assert len(sys.argv) > 1
+    for filename in sys.argv[1:]:
+        print(f"{filename}: {load_bound(filename)}")
@@ -1,34 +1,256 @@
 #!/usr/bin/env python3
 
-import math
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
 
-from common import read_input
+import numpy as np
 
-CHALLENGES = 7
+from common import read_tour_chunks
+from distance_oracle import path_length
+from instance_cache import load_coords
+from lower_bound import load_bound
 
+CHALLENGES = 8
+OUTPUT_PREFIXES = ("output", "sample/random", "sample/greedy", "sample/sa")
 
-def distance(city1, city2):
-    return math.sqrt((city1[0] - city2[0]) ** 2 + (city1[1] - city2[1]) ** 2)
 
+def verify_tour(cities, output_file: str) -> dict:
+    """
+    出力ファイルを少しずつ読みながら、巡回路になっているかの確認と長さの計算を同時に行う
 
-def verify_output():
-    for challenge_number in range(CHALLENGES):
-        print(f"Challenge {challenge_number}")
-        cities = read_input(f"input_{challenge_number}.csv")
-        N = len(cities)
-        for output_prefix in ("output", "sample/random", "sample/greedy", "sample/sa"):
-            output_file = f"{output_prefix}_{challenge_number}.csv"
-            with open(output_file) as f:
-                lines = f.readlines()
-                assert lines[0].strip() == "index"
-                tour = [int(i.strip()) for i in lines[1 : N + 1]]
-            assert set(tour) == set(range(N))
-            path_length = sum(
-                distance(cities[tour[i]], cities[tour[(i + 1) % N]]) for i in range(N)
-            )
-            print(f"{output_prefix:16}: {path_length:>10.2f}")
-        print()
+    訪問済みの都市はビットマップ(N要素のbool配列)に記録し、ファイルを1回読むだけで
+    全ての都市をちょうど1回ずつ訪れているかを確かめる. 長さは読んだ部分ごとにまとめて計算する.
+
+    Args:
+        cities: 都市のxy座標(N×2の配列)
+        output_file (str): 出力ファイル
+
+    Returns:
+        dict: valid(巡回路になっているか), length(長さ), error(問題があればその内容)
+    """
+    coords = np.asarray(cities, dtype=np.float64).reshape(-1, 2)
+    N = len(coords)
+    is_visited = np.zeros(N, dtype=bool)
+    num_of_visited = 0
+    length = 0.0
+    first_city = last_city = None
+    try:
+        for chunk in read_tour_chunks(output_file):
+            if chunk.min() < 0 or chunk.max() >= N:
+                return {"valid": False, "error": "index out of range"}
+            # 前の部分で訪れた都市か、この部分の中で2回現れる都市があれば重複
+            if is_visited[chunk].any() or len(np.unique(chunk)) != len(chunk):
+                return {"valid": False, "error": "duplicate city"}
+            is_visited[chunk] = True
+            num_of_visited += len(chunk)
+
+            # 前の部分の最後の都市からつなげて長さを計算する
+            if last_city is None:
+                first_city = int(chunk[0])
+                length += path_length(coords, chunk)
+            else:
+                length += path_length(coords, np.concatenate(([last_city], chunk)))
+            last_city = int(chunk[-1])
+    except ValueError as error:
+        return {"valid": False, "error": str(error)}
+
+    if num_of_visited != N:
+        return {"valid": False, "error": f"{N - num_of_visited} cities not visited"}
+    if N > 0:
+        length += path_length(coords, [last_city, first_city])
+    return {"valid": True, "length": length}
+
+
+def verify_pair(input_file: str, output_file: str) -> dict:
+    """入力ファイルと出力ファイルの組を1つ確認する. ワーカープロセスで実行する"""
+    result = {"input": input_file, "output": output_file}
+    if not os.path.exists(output_file):
+        return {**result, "valid": False, "missing": True, "error": "missing"}
+    cities = load_coords(input_file)
+    return {**result, "cities": len(cities), **verify_tour(cities, output_file)}
+
+
+def check_tolerance(results: list[dict], reference_prefix: str, tolerance: float):
+    """
+    各出力の長さが、同じ入力に対する参照の出力の長さの(1 + tolerance)倍以下かを確かめる
+
+    結果にreference_length, within_toleranceを加える.
+    """
+    reference = {
+        result["input"]: result["length"]
+        for result in results
+        if result.get("valid") and result["output"].startswith(reference_prefix)
+    }
+    for result in results:
+        if result.get("valid") and result["input"] in reference:
+            result["reference_length"] = reference[result["input"]]
+            result["within_tolerance"] = result["length"] <= reference[
+                result["input"]
+            ] * (1 + tolerance)
+
+
+def add_lower_bounds(results: list[dict], num_of_workers=None) -> None:
+    """
+    巡回路になっている出力について、入力の下界(lower_bound.load_bound)と、
+    下界に対する比gap = 長さ / 下界 - 1を加える
+
+    下界は入力ごとにキャッシュされるので、求めるのは初めての入力だけになる.
+    """
+    input_files = sorted({result["input"] for result in results if result["valid"]})
+    if num_of_workers == 1 or len(input_files) <= 1:
+        bounds = list(map(load_bound, input_files))
+    else:
+        with ProcessPoolExecutor(num_of_workers) as executor:
+            bounds = list(executor.map(load_bound, input_files))
+    bounds = dict(zip(input_files, bounds))
+    for result in results:
+        bound = bounds.get(result["input"])
+        if result["valid"] and bound:
+            result["lower_bound"] = bound
+            result["gap"] = result["length"] / bound - 1
+
+
+def verify_pairs(pairs, num_of_workers=None) -> list[dict]:
+    """
+    入力ファイルと出力ファイルの組をプロセスプールで並列に確認する
+
+    座標はinstance_cacheでメモリマップして読むので、ワーカー同士で同じページを共有する.
+
+    Args:
+        pairs (list[tuple[str, str]]): (入力ファイル, 出力ファイル)の組
+        num_of_workers (int): ワーカーの数. Noneならコア数. 1なら並列化しない
+
+    Returns:
+        list[dict]: 組ごとの結果(pairsと同じ順)
+    """
+    pairs = list(pairs)
+    if num_of_workers == 1 or len(pairs) <= 1:
+        return [verify_pair(*pair) for pair in pairs]
+    # キャッシュを先に作っておき、ワーカーが同じCSVを同時に読まないようにする
+    for input_file in {input_file for input_file, _ in pairs}:
+        load_coords(input_file)
+    with ProcessPoolExecutor(num_of_workers) as executor:
+        return list(executor.map(verify_pair, *zip(*pairs)))
+
+
+def challenge_pairs(challenges=CHALLENGES, prefixes=OUTPUT_PREFIXES):
+    """input_{i}.csvと、各prefixの出力ファイル{prefix}_{i}.csvの組(入力があるものだけ)"""
+    return [
+        (f"input_{i}.csv", f"{prefix}_{i}.csv")
+        for i in range(challenges)
+        if os.path.exists(f"input_{i}.csv")
+        for prefix in prefixes
+    ]
+
+
+def is_skipped(result: dict, skip_missing: bool) -> bool:
+    """skip_missingがTrueなら、出力ファイルがない組は失敗ではなく飛ばしたものとして扱う"""
+    return skip_missing and result.get("missing", False)
+
+
+def is_ok(results: list[dict], skip_missing: bool = False) -> bool:
+    """飛ばした組を除いて、全ての出力が巡回路になっていて基準を満たしていればTrue"""
+    return all(
+        is_skipped(result, skip_missing)
+        or (result["valid"] and result.get("within_tolerance", True))
+        for result in results
+    )
+
+
+def print_report(results: list[dict], skip_missing: bool = False) -> None:
+    current_input = None
+    for result in results:
+        if result["input"] != current_input:
+            if current_input is not None:
+                print()
+            current_input = result["input"]
+            print(f"{current_input} ({result.get('cities', '?')} cities)")
+        output_file = os.path.splitext(result["output"])[0]
+        if is_skipped(result, skip_missing):
+            print(f"{output_file:24}: missing (skipped)")
+            continue
+        if not result["valid"]:
+            print(f"{output_file:24}: INVALID ({result['error']})")
+            continue
+        line = f"{output_file:24}: {result['length']:>14.2f}"
+        if "gap" in result:
+            line += f"  gap {result['gap']:>7.2%}"
+        if "within_tolerance" in result:
+            ratio = result["length"] / result["reference_length"]
+            mark = "ok" if result["within_tolerance"] else "NG"
+            line += f"  {ratio:>7.3f}x {mark}"
+        print(line)
+
+
+def verify_output(
+    challenges=CHALLENGES,
+    prefixes=OUTPUT_PREFIXES,
+    reference_prefix=None,
+    tolerance=0.0,
+    num_of_workers=None,
+    lower_bound=False,
+) -> list[dict]:
+    results = verify_pairs(challenge_pairs(challenges, prefixes), num_of_workers)
+    if reference_prefix is not None:
+        check_tolerance(results, reference_prefix, tolerance)
+    if lower_bound:
+        add_lower_bounds(results, num_of_workers)
+    # 全ての課題と解法の出力が揃っているとは限らないので、ない出力は飛ばす
+    print_report(results, skip_missing=True)
+    return results
 
 
 if __name__ == "__main__":
-    verify_output()
+    parser = argparse.ArgumentParser(
+        description="出力ファイルが巡回路になっているか確かめる"
+    )
+    parser.add_argument(
+        "pairs", nargs="*", help="入力ファイルと出力ファイルを交互に並べたもの"
+    )
+    parser.add_argument("--challenges", type=int, default=CHALLENGES)
+    parser.add_argument("--prefixes", nargs="+", default=list(OUTPUT_PREFIXES))
+    parser.add_argument(
+        "--reference", help="長さを比べる基準の出力ファイルのprefix(例: sample/sa)"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.0,
+        help="基準より長くてもよい割合(0.05なら5%%まで)",
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--lower-bound",
+        action="store_true",
+        help="Held-Karpの下界を求め、下界に対する長さの比(gap)を表示する",
+    )
+    parser.add_argument("--json", help="結果をJSONで書くファイル(-なら標準出力)")
+    args = parser.parse_args()
+
+    # 指定した組の出力がなければ失敗にし、既定の組(challenge_pairs)ならない出力は飛ばす
+    skip_missing = not args.pairs
+    if args.pairs:
+        assert len(args.pairs) % 2 == 0, "give input and output files in pairs"
+        pairs = list(zip(args.pairs[0::2], args.pairs[1::2]))
+    else:
+        pairs = challenge_pairs(args.challenges, args.prefixes)
+    results = verify_pairs(pairs, args.workers)
+    if args.reference is not None:
+        check_tolerance(results, args.reference, args.tolerance)
+    if args.lower_bound:
+        add_lower_bounds(results, args.workers)
+    if args.json != "-":
+        print_report(results, skip_missing)
+
+    if args.json == "-":
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    elif args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    # CIで使えるように、巡回路でない出力か基準を満たさない出力があれば失敗にする
+    sys.exit(0 if is_ok(results, skip_missing) else 1)
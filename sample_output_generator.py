@@ -1,20 +1,14 @@
 #!/usr/bin/env python3
 
-from common import format_tour, read_input
-
-import solver_greedy
-import solver_random
+from batch_runner import run_batch
 
 CHALLENGES = 7
 
 
 def generate_sample_output():
-    for i in range(CHALLENGES):
-        cities = read_input(f'input_{i}.csv')
-        for solver, name in ((solver_random, 'random'), (solver_greedy, 'greedy')):
-            tour = solver.solve(cities)
-            with open(f'sample/{name}_{i}.csv', 'w') as f:
-                f.write(format_tour(tour) + '\n')
+    input_files = [f'input_{i}.csv' for i in range(CHALLENGES)]
+    for name in ('random', 'greedy'):
+        run_batch(input_files, name, output_pattern='sample/{solver}_{index}.csv')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+import sys
+
+import instrumentation
+import solver_exact
+import solver_ga
+import solver_greedy
+import solver_greedy_edge
+import solver_hilbert
+import solver_random
+import solver_sa
+import solver_segmented_area
+import update_solver_greedy_with_2opt
+from anytime import Budget
+from common import print_tour, read_input
+from distance_oracle import make_distance
+from lin_kernighan import lin_kernighan
+from local_search import NUM_OF_NEIGHBORS, or_opt, two_opt
+
+# solveで使う解法の既定値
+DEFAULT_SOLVER = "local_search"
+# 都市数がこれ以下なら、改善する解法の代わりに厳密解法(solver_exact)を使う
+EXACT_LIMIT = 16
+# 構築法. 比較のための基準なので、都市数が少なくても厳密解法に置き換えない
+CONSTRUCTION_SOLVERS = ("random", "greedy", "greedy_edge", "hilbert")
+# 近傍NUM_OF_NEIGHBORS都市のリストを使う解法. solveにneighborsを渡すと作り直さない
+NEIGHBOR_SOLVERS = ("greedy_edge", "local_search", "multi_start", "sa", "ga")
+
+
+def solve_local_search(cities, budget, num_of_workers=None, neighbors=None):
+    """辺の貪欲法で作った巡回路を2opt、Or-opt、Lin-Kernighan法で改善する"""
+    dist = make_distance(cities)
+    if neighbors is not None:
+        dist.set_neighbor_lists(neighbors, NUM_OF_NEIGHBORS)
+    with instrumentation.phase("construction"):
+        # 構築と改善で同じ近傍リストを使う
+        tour = solver_greedy_edge.solve(
+            cities, neighbors=dist.neighbor_lists(NUM_OF_NEIGHBORS)
+        )
+    budget.report(dist.tour_length(tour))
+    for optimize in (two_opt, or_opt, lin_kernighan):
+        tour = optimize(tour, dist, budget=budget)
+        budget.report(dist.tour_length(tour))
+    return tour
+
+
+def solve_multi_start(cities, budget, num_of_workers=None, neighbors=None):
+    tour, _ = update_solver_greedy_with_2opt.multi_start(
+        cities, num_of_workers=num_of_workers, budget=budget, neighbors=neighbors
+    )
+    return tour
+
+
+# 解法の名前から、(cities, budget, num_of_workers, neighbors)を受け取って巡回路を返す関数を引く
+# 構築法はすぐに終わるので予算を見ない. num_of_workersはプロセスプールを使う解法だけが、
+# neighbors(近傍リスト. Noneなら解法が作る)はNEIGHBOR_SOLVERSだけが使う
+SOLVERS = {
+    "random": lambda cities, budget, num_of_workers, neighbors: solver_random.solve(
+        cities
+    ),
+    "greedy": lambda cities, budget, num_of_workers, neighbors: solver_greedy.solve(
+        cities
+    ),
+    "greedy_edge": lambda cities, budget, num_of_workers, neighbors: (
+        solver_greedy_edge.solve(cities, neighbors=neighbors)
+    ),
+    "hilbert": lambda cities, budget, num_of_workers, neighbors: solver_hilbert.solve(
+        cities
+    ),
+    "exact": lambda cities, budget, num_of_workers, neighbors: solver_exact.solve(
+        cities
+    ),
+    "local_search": solve_local_search,
+    "multi_start": solve_multi_start,
+    "sa": lambda cities, budget, num_of_workers, neighbors: solver_sa.solve(
+        cities, budget=budget, neighbors=neighbors
+    ),
+    "ga": lambda cities, budget, num_of_workers, neighbors: solver_ga.solve(
+        cities, num_of_workers=num_of_workers, budget=budget, neighbors=neighbors
+    ),
+    "segmented": lambda cities, budget, num_of_workers, neighbors: (
+        solver_segmented_area.solve(
+            cities, num_of_workers=num_of_workers, budget=budget
+        )
+    ),
+}
+
+
+def solve(
+    cities,
+    solver=DEFAULT_SOLVER,
+    time_limit=None,
+    max_iterations=None,
+    callback=None,
+    num_of_workers=None,
+    neighbors=None,
+):
+    """
+    解法を名前で選び、時間と反復回数の上限の中で巡回路を求める
+
+    上限に達した場合も、それまでに見つかった最も短い巡回路を返す.
+    都市数がEXACT_LIMIT以下なら、構築法以外は厳密解法で最適な巡回路を求める.
+
+    Args:
+        cities: 都市のxy座標
+        solver (str): SOLVERSに登録した解法の名前
+        time_limit (float): 秒数. Noneなら時間で打ち切らない
+        max_iterations (int): 反復回数. Noneなら回数で打ち切らない
+        callback (Callable): 最も短い長さが更新された時に
+            callback(長さ, 反復回数, 経過秒数)として呼ぶ関数
+        num_of_workers (int): プロセスプールを使う解法のワーカーの数. Noneならコア数
+        neighbors: 近い順に並べた近傍NUM_OF_NEIGHBORS都市の配列(N×k.
+            instance_cache.load_neighborsで読んだものなど). Noneなら解法が作る
+
+    Returns:
+        list[int]: 巡回路
+    """
+    if solver not in SOLVERS:
+        raise ValueError(f"unknown solver: {solver} (choose from {list(SOLVERS)})")
+    if len(cities) <= EXACT_LIMIT and solver not in CONSTRUCTION_SOLVERS:
+        solver = "exact"
+    budget = Budget(time_limit, max_iterations, callback)
+    with instrumentation.phase(solver):
+        return SOLVERS[solver](cities, budget, num_of_workers, neighbors)
+
+
+if __name__ == "__main__":
+    # 使い方: solver_anytime.py 入力ファイル [解法の名前] [秒数]
+    assert len(sys.argv) > 1
+    solver = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_SOLVER
+    time_limit = float(sys.argv[3]) if len(sys.argv) > 3 else None
+    tour = solve(
+        read_input(sys.argv[1]),
+        solver,
+        time_limit,
+        callback=lambda length, iterations, elapsed: print(
+            f"{elapsed:8.2f}s {iterations:>10} {length:.2f}", file=sys.stderr
+        ),
+    )
+    print_tour(tour)
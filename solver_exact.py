@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+import sys
+
+import numpy as np
+
+from common import print_tour, read_input
+from distance_oracle import DenseDistance
+
+# 厳密に解く最大の都市数. 表の大きさは2^(N-1)×(N-1)になる(20都市で約90MB)
+MAX_CITIES = 20
+
+
+def popcounts(num_of_bits: int) -> np.ndarray:
+    """0から2^num_of_bits - 1までの各整数で、1になっているビットの数"""
+    masks = np.arange(1 << num_of_bits)
+    counts = np.zeros(1 << num_of_bits, dtype=np.int8)
+    for bit in range(num_of_bits):
+        counts += (masks >> bit) & 1
+    return counts
+
+
+def held_karp(matrix: np.ndarray) -> tuple[float, list[int]]:
+    """
+    動的計画法(Held-Karp)で最短の巡回路を厳密に求める
+
+    都市0から出発し、都市1~N-1のうち集合maskの都市を全て訪れて都市jにいる時の
+    最短の長さをcost[mask, j-1]とする. 訪れた都市の数が同じmaskをまとめて、
+    直前の都市kについての最小値をNumPyで計算する. 直前の都市はprev[mask, j-1]に残す.
+
+    Args:
+        matrix (np.ndarray): N×Nの距離行列
+
+    Returns:
+        tuple[float, list[int]]: 最短の長さと、都市0から始まる巡回路
+    """
+    N = len(matrix)
+    if N <= 3:
+        tour = list(range(N))
+        return float(sum(matrix[tour[i - 1], tour[i]] for i in range(N))), tour
+    if N > MAX_CITIES:
+        raise ValueError(f"held_karp is for at most {MAX_CITIES} cities, got {N}")
+
+    M = N - 1
+    # dist[k, j]は都市k+1と都市j+1の距離
+    dist = np.asarray(matrix, dtype=np.float64)[1:, 1:]
+    cost = np.full((1 << M, M), np.inf)
+    prev = np.full((1 << M, M), -1, dtype=np.int8)
+    cost[1 << np.arange(M), np.arange(M)] = matrix[0, 1:]
+
+    counts = popcounts(M)
+    masks_by_size = [np.flatnonzero(counts == size) for size in range(M + 1)]
+    for size in range(2, M + 1):
+        masks = masks_by_size[size]
+        for j in range(M):
+            masks_j = masks[(masks >> j) & 1 == 1]
+            # jに来る直前にいた都市kについて最小値を取る(maskにないkはinf)
+            candidates = cost[masks_j ^ (1 << j)] + dist[:, j]
+            best = np.argmin(candidates, axis=1)
+            cost[masks_j, j] = candidates[np.arange(len(masks_j)), best]
+            prev[masks_j, j] = best
+
+    full = (1 << M) - 1
+    total = cost[full] + matrix[1:, 0]
+    j = int(np.argmin(total))
+    length = float(total[j])
+
+    # 最後の都市から直前の都市をたどって巡回路を復元する
+    path = []
+    mask = full
+    while j >= 0:
+        path.append(j + 1)
+        mask, j = mask ^ (1 << j), int(prev[mask, j])
+    return length, [0] + path[::-1]
+
+
+def solve(cities) -> list[int]:
+    if len(cities) == 0:
+        return []
+    _, tour = held_karp(DenseDistance(cities).matrix)
+    return tour
+
+
+if __name__ == "__main__":
+    assert len(sys.argv) > 1
+    tour = solve(read_input(sys.argv[1]))
+    print_tour(tour)
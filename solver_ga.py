@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+
+import math
+import os
+import random
+import sys
+from multiprocessing import Pool
+
+import instrumentation
+from anytime import Budget
+from common import print_tour, read_input
+from distance_oracle import make_distance
+from lin_kernighan import lin_kernighan
+from local_search import EPS, NUM_OF_NEIGHBORS, or_opt, two_opt
+from solver_greedy import nearest_neighbor_tour
+from solver_greedy_edge import solve as greedy_edge_tour
+
+# 遺伝的アルゴリズムに使う秒数
+TIME_LIMIT = 60.0
+# 集団の大きさ
+POPULATION_SIZE = 30
+# 親の組1つから作る子の数(子ごとに別のABサイクルを使う)
+NUM_OF_CHILDREN = 10
+# 時間の上限のうち、初期集団を作るのに使ってよい割合. 超えたらそれまでに作った巡回路で始める
+INITIAL_POPULATION_RATIO = 0.5
+# 並列に親の組を処理する時に、1つのタスクでまとめて渡す組の数
+CHUNK_SIZE = 1
+
+# ワーカープロセスごとの距離と近傍リスト
+_worker_dist = None
+
+
+def to_adjacency(tour: list[int]) -> list[list[int]]:
+    """巡回路を、各都市につながる2都市のリストに変換する"""
+    adjacency = [None] * len(tour)
+    for i, city in enumerate(tour):
+        adjacency[city] = [tour[i - 1], tour[(i + 1) % len(tour)]]
+    return adjacency
+
+
+def to_tour(adjacency: list[list[int]]) -> list[int]:
+    """1つの巡回路を表す隣接リストから、都市0から始まる巡回路を作る"""
+    tour = [0]
+    prev_city, city = 0, adjacency[0][1]
+    while city != 0:
+        tour.append(city)
+        next_city = adjacency[city][0]
+        if next_city == prev_city:
+            next_city = adjacency[city][1]
+        prev_city, city = city, next_city
+    return tour
+
+
+def ab_cycles(adjacency_a, adjacency_b, rng) -> list[list[int]]:
+    """
+    親Aと親Bの片方にだけある辺を、Aの辺とBの辺が交互に並ぶ閉路(ABサイクル)に分解する
+
+    Aにだけある辺とBにだけある辺をランダムに交互にたどり、同じ都市に
+    同じ向きで戻ってきたら、その間をABサイクルとして取り出す.
+
+    Returns:
+        list[list[int]]: ABサイクル. [p0, p1, ..., p(2k-1)]で、
+        (p0, p1), (p2, p3), ...がAの辺、(p1, p2), ..., (p(2k-1), p0)がBの辺
+    """
+    N = len(adjacency_a)
+    only_a = [
+        [city for city in adjacency_a[i] if city not in adjacency_b[i]]
+        for i in range(N)
+    ]
+    only_b = [
+        [city for city in adjacency_b[i] if city not in adjacency_a[i]]
+        for i in range(N)
+    ]
+    cycles = []
+    for start in range(N):
+        while only_a[start]:
+            path = [start]
+            # (都市, 経路の位置の偶奇) -> 経路の位置
+            positions = {(start, 0): 0}
+            while len(path) > 1 or only_a[start]:
+                city = path[-1]
+                # 経路の位置が偶数ならAの辺、奇数ならBの辺をたどる
+                remaining = only_a if len(path) % 2 == 1 else only_b
+                if not remaining[city]:
+                    break
+                next_city = remaining[city].pop(rng.randrange(len(remaining[city])))
+                remaining[next_city].remove(city)
+                key = (next_city, len(path) % 2)
+                if key in positions:
+                    # 同じ向きで戻ってきたので、その間をABサイクルとして取り出す
+                    i = positions[key]
+                    # Aの辺から始まるように並べる
+                    cycle = path[i:] if i % 2 == 0 else path[i + 1 :] + [path[i]]
+                    cycles.append(cycle)
+                    for j in range(i + 1, len(path)):
+                        del positions[(path[j], j % 2)]
+                    del path[i + 1 :]
+                else:
+                    positions[key] = len(path)
+                    path.append(next_city)
+    return cycles
+
+
+def replace_link(adjacency, changed, city: int, old: int, new: int) -> None:
+    """cityとoldの辺をcityとnewの辺に置き換える. 変える前の隣接リストをchangedに残す"""
+    if city not in changed:
+        changed[city] = list(adjacency[city])
+    links = adjacency[city]
+    links[links.index(old)] = new
+
+
+def apply_ab_cycle(adjacency, cycle: list[int], dist, changed) -> float:
+    """
+    親Aの隣接リストから、ABサイクルのAの辺を取り除いてBの辺を加える
+
+    結果は1つの巡回路とは限らず、いくつかの部分巡回路に分かれる.
+
+    Returns:
+        float: 辺の長さの合計の変化
+    """
+    delta = 0.0
+    for i in range(0, len(cycle), 2):
+        city_1, city_2 = cycle[i], cycle[i + 1]
+        delta -= dist(city_1, city_2)
+        for city, other in ((city_1, city_2), (city_2, city_1)):
+            if city not in changed:
+                changed[city] = list(adjacency[city])
+            adjacency[city].remove(other)
+    for i in range(1, len(cycle), 2):
+        city_1, city_2 = cycle[i], cycle[(i + 1) % len(cycle)]
+        delta += dist(city_1, city_2)
+        adjacency[city_1].append(city_2)
+        adjacency[city_2].append(city_1)
+    return delta
+
+
+def find_subtours(adjacency) -> tuple[list[int], dict[int, list[int]]]:
+    """
+    Returns:
+        tuple[list[int], dict[int, list[int]]]: 各都市が属する部分巡回路の番号と、
+        部分巡回路の番号から都市のリストを引く辞書
+    """
+    labels = [-1] * len(adjacency)
+    subtours = {}
+    for start in range(len(adjacency)):
+        if labels[start] >= 0:
+            continue
+        label, members = len(subtours), []
+        city = start
+        while labels[city] < 0:
+            labels[city] = label
+            members.append(city)
+            next_city = adjacency[city][0]
+            if labels[next_city] >= 0:
+                next_city = adjacency[city][1]
+            city = next_city
+        subtours[label] = members
+    return labels, subtours
+
+
+def merge_subtours(adjacency, dist, neighbors, changed) -> float:
+    """
+    部分巡回路を1つの巡回路にまとめる
+
+    最も小さい部分巡回路の辺(u, u2)と、uの近傍vを含む別の部分巡回路の辺(v, v2)を外し、
+    (u, v), (u2, v2)または(u, v2), (u2, v)をつなぐ. 長さが最も短くなるものを選ぶ.
+
+    Returns:
+        float: 辺の長さの合計の変化
+    """
+    labels, subtours = find_subtours(adjacency)
+    delta = 0.0
+    while len(subtours) > 1:
+        label = min(subtours, key=lambda label: len(subtours[label]))
+        members = subtours.pop(label)
+        best = None
+        for u in members:
+            for u2 in adjacency[u]:
+                dist_u = dist(u, u2)
+                for v in neighbors[u]:
+                    if labels[v] == label:
+                        continue
+                    for v2 in adjacency[v]:
+                        removed = dist_u + dist(v, v2)
+                        for w, w2 in ((v, v2), (v2, v)):
+                            diff = dist(u, w) + dist(u2, w2) - removed
+                            if best is None or diff < best[0]:
+                                best = (diff, u, u2, v, v2, w, w2)
+        if best is None:
+            # 近傍に別の部分巡回路の都市がなければ、最も近い都市につなぐ
+            u = members[0]
+            row = dist.row(u)
+            v = min(
+                (city for city in range(len(adjacency)) if labels[city] != label),
+                key=lambda city: row[city],
+            )
+            u2, v2 = adjacency[u][0], adjacency[v][0]
+            diff = dist(u, v) + dist(u2, v2) - dist(u, u2) - dist(v, v2)
+            best = (diff, u, u2, v, v2, v, v2)
+        diff, u, u2, v, v2, w, w2 = best
+        # (u, u2), (v, v2)を外して(u, w), (u2, w2)をつなぐ
+        replace_link(adjacency, changed, u, u2, w)
+        replace_link(adjacency, changed, u2, u, w2)
+        replace_link(adjacency, changed, w, w2, u)
+        replace_link(adjacency, changed, w2, w, u2)
+        delta += diff
+        for city in members:
+            labels[city] = labels[v]
+        subtours[labels[v]] += members
+    return delta
+
+
+def eax(tour_a, tour_b, dist, neighbors, num_of_children, rng):
+    """
+    辺を受け継ぐ交叉(EAX)で、親Aと親Bから子を作る
+
+    子ごとにABサイクルを1つ選び、Aに適用してから部分巡回路をまとめる.
+    子はAの隣接リストを書き換えて作り、長さの変化だけを求めたら元に戻す.
+    最も短い子だけを巡回路に直す.
+
+    Args:
+        tour_a (list[int]): 親A
+        tour_b (list[int]): 親B
+        dist (DistanceOracle): 都市間の距離
+        neighbors (list[list[int]]): 近傍リスト
+        num_of_children (int): 作る子の数
+        rng (random.Random): 乱数
+
+    Returns:
+        tuple[list[int], list[int]] | None: 最も短い子と、Aから辺が変わった都市.
+        Aより短い子がなければNone
+    """
+    adjacency = to_adjacency(tour_a)
+    cycles = ab_cycles(adjacency, to_adjacency(tour_b), rng)
+    rng.shuffle(cycles)
+    best_delta, best_links = -EPS, None
+    for cycle in cycles[:num_of_children]:
+        changed = {}
+        delta = apply_ab_cycle(adjacency, cycle, dist, changed)
+        delta += merge_subtours(adjacency, dist, neighbors, changed)
+        if delta < best_delta:
+            best_delta = delta
+            best_links = {city: list(adjacency[city]) for city in changed}
+        for city, links in changed.items():
+            adjacency[city] = links
+    if best_links is None:
+        return None
+    for city, links in best_links.items():
+        adjacency[city] = links
+    return to_tour(adjacency), list(best_links)
+
+
+def make_offspring(dist, tour_a, tour_b, seed, num_of_children=NUM_OF_CHILDREN):
+    """
+    親の組から子を作り、辺が変わった都市の周りを2opt、Or-optで改善する
+
+    Returns:
+        tuple[float, list[int]] | None: 子の長さと子. Aより短い子がなければNone
+    """
+    neighbors = dist.neighbor_lists(NUM_OF_NEIGHBORS)
+    offspring = eax(
+        tour_a, tour_b, dist, neighbors, num_of_children, random.Random(seed)
+    )
+    if offspring is None:
+        return None
+    tour, changed = offspring
+    tour = two_opt(tour, dist, active=changed)
+    tour = or_opt(tour, dist, active=changed)
+    return dist.tour_length(tour), tour
+
+
+def initial_tour(dist, start_city: int):
+    """
+    初期集団の巡回路を作る. start_cityが負なら辺の貪欲法、それ以外は最近傍法で作り、
+    2opt、Or-optで改善する
+    """
+    if start_city < 0:
+        tour = greedy_edge_tour(
+            dist.coords.tolist(), neighbors=dist.neighbor_lists(NUM_OF_NEIGHBORS)
+        )
+    else:
+        tour = nearest_neighbor_tour(dist.coords.tolist(), start_city)
+    tour = or_opt(two_opt(tour, dist), dist)
+    return dist.tour_length(tour), tour
+
+
+def _init_worker(coords, neighbors):
+    global _worker_dist
+    _worker_dist = make_distance(coords)
+    _worker_dist.set_neighbor_lists(neighbors, NUM_OF_NEIGHBORS)
+
+
+def _run_in_worker(task):
+    is_recording, function, *args = task
+    return instrumentation.call_recorded(is_recording, function, _worker_dist, *args)
+
+
+def run_tasks(pool, dist, function, tasks):
+    """
+    function(dist, *task)をタスクごとに実行し、結果をtasksと同じ順に返す
+
+    記録中なら、ワーカーで記録した段階と回数を結果を受け取るたびに加える.
+    """
+    if pool is None:
+        return (function(dist, *task) for task in tasks)
+    is_recording = instrumentation.current() is not None
+    results = pool.imap(
+        _run_in_worker, [(is_recording, function, *task) for task in tasks], CHUNK_SIZE
+    )
+    return (instrumentation.collect(result) for result in results)
+
+
+def solve(
+    cities,
+    time_limit=TIME_LIMIT,
+    population_size=POPULATION_SIZE,
+    num_of_workers=None,
+    seed=0,
+    budget=None,
+    neighbors=None,
+):
+    """
+    EAXを使った遺伝的アルゴリズム
+
+    1. 辺の貪欲法と、始点を変えた最近傍法の巡回路を2opt、Or-optで改善して初期集団にする
+       (時間の上限のINITIAL_POPULATION_RATIOの割合を超えたら、それまでに作ったものを使う)
+    2. 集団をランダムに並べ、i番目を親A、i+1番目を親Bとして子を作る
+    3. 子がAより短く、集団に同じ長さの巡回路がなければAと入れ替える
+    4. 予算を使い切るか、1世代の間に入れ替えがなくなるまで2, 3を繰り返す
+    5. 最も短い巡回路を、残りの予算でLin-Kernighan法で改善する
+
+    子を作って改善する処理はプロセスプールで並列に行う. タスクごとに送るのは親の組だけで、
+    距離はワーカーごとに1回だけ作り、近傍リストは親で求めたものをワーカーに渡す.
+
+    Args:
+        cities: 都市のxy座標
+        time_limit (float): 秒数
+        population_size (int): 集団の大きさ
+        num_of_workers (int): ワーカーの数. Noneならコア数. 1なら並列化しない
+        seed (int): 乱数のシード
+        budget (Budget): 予算. 指定した場合はtime_limitの代わりに使う.
+            1世代を1回の反復として数え、最も短い長さが更新されるとbudget.reportで知らせる
+        neighbors: 近い順に並べた近傍NUM_OF_NEIGHBORS都市の配列(N×k). 指定すると作り直さない
+
+    Returns:
+        list[int]: 最も短い巡回路
+    """
+    dist = make_distance(cities)
+    if neighbors is not None:
+        dist.set_neighbor_lists(neighbors, NUM_OF_NEIGHBORS)
+    N = len(dist)
+    if N < 8:
+        return or_opt(two_opt(greedy_edge_tour(cities), dist), dist)
+    if budget is None:
+        budget = Budget(time_limit)
+    elif not budget.is_bounded():
+        budget = Budget(time_limit, callback=budget.callback)
+    if num_of_workers is None:
+        num_of_workers = os.cpu_count() or 1
+    rng = random.Random(seed)
+    initial_time_limit = math.inf
+    if budget.time_limit is not None:
+        initial_time_limit = budget.time_limit * INITIAL_POPULATION_RATIO
+    population_size = max(min(population_size, N), 2)
+    # 始点を都市の番号全体から均等に選ぶ. -1は辺の貪欲法
+    start_cities = [-1] + [
+        i * N // (population_size - 1) for i in range(population_size - 1)
+    ]
+
+    pool = None
+    if num_of_workers > 1:
+        pool = Pool(
+            num_of_workers,
+            _init_worker,
+            (dist.coords, dist.neighbor_lists(NUM_OF_NEIGHBORS)),
+        )
+    try:
+        with instrumentation.phase("initial_population"):
+            # ワーカーの数ずつ作り、時間を超えたら残りは作らない(2つは必ず作る)
+            population = []
+            for i in range(0, len(start_cities), num_of_workers):
+                if len(population) >= 2 and budget.elapsed() >= initial_time_limit:
+                    break
+                tasks = [(city,) for city in start_cities[i : i + num_of_workers]]
+                population += run_tasks(pool, dist, initial_tour, tasks)
+        population.sort(key=lambda member: member[0])
+        budget.report(population[0][0])
+        instrumentation.sample(population[0][0])
+
+        while budget.check() and budget.remaining() != 0:
+            with instrumentation.phase("generation"):
+                order = list(range(len(population)))
+                rng.shuffle(order)
+                tasks = [
+                    (
+                        population[order[i]][1],
+                        population[order[(i + 1) % len(order)]][1],
+                        rng.randrange(1 << 30),
+                    )
+                    for i in range(len(order))
+                ]
+                lengths = {length for length, _ in population}
+                num_of_replaced = 0
+                results = run_tasks(pool, dist, make_offspring, tasks)
+                for index, offspring in zip(order, results):
+                    instrumentation.count("ga.offspring")
+                    if offspring is not None:
+                        length, tour = offspring
+                        # 同じ長さの巡回路が集団に増えないようにして、多様性を保つ
+                        if (
+                            length < population[index][0] - EPS
+                            and length not in lengths
+                        ):
+                            lengths.add(length)
+                            population[index] = (length, tour)
+                            num_of_replaced += 1
+                            budget.report(length)
+                    if budget.remaining() == 0:
+                        break
+            instrumentation.count("ga.replaced", num_of_replaced)
+            instrumentation.sample(min(length for length, _ in population))
+            if num_of_replaced == 0:
+                break
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    with instrumentation.phase("final_optimization"):
+        tour = lin_kernighan(min(population)[1], dist, budget=budget)
+    budget.report(dist.tour_length(tour))
+    return tour
+
+
+if __name__ == "__main__":
+    assert len(sys.argv) > 1
+    time_limit = float(sys.argv[2]) if len(sys.argv) > 2 else TIME_LIMIT
+    tour = solve(read_input(sys.argv[1]), time_limit)
+    print_tour(tour)
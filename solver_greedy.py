@@ -1,35 +1,52 @@
 #!/usr/bin/env python3
 
 import sys
-import math
 
 from common import print_tour, read_input
-
-
-def distance(city1, city2):
-    return math.sqrt((city1[0] - city2[0]) ** 2 + (city1[1] - city2[1]) ** 2)
-
-
-def solve(cities):
-    N = len(cities)
-
-    dist = [[0] * N for i in range(N)]
-    for i in range(N):
-        for j in range(i, N):
-            dist[i][j] = dist[j][i] = distance(cities[i], cities[j])
-
-    current_city = 0
-    unvisited_cities = set(range(1, N))
+from spatial_index import GridIndex
+
+
+def nearest_neighbor_tour(cities, start_city=0, city_ids=None, end_city=None):
+    """
+    グリッドを使った貪欲法(最近傍法)
+
+    訪問した都市はグリッドから取り除き、次の都市は今いる都市のセルから
+    外側へ1リングずつ探す. 一様な入力では1都市あたり平均20セルほどを調べるだけだが、
+    1都市ずつPythonで探すので、10万都市では2秒ほどかかる.
+
+    Args:
+        cities: 全ての都市のxy座標
+        start_city (int): 始点の都市のid
+        city_ids (list[int]): 経路に含める都市のid. Noneなら全ての都市
+        end_city (int): 終点を固定する場合はその都市のid
+
+    Returns:
+        list[int]: start_cityから始まる経路(end_cityを指定した場合はそこで終わる)
+    """
+    if city_ids is None:
+        city_ids = range(len(cities))
+    unvisited_cities = [
+        city for city in city_ids if city != start_city and city != end_city
+    ]
+    grid = GridIndex(cities, city_ids=unvisited_cities)
+
+    current_city = start_city
     tour = [current_city]
 
-    while unvisited_cities:
-        next_city = min(unvisited_cities, key=lambda city: dist[current_city][city])
-        unvisited_cities.remove(next_city)
+    for _ in range(len(unvisited_cities)):
+        next_city = grid.nearest(current_city)
+        grid.remove(next_city)
         tour.append(next_city)
         current_city = next_city
+    if end_city is not None:
+        tour.append(end_city)
     return tour
 
 
+def solve(cities):
+    return nearest_neighbor_tour(cities)
+
+
 if __name__ == "__main__":
     assert len(sys.argv) > 1
     tour = solve(read_input(sys.argv[1]))
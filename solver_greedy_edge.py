@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+import sys
+
+import numpy as np
+
+from common import print_tour, read_input
+from spatial_index import GridIndex, build_neighbor_lists
+
+# 候補の辺を作る時の1都市あたりの近傍の数
+NUM_OF_NEIGHBORS = 10
+
+
+class UnionFind:
+    """辺を追加して閉路ができるかどうかを調べるためのUnion-Find"""
+
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+        self.size = [1] * n
+
+    def find(self, x: int) -> int:
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        # 経路圧縮
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, x: int, y: int) -> bool:
+        """xとyの集合をまとめる. すでに同じ集合ならFalseを返す"""
+        x, y = self.find(x), self.find(y)
+        if x == y:
+            return False
+        if self.size[x] < self.size[y]:
+            x, y = y, x
+        self.parent[y] = x
+        self.size[x] += self.size[y]
+        return True
+
+
+def candidate_edges(cities, num_of_neighbors: int, neighbors=None) -> np.ndarray:
+    """
+    近傍リストから候補の辺を作り、短い順に並べる
+
+    neighborsを渡した場合は、近傍リストを作らずに各行の先頭num_of_neighbors都市を使う.
+
+    Returns:
+        np.ndarray: 候補の辺の両端の都市のid. 形はM×2
+    """
+    N = len(cities)
+    if neighbors is None:
+        neighbors = build_neighbor_lists(cities, num_of_neighbors)
+    neighbors = np.asarray(neighbors).reshape(N, -1)[:, :num_of_neighbors]
+    city_1 = np.repeat(np.arange(N), neighbors.shape[1])
+    city_2 = neighbors.ravel()
+    # 向きを揃えて重複する辺を取り除く
+    edges = np.unique(
+        np.stack([np.minimum(city_1, city_2), np.maximum(city_1, city_2)], axis=1),
+        axis=0,
+    )
+    coords = np.asarray(cities, dtype=np.float64)
+    diff = coords[edges[:, 0]] - coords[edges[:, 1]]
+    order = np.argsort(np.hypot(diff[:, 0], diff[:, 1]), kind="stable")
+    return edges[order]
+
+
+def join_fragments(cities, adjacency: list[list[int]]) -> list[int]:
+    """
+    貪欲法で作ったパスの断片を、端点同士を近い順につないで1つの巡回路にする
+
+    Args:
+        cities: 都市のxy座標
+        adjacency (list[list[int]]): adjacency[i]は都市iとつながっている都市(2つまで)
+
+    Returns:
+        list[int]: 巡回路
+    """
+    # 閉路はできていないので、断片はすべて端点を2つ(1都市だけなら1つ)持つパス
+    endpoints = [city for city in range(len(cities)) if len(adjacency[city]) < 2]
+    grid = GridIndex(cities, city_ids=endpoints)
+
+    tour = []
+    current_city = endpoints[0]
+    while True:
+        # 断片をたどり、もう一方の端点まで進む
+        fragment_start = current_city
+        grid.remove(current_city)
+        prev_city = -1
+        tour.append(current_city)
+        while True:
+            next_city = next(
+                (city for city in adjacency[current_city] if city != prev_city), -1
+            )
+            if next_city == -1:
+                break
+            prev_city, current_city = current_city, next_city
+            tour.append(current_city)
+        if current_city != fragment_start:
+            grid.remove(current_city)
+        if grid.num_of_cities == 0:
+            break
+        # もう一方の端点から最も近い、別の断片の端点へ進む
+        current_city = grid.nearest(current_city)
+    return tour
+
+
+def solve(cities, num_of_neighbors=NUM_OF_NEIGHBORS, neighbors=None):
+    """
+    貪欲法(辺を短い順に追加する方法)
+
+    近傍リストから作った候補の辺を短い順に見て、両端の次数が2未満で、
+    追加しても閉路ができない(Union-Findで判定)ものだけを追加する.
+    最後に残ったパスの断片を端点同士でつなぐ.
+
+    Args:
+        cities: 都市のxy座標
+        num_of_neighbors (int): 候補の辺を作る時の1都市あたりの近傍の数
+        neighbors: 近い順に並べた近傍リスト(instance_cache.load_neighborsで読んだものなど).
+            Noneなら作る
+
+    Returns:
+        list[int]: 巡回路
+    """
+    N = len(cities)
+    if N < 4:
+        return list(range(N))
+
+    degree = [0] * N
+    adjacency = [[] for _ in range(N)]
+    union_find = UnionFind(N)
+    num_of_edges = 0
+    for city_1, city_2 in candidate_edges(cities, num_of_neighbors, neighbors).tolist():
+        if degree[city_1] >= 2 or degree[city_2] >= 2:
+            continue
+        if not union_find.union(city_1, city_2):
+            continue
+        degree[city_1] += 1
+        degree[city_2] += 1
+        adjacency[city_1].append(city_2)
+        adjacency[city_2].append(city_1)
+        num_of_edges += 1
+        if num_of_edges == N - 1:
+            break
+
+    return join_fragments(cities, adjacency)
+
+
+if __name__ == "__main__":
+    assert len(sys.argv) > 1
+    tour = solve(read_input(sys.argv[1]))
+    print_tour(tour)
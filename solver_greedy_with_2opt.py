@@ -1,195 +1,239 @@
 #!/usr/bin/env python3
 
 import sys
-import math
-
-from common import print_tour, read_input
 
+import numpy as np
 
-class LineSegment:
-    def __init__(self, point_1, point_2):
-        self.point_1 = point_1
-        self.point_2 = point_2
-        self.min_x = min(point_1[0], point_2[0])
-        self.min_y = min(point_1[1], point_2[1])
-        self.max_x = max(point_1[0], point_2[0])
-        self.max_y = max(point_1[1], point_2[1])
-        (
-            self.is_y_axis_parallel,
-            self.slope,
-            self.intercept,
-        ) = self.cal_line_slope_and_intercept()
-
-    def cal_line_slope_and_intercept(self) -> list[bool, float]:
-        """
-        2点が与えられた時、その2点を結ぶ直線の傾きとy切片を返す
-        ただし、座標軸に並行な直線の入力はないとする
-
-        Args:
-            point_1 (list[float]): 座標
-            point_2 (list[float]): 座標
-            self (LineSegment):
-
-        Returns:
-            list[bool, float]: 直線が座標軸に並行かどうか,直線の傾きとy切片
-            is_y_axis_parallel (bool): 直線がy軸に並行ならTrue,それ以外はFalse
-            slope (float): 直線の傾き.ただしy軸に並行な場合はNoneを返す
-            intercept (float): y切片.  ただし、y軸に並行な場合はx切片を返す
-        """
-
-        x_1, y_1 = self.point_1[0], self.point_1[1]
-        x2, y2 = self.point_2[0], self.point_2[1]
-        if x2 - x_1 == 0:
-            return [True, None, x_1]
-        slope = (y2 - y_1) / (x2 - x_1)
-        intercept = y_1 - slope * x_1
-        return [False, slope, intercept]
-
-    # 線分同士の交差判定
-    def is_cross(self, other) -> bool:
-        """
-        線分同士が交差するか判定
-
-        Args:
-            self (LineSegment): 線分を表すインスタンス
-            other (LineSegment): 線分を表すインスタンス
-
-        Returns:
-            bool: 線分同士が交差すればTrueを、それ以外はFalseを返す
-        """
-
-        # selfがy軸に並行な場合
-        if self.is_y_axis_parallel:
-            x_intercept = self.intercept
-            # selfの直線に関して、逆またはselfの直線と重なるかどうか
-            if other.min_x > x_intercept or other.max_x < x_intercept:
-                return False
-            else:
-                # x = intercept のyの値で交差するか判定
-                # otherはy軸に並行ではない
-                # 交点のy座標がself上にあるか
-                cross_point_y = other.slope * x_intercept + other.intercept
-                if self.min_y <= cross_point_y and cross_point_y <= self.max_y:
-                    return True
-                else:
-                    return False
-
-        # selfがy軸に並行でない場合
-        else:
-            # selfに関して、逆またはselfの直線と重なるかどうか
-            if (other.point_1[1] - self.slope * other.point_1[0] - self.intercept) * (
-                other.point_2[1] - self.slope * other.point_2[0] - self.intercept
-            ) > 0:
-                return False
-
-            else:
-                # otherがy軸に並行な場合
-                if other.is_y_axis_parallel:
-                    x_intercept = other.intercept
-                    cross_point_y = self.slope * x_intercept + self.intercept
-                    # 交点のy座標がself上にあるか
-                    if cross_point_y <= self.y_max and self.y_min <= cross_point_y:
-                        return True
-                    else:
-                        return False
-                # self, otherどちらもy軸に並行でない場合
-                else:
-                    cross_point_x = -(self.intercept - other.intercept) / (
-                        self.slope - other.slope
-                    )
-                    # 交点のx座標がself上にあるか
-                    if self.min_x <= cross_point_x and cross_point_x <= self.max_x:
-                        return True
-                    else:
-                        return False
-
-
-def distance(city_1, city_2):
-    return math.sqrt((city_1[0] - city_2[0]) ** 2 + (city_1[1] - city_2[1]) ** 2)
+from common import print_tour, read_input
+from distance_oracle import make_distance
+from solver_greedy import nearest_neighbor_tour
+from tour import make_tour, two_opt_move
+
+# 浮動小数点の誤差で交差と判定しないための閾値
+EPS = 1e-9
+# 1本の辺を登録するセルの最大の数. これより多くのセルにまたがる長い辺は、全ての辺と直接判定する
+MAX_CELLS_PER_EDGE = 16
+# 長い辺と全ての辺の組を判定する時に、まとめて作る組の最大の数(使うメモリを抑えるため)
+MAX_PAIRS_PER_CHUNK = 1 << 20
+
+
+def orientation(p, q, r) -> np.ndarray:
+    """点p→q→rの向き. 反時計回りなら正、時計回りなら負、一直線なら0(配列でまとめて計算する)"""
+    return (q[..., 0] - p[..., 0]) * (r[..., 1] - p[..., 1]) - (
+        q[..., 1] - p[..., 1]
+    ) * (r[..., 0] - p[..., 0])
+
+
+def segments_cross(p1, p2, q1, q2) -> np.ndarray:
+    """
+    線分p1-p2と線分q1-q2が端点以外の1点で交差するかをまとめて判定する
+
+    互いの線分の両端が、もう一方の線分を含む直線の反対側にあれば交差する.
+    端点を共有する場合や、一直線上で重なる場合は交差としない.
+    """
+    d1, d2 = orientation(q1, q2, p1), orientation(q1, q2, p2)
+    d3, d4 = orientation(p1, p2, q1), orientation(p1, p2, q2)
+    return (d1 * d2 < 0) & (d3 * d4 < 0)
+
+
+def group_pairs(keys: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """
+    同じkeyを持つvalueの組(順不同、重複なし)を全て列挙する
+
+    keyで並べ替えたうえで、各要素とそれより後ろにある同じkeyの要素の組を
+    np.repeatでまとめて作るので、Pythonのループを使わない.
+
+    Returns:
+        np.ndarray: 形がM×2の配列. 各行はvalueの組
+    """
+    order = np.argsort(keys, kind="stable")
+    keys, values = keys[order], values[order]
+    n = len(keys)
+    # 各要素が属するグループの終わりの位置
+    is_last = np.r_[keys[1:] != keys[:-1], True]
+    group_end = np.flatnonzero(is_last) + 1
+    end = np.repeat(group_end, np.diff(np.r_[0, group_end]))
+    counts = end - np.arange(n) - 1
+    total = int(counts.sum())
+    left = np.repeat(np.arange(n), counts)
+    # 各要素の組の相手は、その要素の次の位置から順に並ぶ
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    right = left + 1 + offsets
+    return np.stack([values[left], values[right]], axis=1)
+
+
+def crossing_edges(cities, tour) -> np.ndarray:
+    """
+    巡回路の中で交差している辺の組を、グリッドに分けた辺の索引で求める
+
+    辺i(tour[i]からtour[i+1]へ向かう辺)を、外接矩形が重なるグリッドのセル全てに登録し、
+    同じセルに入った辺の組だけを交差判定する. セルは1つあたり平均2都市ほどの大きさにするので、
+    短い辺が多い巡回路ではほぼO(N log N)で求まる.
+    MAX_CELLS_PER_EDGEより多くのセルにまたがる長い辺はセルに登録せず、全ての辺と直接判定する.
+    ランダムな巡回路のように長い辺ばかりの場合でも、O(N^2)の判定で済む.
+
+    Args:
+        cities: 都市のxy座標
+        tour (list[int]): 巡回路
+
+    Returns:
+        np.ndarray: 形がM×2の配列. 各行は交差している辺の番号の組(i < j)
+    """
+    N = len(tour)
+    if N < 4:
+        return np.empty((0, 2), dtype=np.int64)
+    coords = np.asarray(cities, dtype=np.float64).reshape(-1, 2)
+    order = np.asarray(tour)
+    start, end = coords[order], coords[np.roll(order, -1)]
+
+    low = coords[order].min(axis=0)
+    width, height = np.maximum(coords[order].max(axis=0) - low, 1e-9)
+    # spatial_index.GridIndexと同じく、一直線に近い巡回路でもセルの数がO(N)になるように、
+    # セルの辺は長い方の辺をセルの数で等分した長さより小さくしない
+    num_of_cells = max(N // 2, 1)
+    cell_size = max(
+        np.sqrt(width * height / num_of_cells), max(width, height) / num_of_cells, 1e-9
+    )
+    cols = int(width / cell_size) + 1
+    rows = int(height / cell_size) + 1
+    lower = ((np.minimum(start, end) - low) / cell_size).astype(np.int64)
+    upper = ((np.maximum(start, end) - low) / cell_size).astype(np.int64)
+    lower = np.minimum(lower, [cols - 1, rows - 1])
+    upper = np.minimum(upper, [cols - 1, rows - 1])
+
+    span_x = upper[:, 0] - lower[:, 0] + 1
+    span_y = upper[:, 1] - lower[:, 1] + 1
+    num_of_cells = span_x * span_y
+    is_long = num_of_cells > MAX_CELLS_PER_EDGE
+    found = [np.empty((0, 2), dtype=np.int64)]
+
+    # 短い辺を、外接矩形が重なる全てのセルに登録する
+    short_ids = np.flatnonzero(~is_long)
+    counts = num_of_cells[short_ids]
+    edge_ids = np.repeat(short_ids, counts)
+    k = np.arange(len(edge_ids)) - np.repeat(np.cumsum(counts) - counts, counts)
+    cell_x = lower[edge_ids, 0] + k % span_x[edge_ids]
+    cell_y = lower[edge_ids, 1] + k // span_x[edge_ids]
+    if len(edge_ids) > 0:
+        pairs = group_pairs(cell_y * cols + cell_x, edge_ids)
+        # 2つのセルにまたがる組は何度も現れるので、重複を取り除く
+        pairs = np.unique(np.sort(pairs, axis=1), axis=0)
+        i, j = pairs[:, 0], pairs[:, 1]
+        found.append(pairs[segments_cross(start[i], end[i], start[j], end[j])])
+
+    # 長い辺は全ての辺と判定する. 長い辺同士の組は番号の小さい方からだけ数える
+    long_ids = np.flatnonzero(is_long)
+    chunk_size = max(1, MAX_PAIRS_PER_CHUNK // N)
+    for first in range(0, len(long_ids), chunk_size):
+        ids = long_ids[first : first + chunk_size]
+        is_cross = segments_cross(
+            start[ids, None], end[ids, None], start[None], end[None]
+        )
+        is_cross &= ~is_long[None, :] | (np.arange(N)[None, :] > ids[:, None])
+        i, j = np.nonzero(is_cross)
+        found.append(np.sort(np.stack([ids[i], j], axis=1), axis=1))
+
+    return np.unique(np.concatenate(found), axis=0)
 
 
 def solver_greedy(cities, start_city=0, visited_cities=[]):
-    N = len(cities)
-
-    dist = [[0] * N for i in range(N)]
-    for i in range(N):
-        for j in range(i, N):
-            dist[i][j] = dist[j][i] = distance(cities[i], cities[j])
-
-    current_city = start_city
-    unvisited_cities = set(range(1, N))
-    if start_city != 0:
-        unvisited_cities.remove(start_city)
-    # visited_cities[0]は0でunvisited_citiesに存在しない
-    for visited_city in visited_cities[1:]:
-        unvisited_cities.remove(visited_city)
-    tour = [current_city]
-
-    while unvisited_cities:
-        next_city = min(unvisited_cities, key=lambda city: dist[current_city][city])
-        unvisited_cities.remove(next_city)
-        tour.append(next_city)
-        current_city = next_city
-    return tour
-
-
-def count_cross(tour, cities):
-    num_of_cross = 0
-    for idx, city in enumerate(tour):
-        if idx + 1 >= len(tour):
-            # 交差ほどき完了
+    """
+    start_cityから最近傍法で巡回路を作る. 都市0とvisited_cities[1:]の都市は訪問済みとして除く
+
+    次の都市はグリッド(solver_greedy.nearest_neighbor_tour)で探すので、距離行列は作らない.
+    """
+    is_visited = np.zeros(len(cities), dtype=bool)
+    is_visited[0] = True
+    # visited_cities[0]は0で訪問済み
+    is_visited[visited_cities[1:]] = True
+    is_visited[start_city] = False
+    city_ids = np.flatnonzero(~is_visited).tolist()
+    return nearest_neighbor_tour(cities, start_city, city_ids)
+
+
+def count_cross(tour, cities) -> int:
+    """巡回路の中で交差している辺の組の数"""
+    return len(crossing_edges(cities, tour))
+
+
+def uncross(cities, tour, dist=None, max_rounds=None):
+    """
+    交差している辺の組を2optのつなぎ替えでほどく
+
+    交差している辺の組をまとめて求め、それぞれを4本の辺の長さの差分で評価して、
+    短くなるものだけをつなぎ替える. つなぎ替えで新しい交差ができることがあるので、
+    交差がなくなるか改善しなくなるまで繰り返す.
+
+    Args:
+        cities: 都市のxy座標
+        tour (list[int]): 巡回路
+        dist (DistanceOracle): 都市間の距離. Noneなら作る
+        max_rounds (int): 繰り返す最大の回数. Noneなら制限しない
+
+    Returns:
+        list[int]: 交差をほどいた巡回路
+    """
+    if dist is None:
+        dist = make_distance(cities)
+    tour = list(tour)
+    num_of_rounds = 0
+    while max_rounds is None or num_of_rounds < max_rounds:
+        num_of_rounds += 1
+        pairs = crossing_edges(dist.coords, tour)
+        if len(pairs) == 0:
+            break
+        # 辺は都市の組で覚えておく(つなぎ替えると番号がずれるため)
+        edges = [
+            (tour[i], tour[(i + 1) % len(tour)], tour[j], tour[(j + 1) % len(tour)])
+            for i, j in pairs.tolist()
+        ]
+        current = make_tour(tour, len(dist))
+        is_improved = False
+        for city1, city2, city3, city4 in edges:
+            # 同じ巡目の前のつなぎ替えで、辺がなくなっていれば飛ばす
+            if city2 not in (current.next(city1), current.prev(city1)):
+                continue
+            if city4 not in (current.next(city3), current.prev(city3)):
+                continue
+            # city2がcity1のnext、city4がcity3のnextになるように向きを揃える
+            if current.next(city1) != city2:
+                city1, city2 = city2, city1
+            if current.next(city3) != city4:
+                city3, city4 = city4, city3
+            if len({city1, city2, city3, city4}) < 4:
+                continue
+            # city1とcity3を,city2とcity4をつなぐ
+            diff = dist.two_opt_delta(city1, city2, city3, city4)
+            if diff < -EPS:
+                two_opt_move(current, city1, city2, city3, city4)
+                is_improved = True
+        tour = current.to_list()
+        if not is_improved:
             break
-        line = LineSegment(cities[city], cities[tour[idx + 1]])
-        idx += 2
+    return tour
 
-        # あるcityとその次のcityを繋いだ線と交差する線があるか見ていく
-        while idx < len(tour) - 2:
-            line_other = LineSegment(cities[tour[idx]], cities[tour[idx + 1]])
-            if line.is_cross(line_other):
-                num_of_cross += 1
-            idx += 1
 
-    return num_of_cross
+def solve(cities, tour=None):
+    """
+    貪欲法で作った巡回路の交差をほどく
 
+    Args:
+        cities: 都市のxy座標
+        tour (list[int]): 初期の巡回路. Noneなら貪欲法で作る
 
-# 交差する点同士を交換する時に、交換してスコアがよくなるなら交換、そうでないならその交差は飛ばす
-def solve(cities, tour, min_path_length, ans=[]):
-    N = len(cities)
-    for i, city in enumerate(tour):
-        if i >= len(tour) - 3:
-            break
-        line = LineSegment(cities[city], cities[tour[i + 1]])
-        # あるcityとその次のcityを繋いだ線と交差する線があるか見ていく
-        for j in range(i + 2, len(tour) - 1):
-            line_other = LineSegment(cities[tour[j]], cities[tour[j + 1]])
-            if line.is_cross(line_other):
-                # city1とcity3を,city2とcity4をつなぐ
-                new_tour = (
-                    tour[: i + 1]
-                    + [city for city in reversed(tour[i + 1 : j + 1])]
-                    + tour[j + 1 :]
-                )
-                all_tour = ans + new_tour
-                path_length = sum(
-                    distance(cities[all_tour[i]], cities[all_tour[(i + 1) % N]])
-                    for i in range(N)
-                )
-                if path_length < min_path_length:
-                    min_path_length = path_length
-                    ans += new_tour[: i + 1]
-                    tour = new_tour[i + 1 :]
-                    return solve(cities, tour, min_path_length, ans)
-    ans = ans + tour
-    return ans
+    Returns:
+        list[int]: 巡回路
+    """
+    if tour is None:
+        tour = solver_greedy(cities)
+    return uncross(cities, tour)
 
 
 if __name__ == "__main__":
     assert len(sys.argv) > 1
     cities = read_input(sys.argv[1])
-    N = len(cities)
     tour = solver_greedy(cities)
-    min_path_length = sum(
-        distance(cities[tour[i]], cities[tour[(i + 1) % N]]) for i in range(N)
-    )
-    tour = solve(cities, tour, min_path_length)
+    print("crossings before", count_cross(tour, cities), file=sys.stderr)
+    tour = solve(cities, tour)
+    print("crossings after", count_cross(tour, cities), file=sys.stderr)
     print_tour(tour)
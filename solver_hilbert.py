@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+import sys
+
+import numpy as np
+
+from common import print_tour, read_input
+
+# ヒルベルト曲線の次数(各軸を2**HILBERT_ORDER個に区切る)
+HILBERT_ORDER = 16
+
+
+def hilbert_index(cities, order=HILBERT_ORDER) -> np.ndarray:
+    """
+    各都市のヒルベルト曲線上の位置を求める
+
+    都市を囲む正方形を2**order×2**orderの格子に区切り、
+    各都市が入る格子の曲線上の番号を全都市まとめて計算する.
+
+    Args:
+        cities: 都市のxy座標
+        order (int): ヒルベルト曲線の次数
+
+    Returns:
+        np.ndarray: index[i]は都市iの曲線上の位置
+    """
+    coords = np.asarray(cities, dtype=np.float64).reshape(-1, 2)
+    n = 1 << order
+    low = coords.min(axis=0)
+    # 縦横の比を変えないように、長い方の辺に合わせた正方形で区切る
+    width = max(float((coords.max(axis=0) - low).max()), 1e-9)
+    grid = ((coords - low) * ((n - 1) / width)).astype(np.int64)
+    x, y = grid[:, 0], grid[:, 1]
+
+    index = np.zeros(len(coords), dtype=np.int64)
+    s = n >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        index += s * s * ((3 * rx) ^ ry)
+        # 部分曲線の向きに合わせて座標を回転させる
+        flip = ~ry & rx
+        x = np.where(flip, n - 1 - x, x)
+        y = np.where(flip, n - 1 - y, y)
+        x, y = np.where(ry, x, y), np.where(ry, y, x)
+        s >>= 1
+    return index
+
+
+def solve(cities):
+    """
+    ヒルベルト曲線の順に都市をたどる巡回路を作る
+
+    並べ替えだけなのでO(N log N)で、巨大な入力でもすぐに巡回路が得られる.
+    最近傍法より1割ほど長いが、2optなどの初期解として使える.
+
+    Args:
+        cities: 都市のxy座標
+
+    Returns:
+        list[int]: 巡回路
+    """
+    if len(cities) == 0:
+        return []
+    return np.argsort(hilbert_index(cities), kind="stable").tolist()
+
+
+if __name__ == "__main__":
+    assert len(sys.argv) > 1
+    tour = solve(read_input(sys.argv[1]))
+    print_tour(tour)
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+
+import math
+import random
+import sys
+
+import instrumentation
+from anytime import Budget
+from common import print_tour, read_input
+from distance_oracle import make_distance
+from local_search import EPS, NUM_OF_NEIGHBORS, or_move, or_opt, two_opt
+from solver_greedy_edge import solve as greedy_edge_tour
+from tour import make_tour, two_opt_move
+
+# 焼きなましに使う秒数
+TIME_LIMIT = 10.0
+# 温度を更新する間隔(反復回数)
+CHECK_INTERVAL = 256
+# 平均的な悪化する移動をこの確率で受け入れるように初期温度を決める
+INITIAL_ACCEPTANCE = 0.1
+# 最終温度の初期温度に対する比
+FINAL_TEMPERATURE_RATIO = 1e-3
+# Or-optで動かす区間の最大の長さ
+MAX_SEGMENT_LENGTH = 3
+# 移動のうちOr-optを選ぶ割合
+OR_OPT_RATIO = 0.3
+# 時間の上限がある場合に、焼きなましに使う時間の割合(残りは最後の2opt、Or-optに使う)
+ANNEALING_TIME_RATIO = 0.9
+
+
+def geometric_cooling(t_start: float, t_end: float, progress: float) -> float:
+    """温度を指数的に下げる"""
+    return t_start * (t_end / t_start) ** progress
+
+
+def linear_cooling(t_start: float, t_end: float, progress: float) -> float:
+    """温度を直線的に下げる"""
+    return t_start + (t_end - t_start) * progress
+
+
+def lundy_mees_cooling(t_start: float, t_end: float, progress: float) -> float:
+    """序盤に早く温度を下げ、終盤にゆっくり下げる"""
+    beta = (t_start - t_end) / (t_start * t_end)
+    return t_start / (1 + beta * t_start * progress)
+
+
+COOLING_SCHEDULES = {
+    "geometric": geometric_cooling,
+    "linear": linear_cooling,
+    "lundy_mees": lundy_mees_cooling,
+}
+
+
+def estimate_temperature(tour, dist, neighbors, rng, num_of_samples=1000) -> float:
+    """ランダムな2optの移動で悪化する量の平均から初期温度を決める"""
+    current = make_tour(tour, len(dist))
+    worse = []
+    for _ in range(num_of_samples):
+        city_a = rng.choice(tour)
+        city_c = rng.choice(neighbors[city_a])
+        city_b, city_d = current.next(city_a), current.next(city_c)
+        delta = (
+            dist(city_a, city_c)
+            + dist(city_b, city_d)
+            - dist(city_a, city_b)
+            - dist(city_c, city_d)
+        )
+        if delta > EPS:
+            worse.append(delta)
+    if not worse:
+        return 1.0
+    return -sum(worse) / len(worse) / math.log(INITIAL_ACCEPTANCE)
+
+
+@instrumentation.timed("simulated_annealing")
+def simulated_annealing(
+    tour,
+    dist,
+    time_limit=TIME_LIMIT,
+    max_iterations=None,
+    cooling="geometric",
+    initial_temperature=None,
+    final_temperature=None,
+    num_of_neighbors=NUM_OF_NEIGHBORS,
+    seed=0,
+    budget=None,
+):
+    """
+    焼きなまし法
+
+    ランダムな都市とその近傍リストの都市から、2optまたはOr-optの移動を1つ作る.
+    移動で変化する辺は高々3本なので長さの差分はO(1)で計算でき、
+    改善する移動は必ず、悪化する移動は確率exp(-差分/温度)で受け入れる.
+    経路の長さは差分を足していくだけで管理し、最も短かった経路を返す.
+
+    Args:
+        tour (list[int]): 初期経路(どの構築法で作ったものでもよい)
+        dist (DistanceOracle): 都市間の距離
+        time_limit (float): 使う秒数. max_iterationsを指定した場合は使わない
+        max_iterations (int): 反復回数. 指定した場合は時間ではなく反復回数で温度を下げるので、
+            同じseedなら結果が再現する
+        cooling (str | Callable): 冷却スケジュール. COOLING_SCHEDULESの名前か、
+            (初期温度, 最終温度, 進み具合0~1)から温度を返す関数
+        initial_temperature (float): 初期温度. Noneなら初期経路から決める
+        final_temperature (float): 最終温度. Noneなら初期温度のFINAL_TEMPERATURE_RATIO倍
+        num_of_neighbors (int): 移動先の候補にする近傍の数
+        seed (int): 乱数のシード
+        budget (Budget): 探索の予算. 指定した場合はtime_limitとmax_iterationsの代わりに使い、
+            最も短い長さが更新されるとbudget.reportで知らせる
+
+    Returns:
+        list[int]: 初期経路より長くならない経路
+    """
+    if budget is None:
+        # 反復回数を指定した場合は、時刻によらずに温度が決まるように時間の上限を使わない
+        if max_iterations is not None:
+            time_limit = None
+        budget = Budget(time_limit, max_iterations)
+    if not budget.is_bounded():
+        raise ValueError("焼きなましには時間か反復回数の上限が必要です")
+    N = len(tour)
+    if N < MAX_SEGMENT_LENGTH + 5:
+        return list(tour)
+    rng = random.Random(seed)
+    neighbors = dist.neighbor_lists(num_of_neighbors)
+    schedule = COOLING_SCHEDULES[cooling] if isinstance(cooling, str) else cooling
+    t_start = initial_temperature or estimate_temperature(tour, dist, neighbors, rng)
+    t_end = final_temperature or t_start * FINAL_TEMPERATURE_RATIO
+
+    current = make_tour(tour, len(dist))
+    current_length = dist.tour_length(tour)
+    best_tour, best_length = list(tour), current_length
+    # 今の経路が最も短い経路と同じならTrue. そこから悪化する時だけ経路を保存する
+    is_best = True
+
+    budget.report(best_length)
+    recorder = instrumentation.current()
+    if recorder is not None:
+        recorder.sample(current_length)
+    evaluated = applied = 0
+    temperature = t_start
+    iteration = 0
+    while budget.check():
+        if iteration % CHECK_INTERVAL == 0:
+            temperature = schedule(t_start, t_end, budget.progress())
+            budget.report(best_length)
+        iteration += 1
+
+        city_a = tour[rng.randrange(N)]
+        city_c = neighbors[city_a][rng.randrange(len(neighbors[city_a]))]
+        if city_c not in current:
+            continue
+
+        if rng.random() >= OR_OPT_RATIO:
+            # 2opt: 辺(a, b), (c, d)を辺(a, c), (b, d)につなぎ替える
+            city_b, city_d = current.next(city_a), current.next(city_c)
+            if city_c == city_b or city_d == city_a:
+                continue
+            delta = (
+                dist(city_a, city_c)
+                + dist(city_b, city_d)
+                - dist(city_a, city_b)
+                - dist(city_c, city_d)
+            )
+            move = (two_opt_move, current, city_a, city_b, city_c, city_d)
+        else:
+            # Or-opt: aから始まる区間を、辺(c, d)の間に移す
+            first = last = city_a
+            segment = {city_a}
+            for _ in range(rng.randrange(MAX_SEGMENT_LENGTH)):
+                last = current.next(last)
+                segment.add(last)
+            city_d = current.next(city_c)
+            if city_c in segment or city_d in segment:
+                continue
+            prev_city, next_city = current.prev(first), current.next(last)
+            is_reversed = rng.random() < 0.5
+            if is_reversed:
+                added = dist(city_c, last) + dist(first, city_d)
+            else:
+                added = dist(city_c, first) + dist(last, city_d)
+            delta = (
+                added
+                + dist(prev_city, next_city)
+                - dist(prev_city, first)
+                - dist(last, next_city)
+                - dist(city_c, city_d)
+            )
+            move = (or_move, current, first, last, city_c, city_d, is_reversed)
+
+        evaluated += 1
+        if delta > 0 and rng.random() >= math.exp(-delta / temperature):
+            continue
+        if delta > 0 and is_best:
+            best_tour, best_length = current.to_list(), current_length
+        move[0](*move[1:])
+        current_length += delta
+        applied += 1
+        if recorder is not None:
+            recorder.improve(delta)
+        if current_length < best_length:
+            best_length, is_best = current_length, True
+        elif delta > 0:
+            is_best = False
+
+    budget.report(best_length)
+    if recorder is not None:
+        recorder.count("simulated_annealing.evaluated", evaluated)
+        recorder.count("simulated_annealing.applied", applied)
+        recorder.sample(best_length)
+    return current.to_list() if is_best else best_tour
+
+
+def solve(cities, time_limit=TIME_LIMIT, seed=0, budget=None, neighbors=None):
+    """
+    貪欲法で作った巡回路を焼きなまし法で改善し、最後に2opt、Or-optで仕上げる
+
+    時間の上限がある場合は、ANNEALING_TIME_RATIOの割合を焼きなましに、残りを仕上げに使う.
+
+    Args:
+        cities: 都市のxy座標
+        time_limit (float): 全体で使う秒数
+        seed (int): 乱数のシード
+        budget (Budget): 全体の予算. 指定した場合はtime_limitの代わりに使う
+        neighbors: 近い順に並べた近傍NUM_OF_NEIGHBORS都市の配列(N×k). 指定すると作り直さない
+
+    Returns:
+        list[int]: 巡回路
+    """
+    # 初期経路を作る時間も含めて上限を守るように、予算は最初に作る
+    if budget is None:
+        budget = Budget(time_limit)
+    elif not budget.is_bounded():
+        # 焼きなましには上限が必要なので、上限のない予算ならtime_limitを使う
+        budget = Budget(time_limit, callback=budget.callback)
+    dist = make_distance(cities)
+    if neighbors is not None:
+        dist.set_neighbor_lists(neighbors, NUM_OF_NEIGHBORS)
+    with instrumentation.phase("construction"):
+        # 構築と焼きなましで同じ近傍リストを使う
+        tour = greedy_edge_tour(cities, neighbors=dist.neighbor_lists(NUM_OF_NEIGHBORS))
+    if budget.remaining() is None:
+        # 反復回数だけの予算は焼きなましで使い切るので、仕上げは予算なしで最後まで行う
+        tour = simulated_annealing(tour, dist, seed=seed, budget=budget)
+        final_budget = None
+    else:
+        # 焼きなましで見つかった長さは全体の予算を通して知らせる
+        annealing_budget = Budget(
+            budget.remaining() * ANNEALING_TIME_RATIO,
+            callback=lambda length, *_: budget.report(length),
+        )
+        tour = simulated_annealing(tour, dist, seed=seed, budget=annealing_budget)
+        final_budget = budget
+    with instrumentation.phase("final_optimization"):
+        tour = two_opt(tour, dist, budget=final_budget)
+        tour = or_opt(tour, dist, budget=final_budget)
+    budget.report(dist.tour_length(tour))
+    return tour
+
+
+if __name__ == "__main__":
+    assert len(sys.argv) > 1
+    tour = solve(read_input(sys.argv[1]))
+    print_tour(tour)
@@ -1,308 +1,296 @@
 #!/usr/bin/env python3
 
-import math
-from common import print_tour, read_input
+import os
+import time
+from multiprocessing import Pool
+import numpy as np
+import instrumentation
+from anytime import Budget
+from common import read_input
+from distance_oracle import as_coords, make_distance
+from distance_oracle import tour_length as cal_tour_length
+from lin_kernighan import lin_kernighan
+from local_search import or_opt, two_opt
+from solver_greedy import nearest_neighbor_tour
+from solver_hilbert import hilbert_index
 import sys
 
-
-def distance(city_1: list[float], city_2: list[float]) -> float:
-    return math.sqrt((city_1[0] - city_2[0]) ** 2 + (city_1[1] - city_2[1]) ** 2)
+# 都市数がこれを超える場合はN×Nの距離行列を作らず、必要な時に距離を計算する
+DIST_MATRIX_LIMIT = 4096
+# 近傍リストに含める都市の数
+NUM_OF_NEIGHBORS = 10
+# 1つの領域に含める都市の最大の数. これを超える領域はさらに2分割する
+MAX_CITIES_PER_REGION = 1000
+# 境界の端点を選ぶ時に、隣の領域に近い順に候補とする都市の数
+NUM_OF_BOUNDARY_CANDIDATES = 32
+# 統合後に調べ直す、領域のつなぎ目から経路に沿って前後それぞれの都市の数
+SEAM_WINDOW = 20
+# 時間の上限がある場合に、領域ごとの経路を求めるのに使う時間の割合(残りは統合後に使う)
+REGION_TIME_RATIO = 0.8
 
 
 # すべての都市間の距離を求める
-# dist[i][j] = dist[j][i] = cities[i]とcities[j]の距離
-def cal_dist(cities: list[list[float]]) -> list[list[float]]:
-    N = len(cities)
-    dist = [[0] * N for i in range(N)]
-    for i in range(N):
-        for j in range(i, N):
-            dist[i][j] = dist[j][i] = distance(cities[i], cities[j])
-    return dist
+# 都市数が少なければ距離行列を、多ければ必要な時に距離を計算するオブジェクトを返す
+# dist[i][j] = dist(i, j) = cities[i]とcities[j]の距離
+def cal_dist(cities: list[list[float]]):
+    return make_distance(cities, dense_limit=DIST_MATRIX_LIMIT)
+
+
+def partition_cities(cities, max_cities_per_region: int) -> list[np.ndarray]:
+    """
+    各領域の都市数がmax_cities_per_region以下になるまで、領域を再帰的に2分割する
+
+    外接矩形の長い方の辺に沿って、都市数の中央値で分けるので領域の大きさは揃う.
+    分けた領域は重心のヒルベルト曲線上の順に並べ、隣り合う領域が近くなるようにする.
+
+    Args:
+        cities: 全ての都市のxy座標
+        max_cities_per_region (int): 1つの領域に含める都市の最大の数
 
+    Returns:
+        list[np.ndarray]: 各領域に属する都市のid
+    """
+    coords = as_coords(cities)
+    max_cities_per_region = max(max_cities_per_region, 1)
+    regions = []
+    stack = [np.arange(len(coords))]
+    while stack:
+        city_ids = stack.pop()
+        if len(city_ids) <= max_cities_per_region:
+            regions.append(city_ids)
+            continue
+        points = coords[city_ids]
+        axis = int(np.argmax(points.max(axis=0) - points.min(axis=0)))
+        half = len(city_ids) // 2
+        order = np.argpartition(points[:, axis], half)
+        stack.append(city_ids[order[half:]])
+        stack.append(city_ids[order[:half]])
+
+    centers = np.array([coords[city_ids].mean(axis=0) for city_ids in regions])
+    order = np.argsort(hilbert_index(centers), kind="stable")
+    return [regions[i] for i in order]
 
-def find_end_coords(cities: list[list[float]]) -> list[float]:
+
+def find_boundary_pair(cities, from_ids, to_ids, exclude_from=-1, exclude_to=-1):
     """
-    領域の端のx,y座標を算出
+    隣り合う領域の間で、距離ができるだけ短い都市の組を境界の端点として選ぶ
+
+    from_ids側はto_ids側の外接矩形に近い都市だけを候補にし、
+    候補とto_ids側の全ての都市との距離をまとめて計算する.
 
     Args:
-        cities: 都市のxy座標を要素とするリスト
+        cities: 全ての都市のxy座標
+        from_ids (np.ndarray): 経路が出ていく領域の都市のid
+        to_ids (np.ndarray): 経路が入ってくる領域の都市のid
+        exclude_from (int): from_ids側で選ばない都市(すでにその領域の始点に決まったもの)
+        exclude_to (int): to_ids側で選ばない都市(すでにその領域の終点に決まったもの)
 
     Returns:
-        list[int]: 領域の最も端の座標. [x_min, y_min, x_max, y_max]
+        tuple[int, int]: from_ids側の終点とto_ids側の始点
     """
-    x_min, y_min, x_max, y_max = (
-        10**6,
-        10**6,
-        -(10**6),
-        -(10**6),
-    )
-
-    for i in range(len(cities)):
-        if cities[i][0] < x_min:
-            x_min = cities[i][0]
-        if cities[i][1] < y_min:
-            y_min = cities[i][1]
-        if cities[i][0] > x_max:
-            x_max = cities[i][0]
-        if cities[i][1] > y_max:
-            y_max = cities[i][1]
-    return x_min, y_min, x_max, y_max
-
-
-def split_cities(cities: list[list[float]]) -> list[dict, list]:
+    coords = as_coords(cities)
+    # 1都市だけの領域は始点と終点が同じになる
+    if len(from_ids) > 1:
+        from_ids = from_ids[from_ids != exclude_from]
+    if len(to_ids) > 1:
+        to_ids = to_ids[to_ids != exclude_to]
+
+    to_points = coords[to_ids]
+    low, high = to_points.min(axis=0), to_points.max(axis=0)
+    gap = np.maximum(np.maximum(low - coords[from_ids], coords[from_ids] - high), 0)
+    num_of_candidates = min(NUM_OF_BOUNDARY_CANDIDATES, len(from_ids))
+    candidates = from_ids[
+        np.argpartition(np.hypot(gap[:, 0], gap[:, 1]), num_of_candidates - 1)[
+            :num_of_candidates
+        ]
+    ]
+    diff = coords[candidates][:, None, :] - to_points[None, :, :]
+    pair_dist = np.hypot(diff[..., 0], diff[..., 1])
+    # 領域が1つしかない場合は、同じ都市を始点と終点に選ばないようにする
+    pair_dist[candidates[:, None] == to_ids[None, :]] = np.inf
+    i, j = np.unravel_index(np.argmin(pair_dist), pair_dist.shape)
+    return int(candidates[i]), int(to_ids[j])
+
+
+def find_region_endpoints(cities, regions: list[np.ndarray]) -> list[tuple[int, int]]:
     """
-    領域を4等分し、どの領域に属すかで都市を分ける.
+    領域を並べた順に1周する時の、各領域の始点と終点を決める
 
     Returns:
-        list[dict, list]: [areas, area_segmented_cities]
-        areas (dict): 各エリアの範囲を保持した辞書. エリア番号をキー、そのエリアの範囲[xmin, xmax, ymin, ymax]を値とする
-        area_segmented_cities (list[list[int]]):  各エリアに属する都市のidを保持したリスト. インデックスをエリア番号、そのエリアに属する都市のリストを要素として持つ
+        list[tuple[int, int]]: endpoints[k]は領域kの(始点, 終点)
     """
-    N = len(cities)
-    x_min, y_min, x_max, y_max = find_end_coords(cities)
-
-    # エリアごとの範囲を設定
-    # areas: {area_number: [x_min, x_max, y_min, y_max]}
-    areas: dict = {
-        1: [
-            x_min,
-            (x_min + x_max) / 2,
-            y_min,
-            (y_min + y_max) / 2,
-        ],
-        2: [
-            (x_min + x_max) / 2,
-            x_max,
-            y_min,
-            (y_min + y_max) / 2,
-        ],
-        3: [
-            (x_min + x_max) / 2,
-            x_max,
-            (y_min + y_max) / 2,
-            y_max,
-        ],
-        4: [
-            x_min,
-            (x_min + x_max) / 2,
-            (y_min + y_max) / 2,
-            y_max,
-        ],
-    }
-
-    # インデックスをエリア番号として、そのエリアに属する都市のリストを要素として持つリスト
-    area_segmented_cities: list[list[int]] = [[] for _ in range(5)]  # インデックスの0はdummy
-    # すべての都市のidを記録したリスト
-    city_id_list: list[int] = [i for i in range(N)]
-    for area_id, area in areas.items():
-        # そのエリアに含まれる都市のidを記録したリスト
-        cities_of_area: list[int] = []
-        for city_id in city_id_list:
-            if (
-                cities[city_id][0] < area[0]
-                or cities[city_id][0] > area[1]
-                or cities[city_id][1] < area[2]
-                or cities[city_id][1] > area[3]
-            ):
-                continue
-            cities_of_area.append(city_id)
-        area_segmented_cities[area_id] = cities_of_area
-
-        # 次のエリアの都市を探すための準備
-        # すでに前のエリアにある都市は除外する
-        for city_id in cities_of_area:
-            city_id_list.remove(city_id)
-
-    return areas, area_segmented_cities
-
-
-# 境界に近い4点を見つける
-def find_boundary_points(
-    cities: list[float], areas: dict, area_segmented_cities: list[list[int]]
-) -> list[int]:
+    num_of_regions = len(regions)
+    starts, ends = [-1] * num_of_regions, [-1] * num_of_regions
+    for k in range(num_of_regions):
+        next_k = (k + 1) % num_of_regions
+        ends[k], starts[next_k] = find_boundary_pair(
+            cities, regions[k], regions[next_k], starts[k], ends[next_k]
+        )
+    return list(zip(starts, ends))
+
+
+@instrumentation.timed("region")
+def solve_region(region_cities, start: int, end: int, deadline=None) -> list[int]:
     """
-    境界に近い4つの都市を見つけ、そのidを返す
+    1つの領域の中で、始点startから終点endまでの経路を求める
+
+    都市の番号は領域の中での番号(region_citiesのインデックス)で扱う.
+    プロセスプールのワーカーで実行できるように、座標だけを受け取る.
 
     Args:
-        cities (list[float]): 都市のxy座標
-        areas (dict): エリアごとの範囲
-        area_segmented_cities (list[list[int]]): 都市をどのエリアに属するかで分けたもの
+        region_cities: 領域に属する都市のxy座標
+        start (int): 始点
+        end (int): 終点
+        deadline (float): 打ち切る時刻(time.time()の値). プロセスをまたいで比べられるように
+            絶対時刻で受け取る. Noneなら打ち切らない
+
+    Returns:
+        list[int]: startから始まりendで終わる経路
+    """
+    if start == end:
+        return [start]
+    budget = None
+    if deadline is not None:
+        budget = Budget(max(deadline - time.time(), 0.0))
+    dist = cal_dist(region_cities)
+    with instrumentation.phase("construction"):
+        path = start_end_fix_solver_greedy(range(len(dist)), dist, start, end)
+    path = two_opt(path, dist, NUM_OF_NEIGHBORS, fixed_ends=True, budget=budget)
+    path = or_opt(path, dist, NUM_OF_NEIGHBORS, fixed_ends=True, budget=budget)
+    return lin_kernighan(path, dist, NUM_OF_NEIGHBORS, fixed_ends=True, budget=budget)
+
+
+def seam_cities(
+    segmented_tours: list[list[int]], window: int = SEAM_WINDOW
+) -> list[int]:
+    """
+    各領域の経路の両端から、経路に沿ってwindow都市以内にある都市を求める
+
+    統合した経路で改善の余地があるのは、ほとんどが領域のつなぎ目の付近なので、
+    統合後はこれらの都市だけを最初に調べる.
 
     Returns:
-        list[int]: 境界に近い4つの都市のid
+        list[int]: つなぎ目の付近の都市のid
     """
-    min_left_diff, min_top_diff, min_right_diff, min_bottom_diff = (
-        10**6,
-        10**6,
-        10**6,
-        10**6,
-    )
-    left, top, right, bottom = 0, 0, 0, 0
-    left_candidates, top_candidates, right_candidates, bottom_candidates = (
-        [],
-        [],
-        [],
-        [],
-    )
-
-    for city_id in area_segmented_cities[1]:
-        left_diff = areas[1][3] - cities[city_id][1]
-        top_diff = areas[1][1] - cities[city_id][0]
-        if left_diff < min_left_diff:
-            min_left_diff = left_diff
-            left_candidates.append(city_id)
-        if top_diff < min_top_diff:
-            min_top_diff = top_diff
-            top_candidates.append(city_id)
-    # 実験の結果、エリア4、エリア2との境界に近いもののうち2個のうち、領域の端の方にあるものを選ぶと良い解が得られた
-    left = min(
-        left_candidates[-2:], key=lambda left_candidate: cities[left_candidate][0]
-    )
-    top = min(top_candidates[-2:], key=lambda top_candidate: cities[top_candidate][1])
-
-    # エリア3の都市の中でもっともエリア2に近いrightとエリア4に近いbottomを見つける
-    for city_id in area_segmented_cities[3]:
-        right_diff = cities[city_id][1] - areas[3][2]
-        bottom_diff = cities[city_id][0] - areas[3][0]
-        if right_diff < min_right_diff:
-            min_right_diff = right_diff
-            right_candidates.append(city_id)
-        if bottom_diff < min_bottom_diff:
-            min_bottom_diff = bottom_diff
-            bottom_candidates.append(city_id)
-    right = max(
-        right_candidates[-2:], key=lambda right_candidate: cities[right_candidate][0]
-    )
-    bottom = max(
-        bottom_candidates[-2:], key=lambda bottom_candidate: cities[bottom_candidate][1]
-    )
-    return left, top, right, bottom
+    cities = []
+    for tour in segmented_tours:
+        if len(tour) <= 2 * window:
+            cities += tour
+        else:
+            cities += tour[:window] + tour[-window:]
+    return cities
+
+
+def solve_regions(
+    cities, regions, endpoints, num_of_workers=None, deadline=None
+) -> list[list[int]]:
+    """
+    各領域の経路をプロセスプールで並列に求める
+
+    ワーカーには領域の都市の座標だけを送るので、送るデータの量は全体でO(N)になる.
+    deadline(time.time()の値)を過ぎたら、各領域はその時点の経路を返す.
+
+    Returns:
+        list[list[int]]: 各領域の経路(都市のidは全体での番号)
+    """
+    coords = as_coords(cities)
+    tasks = []
+    for city_ids, (start, end) in zip(regions, endpoints):
+        local_id = {city: i for i, city in enumerate(city_ids.tolist())}
+        tasks.append((coords[city_ids], local_id[start], local_id[end], deadline))
+
+    if num_of_workers is None:
+        num_of_workers = os.cpu_count() or 1
+    num_of_workers = min(num_of_workers, len(tasks))
+    if num_of_workers <= 1:
+        paths = [solve_region(*task) for task in tasks]
+    else:
+        # ワーカーの段階と回数も記録するように、記録中ならワーカーでも記録して送り返す
+        is_recording = instrumentation.current() is not None
+        with Pool(num_of_workers) as pool:
+            recorded = pool.starmap(
+                instrumentation.call_recorded,
+                [(is_recording, solve_region, *task) for task in tasks],
+                chunksize=1,
+            )
+        paths = [instrumentation.collect(result) for result in recorded]
+    return [city_ids[path].tolist() for city_ids, path in zip(regions, paths)]
 
 
 # 貪欲法: 始点と終点を固定する
 def start_end_fix_solver_greedy(cities, dist, start_city, end_city):
-    unvisited_cities = cities
-    if start_city in cities:
-        unvisited_cities.remove(start_city)
-    if end_city in cities:
-        unvisited_cities.remove(end_city)
-
-    current_city = start_city
-    tour = [current_city]
-
-    while unvisited_cities:
-        next_city = min(unvisited_cities, key=lambda city: dist[current_city][city])
-        unvisited_cities.remove(next_city)
-        tour.append(next_city)
-        current_city = next_city
-    tour.append(end_city)
-    return tour
-
-
-# 2opt
-# 領域ごとに2optを適用する際に使用尾
-# tourから最後の要素だけを抜いたものを返す(次の領域の始点と前の領域の終点が重複するため)
-def update_two_opt(tour, dist: list[list]):
-    is_updated = True
-    while is_updated:
-        is_updated = False
-        for i in range(len(tour) - 3):
-            for j in range(i + 2, len(tour) - 1):
-                # city1とcity3を,city2とcity4をつなぐ
-                diff = (dist[tour[i]][tour[j]] + dist[tour[i + 1]][tour[j + 1]]) - (
-                    dist[tour[i]][tour[i + 1]] + dist[tour[j]][tour[j + 1]]
-                )
-                if diff < 0:
-                    new_tour = (
-                        tour[: i + 1]
-                        + [city for city in reversed(tour[i + 1 : j + 1])]
-                        + tour[j + 1 :]
-                    )
-                    tour = new_tour
-                    is_updated = True
-
-    return tour[:-1]
-
-
-# 普通の2opt
-def normal_two_opt(tour, dist: list[list]):
-    is_updated = True
-    while is_updated:
-        is_updated = False
-        for i in range(len(tour) - 3):
-            for j in range(i + 2, len(tour) - 1):
-                # city1とcity3を,city2とcity4をつなぐ
-                diff = (dist[tour[i]][tour[j]] + dist[tour[i + 1]][tour[j + 1]]) - (
-                    dist[tour[i]][tour[i + 1]] + dist[tour[j]][tour[j + 1]]
-                )
-                if diff < 0:
-                    new_tour = (
-                        tour[: i + 1]
-                        + [city for city in reversed(tour[i + 1 : j + 1])]
-                        + tour[j + 1 :]
-                    )
-                    tour = new_tour
-                    is_updated = True
-
-    return tour
+    return nearest_neighbor_tour(dist.coords.tolist(), start_city, cities, end_city)
 
 
 # 大元の関数
-def solve(original_cities: list[float]) -> list[int]:
+def solve(
+    original_cities: list[float],
+    max_cities_per_region: int = MAX_CITIES_PER_REGION,
+    num_of_workers: int = None,
+    budget: Budget = None,
+) -> list[int]:
     """
-    1. 領域を四等分する
-    2. 領域の境界に近い4点を見つける
-    3. それらを始点、終点として、各領域で最適経路を求める(貪欲法で初期経路を設定、2optを適用)
-    4. 各領域の最適経路を統合
-    5. 統合後の経路に2optを適用
+    1. 各領域の都市数がmax_cities_per_region以下になるまで、領域を再帰的に2分割する
+    2. 隣り合う領域の間で近い都市の組を見つけ、各領域の始点、終点にする
+    3. 各領域で始点から終点までの経路を並列に求める
+       (貪欲法で初期経路を設定、2opt、Or-opt、Lin-Kernighan法を適用)
+    4. 各領域の経路を統合
+    5. 統合後の経路に、つなぎ目の付近から2opt、Or-opt、Lin-Kernighan法を適用
 
     Args:
         original_cities (list[float]): 全ての都市のxy座標
+        max_cities_per_region (int): 1つの領域に含める都市の最大の数
+        num_of_workers (int): 領域の経路を求めるワーカーの数. Noneならコア数
+        budget (Budget): 予算. 時間の上限がある場合はREGION_TIME_RATIOの割合を
+            領域ごとの経路に、残りを統合後の改善に使う
 
     Returns:
         list[int]: 最適化した経路
     """
+    if len(original_cities) == 0:
+        return []
     # 都市間の距離を求める
     dist = cal_dist(original_cities)
 
-    # 領域を4等分し、どのエリアに属すかで都市を分ける.
-    areas, area_segmented_cities = split_cities(original_cities)
-    # 4等分した境界付近の都市を見つける
-    left, top, right, bottom = find_boundary_points(
-        original_cities, areas, area_segmented_cities
-    )
-
-    # エリアごとに始点、終点を定める
-    start_end_cities = {
-        1: [left, top],
-        2: [top, right],
-        3: [right, bottom],
-        4: [bottom, left],
-    }
-
-    # エリアごとに始点と終点を固定して貪欲法で経路を見つける
-    segmented_tours = [[] for i in range(5)]
-    for area, cities in enumerate(area_segmented_cities):
-        if area == 0:
-            continue
-        start_city, end_city = start_end_cities[area]
-        tour = start_end_fix_solver_greedy(cities, dist, start_city, end_city)
-        tour = update_two_opt(tour, dist)
-        segmented_tours[area] = tour
-
-    # 分割した経路をつなげる
-    merged_tour = []
-    for area, tour in enumerate(segmented_tours):
-        merged_tour += tour
-
-    # 全体で2optをしてみる
-    merged_tour = normal_two_opt(merged_tour, dist)
-    tour_length = sum(
-        dist[merged_tour[i]][merged_tour[(i + 1) % len(merged_tour)]]
-        for i in range(len(merged_tour))
-    )
-
-    print("tour_length", tour_length)
+    with instrumentation.phase("partition"):
+        # 領域を再帰的に分割し、隣り合う領域が続くように並べる
+        regions = partition_cities(dist.coords, max_cities_per_region)
+        # 隣り合う領域の境界付近の都市を、各領域の始点、終点にする
+        endpoints = find_region_endpoints(dist.coords, regions)
+
+    # 領域ごとに始点と終点を固定して経路を見つける
+    deadline = None
+    if budget is not None and budget.remaining() is not None:
+        deadline = time.time() + budget.remaining() * REGION_TIME_RATIO
+    with instrumentation.phase("regions"):
+        segmented_tours = solve_regions(
+            dist.coords, regions, endpoints, num_of_workers, deadline
+        )
+
+    with instrumentation.phase("merge"):
+        # 分割した経路をつなげる
+        merged_tour = []
+        for tour in segmented_tours:
+            merged_tour += tour
+        # つなぎ目の付近の都市から調べ始め、改善があった所だけ周りへ広げていく
+        seam = seam_cities(segmented_tours)
+    if budget is not None:
+        budget.report(dist.tour_length(merged_tour))
+    with instrumentation.phase("final_optimization"):
+        # 2optをしてみる
+        merged_tour = two_opt(
+            merged_tour, dist, NUM_OF_NEIGHBORS, active=seam, budget=budget
+        )
+        # 2optで改善できなくなったら、Or-optで区間を移動してみる
+        merged_tour = or_opt(
+            merged_tour, dist, NUM_OF_NEIGHBORS, active=seam, budget=budget
+        )
+        # 最後にLin-Kernighan法でより深いつなぎ替えを探す
+        merged_tour = lin_kernighan(
+            merged_tour, dist, NUM_OF_NEIGHBORS, active=seam, budget=budget
+        )
+    if budget is not None:
+        budget.report(dist.tour_length(merged_tour))
     return merged_tour
 
 
@@ -310,4 +298,4 @@ if __name__ == "__main__":
     assert len(sys.argv) > 1
     cities = read_input(sys.argv[1])
     tour = solve(cities)
-    # print_tour(tour)
+    print("tour_length", cal_tour_length(cities, tour))
@@ -0,0 +1,177 @@
+import heapq
+import math
+
+import numpy as np
+
+
+class GridIndex:
+    """
+    一様グリッドによる空間インデックス
+
+    平面を1セルあたり平均 cities_per_cell 個の都市が入るように格子状に区切り、
+    各セルに属する都市のidを保持する.
+    近傍探索はクエリ点を含むセルから外側へ1リングずつ広げていく.
+    """
+
+    def __init__(
+        self,
+        cities: list[list[float]],
+        cities_per_cell: int = 2,
+        city_ids: list[int] = None,
+    ):
+        # NumPyの配列(メモリマップした座標など)は要素を1つずつ取り出すと遅いので、リストにする
+        if isinstance(cities, np.ndarray):
+            cities = cities.tolist()
+        self.cities = cities
+        # city_idsを指定した場合は、その都市だけを登録する
+        if city_ids is None:
+            city_ids = range(len(cities))
+        N = len(city_ids)
+        self.num_of_cities = N
+        self.x_min = min((cities[i][0] for i in city_ids), default=0.0)
+        self.y_min = min((cities[i][1] for i in city_ids), default=0.0)
+        x_max = max((cities[i][0] for i in city_ids), default=0.0)
+        y_max = max((cities[i][1] for i in city_ids), default=0.0)
+        width = max(x_max - self.x_min, 1e-9)
+        height = max(y_max - self.y_min, 1e-9)
+
+        # 縦横の比が極端な入力(一直線に並んだ都市など)でもセルの数がO(N)になるように、
+        # セルの辺は長い方の辺をnum_of_cells等分した長さより小さくしない
+        num_of_cells = max(1, N // cities_per_cell)
+        self.cell_size = max(
+            math.sqrt(width * height / num_of_cells),
+            max(width, height) / num_of_cells,
+            1e-9,
+        )
+        self.cols = int(width / self.cell_size) + 1
+        self.rows = int(height / self.cell_size) + 1
+
+        # cells[cell_id]: そのセルに属する都市のidのリスト
+        self.cells: list[list[int]] = [[] for _ in range(self.cols * self.rows)]
+        for city_id in city_ids:
+            cx, cy = self.cell_of(*cities[city_id])
+            self.cells[cy * self.cols + cx].append(city_id)
+
+    def cell_of(self, x: float, y: float) -> tuple[int, int]:
+        """座標(x, y)を含むセルの列番号と行番号を返す(範囲外の点は端のセルに丸める)"""
+        cx = int((x - self.x_min) / self.cell_size)
+        cy = int((y - self.y_min) / self.cell_size)
+        return min(max(cx, 0), self.cols - 1), min(max(cy, 0), self.rows - 1)
+
+    def ring_cells(self, cx: int, cy: int, ring: int):
+        """セル(cx, cy)からチェビシェフ距離がちょうどringのセルを列挙する"""
+        if ring == 0:
+            yield cy * self.cols + cx
+            return
+        x_lo, x_hi = max(cx - ring, 0), min(cx + ring, self.cols - 1)
+        # 上下の辺
+        for y in (cy - ring, cy + ring):
+            if 0 <= y < self.rows:
+                for x in range(x_lo, x_hi + 1):
+                    yield y * self.cols + x
+        # 左右の辺(角は上下の辺で列挙済み)
+        for x in (cx - ring, cx + ring):
+            if 0 <= x < self.cols:
+                for y in range(
+                    max(cy - ring + 1, 0), min(cy + ring - 1, self.rows - 1) + 1
+                ):
+                    yield y * self.cols + x
+
+    def k_nearest(self, city_id: int, k: int) -> list[int]:
+        """
+        都市city_idに近い順にk個の都市のidを返す(city_id自身は含まない)
+
+        Args:
+            city_id (int): 基準とする都市のid
+            k (int): 求める近傍の数
+
+        Returns:
+            list[int]: 近い順に並べた都市のid
+        """
+        cities = self.cities
+        x, y = cities[city_id]
+        cx, cy = self.cell_of(x, y)
+        max_ring = max(self.cols, self.rows)
+
+        # 距離の2乗の符号を反転して最大ヒープとして使う
+        heap: list[tuple[float, int]] = []
+        ring = 0
+        while ring <= max_ring:
+            for cell_id in self.ring_cells(cx, cy, ring):
+                for other in self.cells[cell_id]:
+                    if other == city_id:
+                        continue
+                    dx = cities[other][0] - x
+                    dy = cities[other][1] - y
+                    d2 = dx * dx + dy * dy
+                    if len(heap) < k:
+                        heapq.heappush(heap, (-d2, other))
+                    elif d2 < -heap[0][0]:
+                        heapq.heapreplace(heap, (-d2, other))
+            # ring番目までのセルを見れば, 距離ring*cell_size以内の都市はすべて見つかっている
+            reach = ring * self.cell_size
+            if len(heap) >= k and -heap[0][0] <= reach * reach:
+                break
+            ring += 1
+        return [other for _, other in sorted(heap, reverse=True)]
+
+    def remove(self, city_id: int) -> None:
+        """都市city_idをインデックスから取り除く"""
+        cx, cy = self.cell_of(*self.cities[city_id])
+        self.cells[cy * self.cols + cx].remove(city_id)
+        self.num_of_cities -= 1
+
+    def nearest(self, city_id: int) -> int:
+        """
+        インデックスに残っている都市のうち、都市city_idに最も近いものを返す
+
+        Args:
+            city_id (int): 基準とする都市のid(インデックスに残っていなくてもよい)
+
+        Returns:
+            int: 最も近い都市のid. 残っている都市がなければ-1
+        """
+        cities = self.cities
+        x, y = cities[city_id]
+        cx, cy = self.cell_of(x, y)
+        max_ring = max(self.cols, self.rows)
+        nearest_city, min_d2 = -1, math.inf
+        if self.num_of_cities <= 0:
+            return nearest_city
+        ring = 0
+        while ring <= max_ring:
+            for cell_id in self.ring_cells(cx, cy, ring):
+                for other in self.cells[cell_id]:
+                    if other == city_id:
+                        continue
+                    dx = cities[other][0] - x
+                    dy = cities[other][1] - y
+                    d2 = dx * dx + dy * dy
+                    if d2 < min_d2:
+                        nearest_city, min_d2 = other, d2
+            # ring番目までのセルを見れば, 距離ring*cell_size以内の都市はすべて見つかっている
+            reach = ring * self.cell_size
+            if min_d2 <= reach * reach:
+                break
+            ring += 1
+        return nearest_city
+
+
+def build_neighbor_lists(cities: list[list[float]], k: int = 10) -> list[list[int]]:
+    """
+    すべての都市について近傍k都市のリストを求める
+
+    N×Nの距離行列を作らずに, グリッドを使ってO(N log N)程度で求める.
+
+    Args:
+        cities (list[list[float]]): 都市のxy座標
+        k (int): 1都市あたりの近傍の数
+
+    Returns:
+        list[list[int]]: neighbors[i]は都市iに近い順に並べた都市のid
+    """
+    k = min(k, len(cities) - 1)
+    if k <= 0:
+        return [[] for _ in cities]
+    grid = GridIndex(cities)
+    return [grid.k_nearest(city_id, k) for city_id in range(len(cities))]
@@ -0,0 +1,21 @@
+import os
+import random
+import sys
+
+import pytest
+
+# テストからリポジトリ直下のモジュールをimportできるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def random_cities():
+    """random_cities(都市数, seed)で、一様な乱数で作った都市の座標を返す関数"""
+
+    def make(num_of_cities, seed=0):
+        rng = random.Random(seed)
+        return [
+            [rng.random() * 1000, rng.random() * 1000] for _ in range(num_of_cities)
+        ]
+
+    return make
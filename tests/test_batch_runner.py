@@ -0,0 +1,56 @@
+import os
+import shutil
+
+from batch_runner import STAMP_SUFFIX, run_batch
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def copy_inputs(tmp_path, indices=(0, 1)):
+    input_files = []
+    for i in indices:
+        input_file = str(tmp_path / f"input_{i}.csv")
+        shutil.copy(os.path.join(REPO_DIR, f"input_{i}.csv"), input_file)
+        input_files.append(input_file)
+    return input_files
+
+
+def statuses(results):
+    return [result["status"] for result in results]
+
+
+def test_rerun_with_same_solver_is_up_to_date(tmp_path):
+    input_files = copy_inputs(tmp_path)
+    assert statuses(run_batch(input_files, "greedy", num_of_workers=1)) == [
+        "done",
+        "done",
+    ]
+    assert os.path.exists(str(tmp_path / "output_0.csv") + STAMP_SUFFIX)
+    assert statuses(run_batch(input_files, "greedy", num_of_workers=1)) == [
+        "up to date",
+        "up to date",
+    ]
+
+
+def test_other_solver_or_parameters_are_stale(tmp_path):
+    input_files = copy_inputs(tmp_path)
+    run_batch(input_files, "greedy", num_of_workers=1)
+    assert statuses(run_batch(input_files, "hilbert", num_of_workers=1)) == [
+        "done",
+        "done",
+    ]
+    assert statuses(
+        run_batch(input_files, "hilbert", time_limit=1.0, num_of_workers=1)
+    ) == ["done", "done"]
+
+
+def test_output_written_by_other_script_is_stale(tmp_path):
+    input_files = copy_inputs(tmp_path)
+    run_batch(input_files, "greedy", num_of_workers=1)
+    # 他のスクリプトが同じ出力ファイルに書いた場合
+    with open(tmp_path / "output_0.csv", "w") as f:
+        f.write("index\n" + "\n".join(map(str, range(5))) + "\n")
+    assert statuses(run_batch(input_files, "greedy", num_of_workers=1)) == [
+        "done",
+        "up to date",
+    ]
@@ -0,0 +1,38 @@
+import os
+import shutil
+
+import numpy as np
+
+from common import read_input
+from instance_cache import cache_path, load_coords, load_neighbors
+from solver_anytime import solve
+from spatial_index import build_neighbor_lists
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def copy_input(tmp_path, index=5):
+    input_file = str(tmp_path / f"input_{index}.csv")
+    shutil.copy(os.path.join(REPO_DIR, f"input_{index}.csv"), input_file)
+    return input_file
+
+
+def test_load_neighbors_is_cached(tmp_path):
+    input_file = copy_input(tmp_path)
+    cache_dir = str(tmp_path / "cache")
+    neighbors = load_neighbors(input_file, 10, cache_dir=cache_dir)
+    expected = build_neighbor_lists(read_input(input_file), 10)
+    np.testing.assert_array_equal(neighbors, expected)
+    assert os.path.exists(cache_path(input_file, "neighbors_10", cache_dir))
+    # 2回目はキャッシュをメモリマップする
+    assert isinstance(load_neighbors(input_file, 10, cache_dir=cache_dir), np.memmap)
+
+
+def test_solve_with_cached_neighbors(tmp_path):
+    input_file = copy_input(tmp_path)
+    cache_dir = str(tmp_path / "cache")
+    coords = load_coords(input_file, cache_dir=cache_dir)
+    neighbors = load_neighbors(input_file, 10, cache_dir=cache_dir)
+    cities = read_input(input_file)
+    for solver in ("greedy_edge", "local_search"):
+        assert solve(coords, solver, neighbors=neighbors) == solve(cities, solver)
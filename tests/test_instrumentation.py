@@ -0,0 +1,68 @@
+import pytest
+
+import instrumentation
+import solver_ga
+import solver_segmented_area
+import update_solver_greedy_with_2opt
+
+
+def phases(recorder):
+    return {entry["phase"]: entry for entry in recorder.to_dict()["phases"]}
+
+
+def test_segmented_records_regions_solved_in_workers(random_cities):
+    cities = random_cities(400)
+    records = {}
+    for num_of_workers in (1, 2):
+        with instrumentation.recording() as recorder:
+            solver_segmented_area.solve(
+                cities, max_cities_per_region=100, num_of_workers=num_of_workers
+            )
+        records[num_of_workers] = recorder
+    one, two = records[1].to_dict(), records[2].to_dict()
+    assert phases(records[2])["regions/region"]["calls"] == 4
+    assert set(phases(records[1])) == set(phases(records[2]))
+    assert one["counters"] == two["counters"]
+    assert two["counters"]["two_opt.evaluated"] > 0
+
+
+def test_multi_start_records_starts_run_in_workers(random_cities):
+    cities = random_cities(100)
+    counters = {}
+    for num_of_workers in (1, 2):
+        with instrumentation.recording() as recorder:
+            update_solver_greedy_with_2opt.multi_start(
+                cities, max_starts=4, num_of_workers=num_of_workers
+            )
+        counters[num_of_workers] = recorder.to_dict()["counters"]
+    assert counters[1] == counters[2]
+    assert counters[2]["two_opt.evaluated"] > 0
+
+
+def test_ga_records_offspring_made_in_workers(random_cities):
+    cities = random_cities(100)
+    with instrumentation.recording() as recorder:
+        solver_ga.solve(cities, time_limit=2.0, population_size=6, num_of_workers=2)
+    recorded = phases(recorder)
+    assert "initial_population/two_opt" in recorded
+    assert recorder.to_dict()["counters"]["two_opt.evaluated"] > 0
+
+
+def test_call_recorded_without_recording_returns_no_state():
+    assert instrumentation.call_recorded(False, max, 1, 2) == (2, None)
+    assert instrumentation.collect((2, None)) == 2
+
+
+@pytest.mark.parametrize("prefix", [(), ("outer",)])
+def test_merge_adds_worker_phases_under_current_phase(prefix):
+    with instrumentation.recording() as worker:
+        with instrumentation.phase("inner"):
+            instrumentation.count("moves", 3)
+    with instrumentation.recording() as parent:
+        if prefix:
+            with instrumentation.phase("outer"):
+                parent.merge(worker.worker_state())
+        else:
+            parent.merge(worker.worker_state())
+    assert "/".join(prefix + ("inner",)) in phases(parent)
+    assert parent.counters == {"moves": 3}
@@ -0,0 +1,27 @@
+import os
+import shutil
+
+from output_verifier import challenge_pairs, is_ok, verify_pairs
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_missing_outputs_are_skipped_only_by_default(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    shutil.copy(os.path.join(REPO_DIR, "input_0.csv"), "input_0.csv")
+    with open("output_0.csv", "w") as f:
+        f.write("index\n" + "\n".join(map(str, range(5))) + "\n")
+    results = verify_pairs(challenge_pairs(1, ("output", "sample/sa")), 1)
+    assert [result["valid"] for result in results] == [True, False]
+    assert is_ok(results, skip_missing=True)
+    assert not is_ok(results)
+
+
+def test_invalid_output_fails_even_when_skipping_missing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    shutil.copy(os.path.join(REPO_DIR, "input_0.csv"), "input_0.csv")
+    with open("output_0.csv", "w") as f:
+        f.write("index\n0\n1\n1\n2\n3\n")
+    results = verify_pairs([("input_0.csv", "output_0.csv")], 1)
+    assert results[0]["error"] == "duplicate city"
+    assert not is_ok(results, skip_missing=True)
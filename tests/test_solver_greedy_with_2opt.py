@@ -0,0 +1,63 @@
+import random
+
+import numpy as np
+
+from solver_greedy_with_2opt import (
+    crossing_edges,
+    segments_cross,
+    solver_greedy,
+    uncross,
+)
+
+
+def brute_force_crossing_edges(cities, tour):
+    coords = np.asarray(cities)
+    order = np.asarray(tour)
+    start, end = coords[order], coords[np.roll(order, -1)]
+    i, j = np.triu_indices(len(tour), 1)
+    is_cross = segments_cross(start[i], end[i], start[j], end[j])
+    return np.stack([i[is_cross], j[is_cross]], axis=1)
+
+
+def test_crossing_edges_on_random_permutation_tour(random_cities):
+    cities = random_cities(600)
+    tour = list(range(len(cities)))
+    random.Random(1).shuffle(tour)
+    expected = brute_force_crossing_edges(cities, tour)
+    assert len(expected) > 0
+    np.testing.assert_array_equal(crossing_edges(cities, tour), expected)
+
+
+def test_crossing_edges_on_greedy_tour(random_cities):
+    cities = random_cities(600, seed=2)
+    tour = solver_greedy(cities)
+    np.testing.assert_array_equal(
+        crossing_edges(cities, tour), brute_force_crossing_edges(cities, tour)
+    )
+
+
+def test_uncross_random_permutation_tour(random_cities):
+    cities = random_cities(300, seed=3)
+    tour = list(range(len(cities)))
+    random.Random(4).shuffle(tour)
+    tour = uncross(cities, tour)
+    assert sorted(tour) == list(range(len(cities)))
+    assert len(crossing_edges(cities, tour)) == 0
+
+
+def test_crossing_edges_on_thin_strip_tour():
+    # 細長い入力でもセルの数が都市数程度に収まり、全ての交差が見つかる
+    rng = random.Random(5)
+    cities = [[rng.random() * 1000, rng.random() * 1e-3] for _ in range(2000)]
+    tour = list(range(len(cities)))
+    rng.shuffle(tour)
+    np.testing.assert_array_equal(
+        crossing_edges(cities, tour), brute_force_crossing_edges(cities, tour)
+    )
+
+
+def test_crossing_edges_on_collinear_tour():
+    cities = [[float(i), 0.0] for i in range(5000)]
+    tour = list(range(len(cities)))
+    random.Random(6).shuffle(tour)
+    assert len(crossing_edges(cities, tour)) == 0
@@ -0,0 +1,15 @@
+from distance_oracle import make_distance
+from solver_greedy_edge import solve as greedy_edge_tour
+from solver_sa import simulated_annealing
+
+
+def test_same_seed_reproduces_result_with_max_iterations(random_cities):
+    cities = random_cities(500)
+    dist = make_distance(cities)
+    tour = greedy_edge_tour(cities)
+    results = [
+        simulated_annealing(tour, dist, max_iterations=3000, seed=3) for _ in range(3)
+    ]
+    assert results[0] == results[1] == results[2]
+    assert sorted(results[0]) == list(range(len(cities)))
+    assert dist.tour_length(results[0]) <= dist.tour_length(tour) + 1e-6
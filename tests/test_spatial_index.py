@@ -0,0 +1,52 @@
+import math
+import random
+
+import pytest
+
+from spatial_index import GridIndex, build_neighbor_lists
+
+
+def brute_force_neighbors(cities, k):
+    return [
+        sorted(
+            (j for j in range(len(cities)) if j != i),
+            key=lambda j: (math.dist(cities[i], cities[j]), j),
+        )[:k]
+        for i in range(len(cities))
+    ]
+
+
+def test_k_nearest_matches_brute_force():
+    rng = random.Random(0)
+    cities = [[rng.random() * 100, rng.random() * 100] for _ in range(300)]
+    neighbors = build_neighbor_lists(cities, 5)
+    expected = brute_force_neighbors(cities, 5)
+    for i in range(len(cities)):
+        # 距離が同じ都市の順番は問わない
+        assert [math.dist(cities[i], cities[j]) for j in neighbors[i]] == pytest.approx(
+            [math.dist(cities[i], cities[j]) for j in expected[i]]
+        )
+
+
+@pytest.mark.parametrize(
+    "cities",
+    [
+        [[5.0, float(i)] for i in range(3000)],
+        [[float(i), 5.0] for i in range(3000)],
+        [[float(i), 1e-7 * (i % 3)] for i in range(3000)],
+        [[1.0, 1.0]] * 100,
+    ],
+    ids=["vertical", "horizontal", "thin_strip", "same_point"],
+)
+def test_degenerate_inputs_use_linear_number_of_cells(cities):
+    grid = GridIndex(cities)
+    assert grid.cols * grid.rows <= 4 * len(cities)
+    neighbors = build_neighbor_lists(cities, 4)
+    assert all(len(neighbor) == 4 for neighbor in neighbors)
+
+
+def test_collinear_neighbors_are_adjacent_cities():
+    cities = [[5.0, float(i)] for i in range(1000)]
+    neighbors = build_neighbor_lists(cities, 2)
+    assert sorted(neighbors[500]) == [499, 501]
+    assert neighbors[0] == [1, 2]
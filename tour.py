@@ -0,0 +1,329 @@
+import math
+from array import array
+
+# 都市数がこれ以上なら二層リストを使う
+TWO_LEVEL_LIMIT = 2000
+
+
+class ArrayTour:
+    """
+    巡回路を都市の並び(order)と各都市の位置(pos)の配列で表す
+
+    next/prev/betweenはO(1). reverseは短い方の区間を反転するのでO(N)
+    """
+
+    __slots__ = ("order", "pos")
+
+    def __init__(self, tour: list[int], num_of_cities: int):
+        self.order = array("l", tour)
+        self.pos = array("l", [-1]) * num_of_cities
+        for i, city in enumerate(tour):
+            self.pos[city] = i
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def __contains__(self, city: int) -> bool:
+        return self.pos[city] >= 0
+
+    def next(self, city: int) -> int:
+        i = self.pos[city] + 1
+        return self.order[i] if i < len(self.order) else self.order[0]
+
+    def prev(self, city: int) -> int:
+        return self.order[self.pos[city] - 1]
+
+    def between(self, a: int, b: int, c: int) -> bool:
+        """aからnextをたどってcまで行く間にbがあればTrue(両端を含む)"""
+        n = len(self.order)
+        pos_a = self.pos[a]
+        return (self.pos[b] - pos_a) % n <= (self.pos[c] - pos_a) % n
+
+    def sequence(self, a: int, b: int) -> list[int]:
+        """aからnextをたどってbまでの都市のリスト"""
+        i, j = self.pos[a], self.pos[b]
+        if i <= j:
+            return self.order[i : j + 1].tolist()
+        return self.order[i:].tolist() + self.order[: j + 1].tolist()
+
+    def reverse(self, a: int, b: int) -> None:
+        """
+        aからnextをたどってbまでの区間を反転する
+
+        区間が巡回路の半分より長い場合は残りの区間を反転する.
+        巡回路としては同じだが、next/prevの向きが全体で入れ替わる.
+        """
+        order, pos = self.order, self.pos
+        n = len(order)
+        i, j = pos[a], pos[b]
+        length = (j - i) % n + 1
+        if length * 2 > n:
+            i, j = (j + 1) % n, (i - 1) % n
+            length = n - length
+        for _ in range(length // 2):
+            city_i, city_j = order[i], order[j]
+            order[i], pos[city_j] = city_j, i
+            order[j], pos[city_i] = city_i, j
+            i = i + 1 if i + 1 < n else 0
+            j = j - 1 if j > 0 else n - 1
+
+    def to_list(self) -> list[int]:
+        return self.order.tolist()
+
+
+class TwoLevelListTour:
+    """
+    巡回路を約√N都市ずつの区間(segment)に分け、区間の双方向連結リストで表す
+
+    各区間は都市のリストと反転フラグを持つ. 長い区間の反転は、端の区間を分割したうえで
+    区間の並びを入れ替えて反転フラグを切り替えるだけなので、reverseはO(√N)になる.
+    """
+
+    __slots__ = (
+        "parent",
+        "index",
+        "segments",
+        "is_reversed",
+        "seg_next",
+        "seg_prev",
+        "seg_start",
+        "head",
+        "size",
+        "num_of_segments",
+        "max_segments",
+    )
+
+    def __init__(self, tour: list[int], num_of_cities: int, segment_size: int = 0):
+        # parent[city]: cityが属する区間, index[city]: 区間のリストの中でのcityの位置
+        self.parent = array("l", [-1]) * num_of_cities
+        self.index = array("l", [-1]) * num_of_cities
+        self.size = segment_size or max(8, int(math.sqrt(len(tour))))
+        self._build(list(tour))
+
+    def _build(self, tour: list[int]) -> None:
+        size = self.size
+        self.segments = []
+        for start in range(0, len(tour), size):
+            cities = tour[start : start + size]
+            for i, city in enumerate(cities):
+                self.parent[city] = len(self.segments)
+                self.index[city] = i
+            self.segments.append(cities)
+        m = len(self.segments)
+        self.is_reversed = [False] * m
+        self.seg_next = [(s + 1) % m for s in range(m)]
+        self.seg_prev = [(s - 1) % m for s in range(m)]
+        self.seg_start = [s * size for s in range(m)]
+        self.head = 0
+        self.num_of_segments = m
+        # 分割で区間が増えすぎたら作り直す
+        self.max_segments = 4 * m + 8
+
+    def __len__(self) -> int:
+        return self.seg_start[self.seg_prev[self.head]] + len(
+            self.segments[self.seg_prev[self.head]]
+        )
+
+    def __contains__(self, city: int) -> bool:
+        return self.parent[city] >= 0
+
+    def _first(self, s: int) -> int:
+        return self.segments[s][-1] if self.is_reversed[s] else self.segments[s][0]
+
+    def _last(self, s: int) -> int:
+        return self.segments[s][0] if self.is_reversed[s] else self.segments[s][-1]
+
+    def _offset(self, city: int) -> int:
+        # 区間の先頭から数えたcityの位置
+        s = self.parent[city]
+        if self.is_reversed[s]:
+            return len(self.segments[s]) - 1 - self.index[city]
+        return self.index[city]
+
+    def _oriented(self, s: int) -> list[int]:
+        return self.segments[s][::-1] if self.is_reversed[s] else self.segments[s]
+
+    def next(self, city: int) -> int:
+        s = self.parent[city]
+        i = self.index[city]
+        cities = self.segments[s]
+        if self.is_reversed[s]:
+            if i > 0:
+                return cities[i - 1]
+        elif i + 1 < len(cities):
+            return cities[i + 1]
+        return self._first(self.seg_next[s])
+
+    def prev(self, city: int) -> int:
+        s = self.parent[city]
+        i = self.index[city]
+        cities = self.segments[s]
+        if self.is_reversed[s]:
+            if i + 1 < len(cities):
+                return cities[i + 1]
+        elif i > 0:
+            return cities[i - 1]
+        return self._last(self.seg_prev[s])
+
+    def _position(self, city: int) -> int:
+        # 先頭の区間の先頭の都市から数えたcityの位置
+        return self.seg_start[self.parent[city]] + self._offset(city)
+
+    def between(self, a: int, b: int, c: int) -> bool:
+        """aからnextをたどってcまで行く間にbがあればTrue(両端を含む)"""
+        pos_a, pos_b, pos_c = self._position(a), self._position(b), self._position(c)
+        if pos_a <= pos_c:
+            return pos_a <= pos_b <= pos_c
+        return pos_a <= pos_b or pos_b <= pos_c
+
+    def sequence(self, a: int, b: int) -> list[int]:
+        """aからnextをたどってbまでの都市のリスト"""
+        cities = [a]
+        while cities[-1] != b:
+            cities.append(self.next(cities[-1]))
+        return cities
+
+    def _renumber(self) -> None:
+        s = self.head
+        start = 0
+        for _ in range(self.num_of_segments):
+            self.seg_start[s] = start
+            start += len(self.segments[s])
+            s = self.seg_next[s]
+
+    def _reindex(self, s: int) -> None:
+        for i, city in enumerate(self.segments[s]):
+            self.parent[city] = s
+            self.index[city] = i
+
+    def _split_before(self, city: int) -> None:
+        # cityが区間の先頭になるように、cityより前の都市を新しい区間に移す
+        s = self.parent[city]
+        offset = self._offset(city)
+        if offset == 0:
+            return
+        cities = self.segments[s]
+        i = self.index[city]
+        if self.is_reversed[s]:
+            before, self.segments[s] = cities[i + 1 :], cities[: i + 1]
+        else:
+            before, self.segments[s] = cities[:i], cities[i:]
+            self._reindex(s)
+        t = len(self.segments)
+        self.segments.append(before)
+        self.is_reversed.append(self.is_reversed[s])
+        self.seg_start.append(0)
+        self._reindex(t)
+        # 区間tをsの直前に入れる
+        prev_s = self.seg_prev[s]
+        self.seg_next.append(s)
+        self.seg_prev.append(prev_s)
+        self.seg_next[prev_s] = t
+        self.seg_prev[s] = t
+        self.num_of_segments += 1
+
+    def _split_after(self, city: int) -> None:
+        # cityが区間の末尾になるようにする
+        if self._offset(city) + 1 < len(self.segments[self.parent[city]]):
+            self._split_before(self.next(city))
+
+    def _merge(self, s: int) -> None:
+        # 区間sと次の区間が両方とも小さければ1つにまとめる
+        t = self.seg_next[s]
+        if s == t or len(self.segments[s]) + len(self.segments[t]) > self.size:
+            return
+        self.segments[s] = self._oriented(s) + self._oriented(t)
+        self.is_reversed[s] = False
+        self._reindex(s)
+        self.segments[t] = None
+        self.seg_next[s] = self.seg_next[t]
+        self.seg_prev[self.seg_next[t]] = s
+        if self.head == t:
+            self.head = s
+        self.num_of_segments -= 1
+
+    def _swap_cities(self, path: list[int]) -> None:
+        # pathの都市が入っている場所に、逆順で都市を入れ直す
+        slots = [(self.parent[city], self.index[city]) for city in path]
+        for city, (s, i) in zip(reversed(path), slots):
+            self.segments[s][i] = city
+            self.parent[city] = s
+            self.index[city] = i
+
+    def reverse(self, a: int, b: int) -> None:
+        """aからnextをたどってbまでの区間を反転する"""
+        if a == b:
+            return
+        s_a, s_b = self.parent[a], self.parent[b]
+        if s_a == s_b and self._offset(a) <= self._offset(b):
+            # 同じ区間の中だけを反転する
+            i, j = sorted((self.index[a], self.index[b]))
+            cities = self.segments[s_a]
+            cities[i : j + 1] = cities[i : j + 1][::-1]
+            for k in range(i, j + 1):
+                self.index[cities[k]] = k
+            return
+
+        # 反転する区間かその残りが短ければ、都市を1つずつ入れ替える
+        n = len(self)
+        length = (self._position(b) - self._position(a)) % n + 1
+        if length <= self.size:
+            self._swap_cities(self.sequence(a, b))
+            return
+        if n - length <= self.size:
+            if n - length > 1:
+                self._swap_cities(self.sequence(self.next(b), self.prev(a)))
+            return
+
+        self._split_before(a)
+        self._split_after(b)
+        run = [self.parent[a]]
+        while run[-1] != self.parent[b]:
+            run.append(self.seg_next[run[-1]])
+        for s in run:
+            self.is_reversed[s] = not self.is_reversed[s]
+        if self.seg_next[run[-1]] == run[0]:
+            # 巡回路全体を反転する場合は向きを入れ替えるだけ
+            for s in run:
+                self.seg_next[s], self.seg_prev[s] = self.seg_prev[s], self.seg_next[s]
+        else:
+            before, after = self.seg_prev[run[0]], self.seg_next[run[-1]]
+            run.reverse()
+            for s, t in zip([before] + run, run + [after]):
+                self.seg_next[s] = t
+                self.seg_prev[t] = s
+            self._merge(before)
+            if self.segments[run[-1]] is not None:
+                self._merge(run[-1])
+
+        if self.num_of_segments > self.max_segments:
+            self._build(self.to_list())
+        else:
+            self._renumber()
+
+    def to_list(self) -> list[int]:
+        tour = []
+        s = self.head
+        for _ in range(self.num_of_segments):
+            tour += self._oriented(s)
+            s = self.seg_next[s]
+        return tour
+
+
+def make_tour(tour: list[int], num_of_cities: int):
+    """都市数に応じて巡回路の表し方を選ぶ"""
+    if len(tour) >= TWO_LEVEL_LIMIT:
+        return TwoLevelListTour(tour, num_of_cities)
+    return ArrayTour(tour, num_of_cities)
+
+
+def two_opt_move(tour, t1: int, t2: int, t3: int, t4: int) -> None:
+    """
+    辺(t1, t2), (t3, t4)を辺(t1, t3), (t2, t4)につなぎ替える
+
+    t2とt4はそれぞれt1とt3の同じ側(どちらもnext、またはどちらもprev)にあるとする.
+    """
+    if tour.next(t1) == t2:
+        tour.reverse(t2, t3)
+    else:
+        tour.reverse(t1, t4)
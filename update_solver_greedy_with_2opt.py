@@ -1,113 +1,210 @@
 #!/usr/bin/env python3
 
 import math
+import os
 import time
-from common import print_tour, read_input
+from multiprocessing import Pool, shared_memory
+import numpy as np
+import instrumentation
+from anytime import Budget
+from common import read_input
+from distance_oracle import DenseDistance, LazyDistance, make_distance, tour_length
+from local_search import NUM_OF_NEIGHBORS, two_opt
+from solver_greedy import nearest_neighbor_tour
 import sys
 
-sys.setrecursionlimit(10**6)  # スタックフローを防ぐ
-
-
-def distance(city_1, city_2):
-    return math.sqrt((city_1[0] - city_2[0]) ** 2 + (city_1[1] - city_2[1]) ** 2)
-
 
 def cal_dist(cities):
-    N = len(cities)
-    dist = [[0] * N for i in range(N)]
-    for i in range(N):
-        for j in range(i, N):
-            dist[i][j] = dist[j][i] = distance(cities[i], cities[j])
-    return dist
+    return make_distance(cities)
 
 
 # 始点を変える
 def solver_greedy(num_of_cities, dist, start_city=0):
-    current_city = start_city
-    unvisited_cities = set(range(0, num_of_cities))
-    unvisited_cities.remove(start_city)
-    tour = [current_city]
-
-    while unvisited_cities:
-        next_city = min(unvisited_cities, key=lambda city: dist[current_city][city])
-        unvisited_cities.remove(next_city)
-        tour.append(next_city)
-        current_city = next_city
-    return tour
-
-
-# 2opt
-def normal_two_opt(tour, dist: list[list]):
-    is_updated = True
-    while is_updated:
-        is_updated = False
-        for i in range(len(tour) - 3):
-            for j in range(i + 2, len(tour) - 1):
-                # city1とcity3を,city2とcity4をつなぐ
-                diff = (dist[tour[i]][tour[j]] + dist[tour[i + 1]][tour[j + 1]]) - (
-                    dist[tour[i]][tour[i + 1]] + dist[tour[j]][tour[j + 1]]
-                )
-                if diff < 0:
-                    new_tour = (
-                        tour[: i + 1]
-                        + [city for city in reversed(tour[i + 1 : j + 1])]
-                        + tour[j + 1 :]
-                    )
-                    tour = new_tour
-                    is_updated = True
-
-    return tour
-
-
-def solve(cities):
+    return nearest_neighbor_tour(dist.coords.tolist(), start_city)
+
+
+# 並列に始点を試す時に、1つのタスクでまとめて渡す始点の数
+CHUNK_SIZE = 4
+
+# ワーカープロセスごとの距離(共有メモリ上の配列を参照する)
+_worker_dist = None
+_worker_memories = []
+
+
+def _share_array(array):
+    """配列を共有メモリにコピーし、ワーカーで開くための情報を返す"""
+    memory = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, array.dtype, buffer=memory.buf)[...] = array
+    return memory, (memory.name, array.shape, array.dtype.str)
+
+
+def _attach_array(spec):
+    name, shape, dtype = spec
+    memory = shared_memory.SharedMemory(name=name)
+    # 配列を使っている間は共有メモリを閉じないように参照を残す
+    _worker_memories.append(memory)
+    return np.ndarray(shape, dtype, buffer=memory.buf)
+
+
+def _init_worker(coords_spec, matrix_spec, neighbors_spec):
+    global _worker_dist
+    coords = _attach_array(coords_spec)
+    if matrix_spec is None:
+        _worker_dist = LazyDistance(coords)
+    else:
+        _worker_dist = DenseDistance(coords, matrix=_attach_array(matrix_spec))
+    _worker_dist.set_neighbor_lists(_attach_array(neighbors_spec), NUM_OF_NEIGHBORS)
+
+
+def run_start(dist, start_city, deadline=None):
+    """
+    start_cityから貪欲法で作った巡回路を2optで改善する
+
+    deadline(time.time()の値)を過ぎたら、2optはその時点の巡回路を返す.
+    プロセスをまたいで比べられるように絶対時刻で受け取る.
+    """
+    budget = None
+    if deadline is not None:
+        budget = Budget(max(deadline - time.time(), 0.0))
+    with instrumentation.phase("construction"):
+        tour = solver_greedy(len(dist), dist, start_city)
+    tour = two_opt(tour, dist, budget=budget)
+    return dist.tour_length(tour), start_city, tour
+
+
+def _run_start_in_worker(task):
+    is_recording, start_city, deadline = task
+    # 締め切りを過ぎてから受け取った始点は試さない
+    if deadline is not None and time.time() >= deadline:
+        return None, None
+    return instrumentation.call_recorded(
+        is_recording, run_start, _worker_dist, start_city, deadline
+    )
+
+
+def multi_start(
+    cities,
+    max_starts=None,
+    num_of_workers=None,
+    time_limit=None,
+    target_length=None,
+    budget=None,
+    neighbors=None,
+):
+    """
+    始点を変えて貪欲法+2optを繰り返し、最も短い巡回路を求める
+
+    始点はプロセスプールで並列に試す. 座標と距離行列は共有メモリに置き、
+    ワーカーは読み取り専用で参照するので、タスクごとに送るのは始点の番号だけになる.
+
+    Args:
+        cities: 都市のxy座標
+        max_starts (int): 試す始点の最大の数. Noneなら全ての都市を試す
+        num_of_workers (int): ワーカーの数. Noneならコア数. 1なら並列化しない
+        time_limit (float): 秒数. これを超えたら残りの始点を打ち切る
+        target_length (float): これ以下の巡回路が見つかったら打ち切る
+        budget (Budget): 予算. 指定した場合はtime_limitの代わりに使う.
+            始点1つを1回の反復として数え、最も短い長さが更新されるとbudget.reportで知らせる
+        neighbors: 近い順に並べた近傍NUM_OF_NEIGHBORS都市の配列(N×k). 指定すると作り直さない
+
+    Returns:
+        tuple[list[int], int]: 最も短い巡回路と、その始点
+    """
     dist = cal_dist(cities)
-    num_of_cities = len(cities)
-    min_tour_length = 10**6
-    best_tour = []
-    best_start = 0
-    # tour = solver_greedy(num_of_cities, dist, 70)
-    # tour = normal_two_opt(tour, dist)
-    for i in range(num_of_cities):
-        tour = solver_greedy(num_of_cities, dist, i)
-        tour = normal_two_opt(tour, dist)
-        tour_length = sum(
-            dist[tour[i]][tour[(i + 1) % len(tour)]] for i in range(len(tour))
-        )
-        if tour_length < min_tour_length:
-            min_tour_length = tour_length
-            best_tour = tour
-            best_start = i
-
-    # tour_length = sum(
-    #     dist[tour[i]][tour[(i + 1) % len(tour)]] for i in range(len(tour))
-    # )
+    if neighbors is not None:
+        dist.set_neighbor_lists(neighbors, NUM_OF_NEIGHBORS)
+    num_of_cities = len(dist)
+    if num_of_cities == 0:
+        return [], -1
+    start_cities = list(range(num_of_cities))
+    if max_starts is not None and max_starts < num_of_cities:
+        # 始点を都市の番号全体から均等に選ぶ
+        step = num_of_cities / max(max_starts, 1)
+        start_cities = [int(i * step) for i in range(max(max_starts, 1))]
+    if num_of_workers is None:
+        num_of_workers = os.cpu_count() or 1
+    num_of_workers = min(num_of_workers, len(start_cities))
+    if budget is None:
+        budget = Budget(time_limit)
+
+    min_tour_length, best_start, best_tour = math.inf, -1, []
+    # 始点1つの2optも時間の上限で打ち切るように、各始点に締め切りを渡す
+    deadline = None
+    if budget.remaining() is not None:
+        deadline = time.time() + budget.remaining()
+
+    def is_finished():
+        # 始点1つごとに時間がかかるので、時刻は毎回確認する
+        if budget.remaining() == 0 or not budget.check():
+            return True
+        return target_length is not None and min_tour_length <= target_length
+
+    if num_of_workers <= 1:
+        for start_city in start_cities:
+            length, _, tour = run_start(dist, start_city, deadline)
+            if (length, start_city) < (min_tour_length, best_start):
+                min_tour_length, best_start, best_tour = length, start_city, tour
+                budget.report(length)
+            instrumentation.count("multi_start.starts")
+            if is_finished():
+                break
+        return best_tour, best_start
+
+    coords_memory, coords_spec = _share_array(dist.coords)
+    memories = [coords_memory]
+    matrix_spec = None
+    if isinstance(dist, DenseDistance):
+        matrix_memory, matrix_spec = _share_array(dist.matrix)
+        memories.append(matrix_memory)
+    # 近傍リストは親で1回だけ求め、ワーカーごとに作り直さないようにする
+    neighbors = np.array(dist.neighbor_lists(NUM_OF_NEIGHBORS), dtype=np.int32)
+    neighbors_memory, neighbors_spec = _share_array(
+        neighbors.reshape(num_of_cities, -1)
+    )
+    memories.append(neighbors_memory)
+    pool = Pool(
+        num_of_workers, _init_worker, (coords_spec, matrix_spec, neighbors_spec)
+    )
+    # 記録中なら、ワーカーで記録した段階と回数を結果を受け取るたびに加える
+    is_recording = instrumentation.current() is not None
+    tasks = [(is_recording, start_city, deadline) for start_city in start_cities]
+    try:
+        for recorded in pool.imap_unordered(_run_start_in_worker, tasks, CHUNK_SIZE):
+            result = instrumentation.collect(recorded)
+            if result is None:
+                break
+            length, start_city, tour = result
+            # 同じ長さなら番号の小さい始点を選び、結果が実行順によらないようにする
+            if (length, start_city) < (min_tour_length, best_start):
+                min_tour_length, best_start, best_tour = length, start_city, tour
+                budget.report(length)
+            instrumentation.count("multi_start.starts")
+            if is_finished():
+                break
+    finally:
+        pool.terminate()
+        pool.join()
+        for memory in memories:
+            memory.close()
+            memory.unlink()
+    return best_tour, best_start
+
+
+def solve(cities, max_starts=None, num_of_workers=None, time_limit=None, budget=None):
+    best_tour, best_start = multi_start(
+        cities, max_starts, num_of_workers, time_limit, budget=budget
+    )
+    min_tour_length = tour_length(cities, best_tour)
+    instrumentation.sample(min_tour_length)
+
     print("min_tour_length", min_tour_length)
     print("start_city", best_start)
 
     return best_tour
 
 
-# #### ベストな始点
-best_start_cities = {
-    "input_0.csv": 3,  # 3291.6217214092458
-    "input_1.csv": 6,  # 3832.290093905199
-    "input_2.csv": 10,  # 4670.266133897527
-    "input_3.csv": 35,  # 8511.224110970263
-    "input_4.csv": 70,  # 11169.376590988231
-    "input_5.csv": 212,  # 21072.67865612365
-    "input_6.csv":
-}
 if __name__ == "__main__":
     assert len(sys.argv) > 1
     cities = read_input(sys.argv[1])
-    # start_city = best_start_cities[sys.argv[1]]
-    # min_tour_length = 10**10
-    # start_city = -1
-    # for i in range(50):
-    #     tour = solver_greedy(N, dist, start_city=i)
-    #     tour, tour_length = solve(cities, tour, dist, start_city=i)
-    #     if tour_length < min_tour_length:
-    #         start_city, min_tour_length = i, tour_length
     print(f"------------{sys.argv[1]}:")
-    tour = solve(cities)
-    # print_tour(tour)
+    solve(cities)